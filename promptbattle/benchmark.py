@@ -0,0 +1,529 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from storage import create_backend
+from game_state import create_game_state
+from evaluation import EvaluationEngine, OpenAIClient
+from fake_llm_server import start_fake_llm_server
+from scoring import score_prompt, score_prompts_batch
+from ratings import RatingBook
+from search import UserSearch
+from results_store import ResultsStore, INDEX_ENTRY
+
+def timed(label, func, repeat=1):
+    """Run func repeat times and print the mean time per call"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / repeat
+    print(f"  {label:<32} {per_call * 1000:10.3f} ms/op  ({repeat} ops, {elapsed:.2f}s total)")
+    return per_call
+
+def make_users(count):
+    return [
+        {
+            'user_id': str(i),
+            'fullname': f"Player {i}",
+            'emailid': f"player{i}@example.com",
+            'phonenumber': f"{i:010d}",
+            'is_technical': i % 2 == 0,
+            'password': f"{i:010d}"
+        }
+        for i in range(count)
+    ]
+
+def make_questions(count):
+    return [
+        {
+            'id': str(uuid.uuid4()),
+            'text': f"Write a prompt that explains topic number {i} to a beginner.",
+            'created_at': datetime.now().isoformat()
+        }
+        for i in range(count)
+    ]
+
+def make_result(i, users):
+    players = random.sample(users, 3)
+    return {
+        'session_id': str(uuid.uuid4()),
+        'question': f"Question {i % 100}",
+        'prompts': {p['user_id']: f"Prompt text from {p['fullname']} " * 5 for p in players},
+        'evaluation': f"Mock evaluation for game {i}",
+        'timestamp': datetime.now().isoformat()
+    }
+
+def bench_storage(args):
+    """Compare the JSON and SQLite storage backends on the same data set"""
+    users = make_users(args.users)
+    questions = make_questions(args.questions)
+    results = [make_result(i, users) for i in range(args.results)]
+    
+    for kind in ('json', 'sqlite'):
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = create_backend(
+                kind,
+                admin_data_file=os.path.join(tmp, 'admin_data.json'),
+                results_log_file=os.path.join(tmp, 'results.jsonl'),
+                results_index_file=os.path.join(tmp, 'results.idx'),
+                db_file=os.path.join(tmp, 'promptbattle.db')
+            )
+            print(f"{kind} backend: {args.users} users, {args.questions} questions, {args.results} results")
+            
+            timed('bulk load admin data', lambda: backend.save_admin_data(
+                {'admins': [{'email': 'admin@example.com', 'password': 'admin123'}],
+                 'users': users, 'questions': questions}))
+            timed('bulk load results', lambda: backend.save_results(results))
+            
+            timed('add question', lambda: backend.add_question(make_questions(1)[0]), repeat=100)
+            timed('get question by id', lambda: backend.get_question(random.choice(questions)['id']), repeat=1000)
+            timed('get all users', backend.get_users, repeat=20)
+            timed('append result', lambda: backend.append_result(make_result(0, users)), repeat=1000)
+            timed('read result by position',
+                  lambda: backend.get_result(random.randrange(args.results)), repeat=1000)
+            timed('load all results', backend.load_results, repeat=3)
+            backend.close()
+        print()
+
+def game_state_worker(kind, url, session_id, worker, players, updates):
+    """Hammer a shared session from one worker process"""
+    state = create_game_state(kind, url)
+    conflicts = 0
+    for i in range(updates):
+        # Every worker writes its own player and races on the shared one
+        state.set_prompt(session_id, f"w{worker}-{i % players}", f"prompt {i}")
+        while True:
+            prompt, version = state.get_prompt(session_id, 'shared')
+            if state.set_prompt(session_id, 'shared', prompt + 'x', expected_version=version):
+                break
+            conflicts += 1
+    state.close()
+    return conflicts
+
+def bench_game_state(args):
+    """Run several worker processes against one shared game state backend"""
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url or os.path.join(tmp, 'game_state.db')
+        state = create_game_state(args.backend, url)
+        session_id = str(uuid.uuid4())
+        state.create_session(session_id, {
+            'question': {'id': 'q', 'text': 'Shared question'},
+            'timer_duration': 60,
+            'selected_players': [],
+            'player_ids': [],
+            'status': 'active',
+            'is_active': True,
+            'start_time': None,
+            'deadline': None,
+            'last_activity': time.time()
+        })
+        
+        print(f"{args.backend} game state: {args.workers} workers x {args.updates} updates")
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.workers) as pool:
+            conflicts = pool.starmap(game_state_worker, [
+                (args.backend, url, session_id, worker, args.players, args.updates)
+                for worker in range(args.workers)
+            ])
+        elapsed = time.perf_counter() - start
+        
+        prompt, version = state.get_prompt(session_id, 'shared')
+        expected = args.workers * args.updates
+        writes = expected * 2
+        print(f"  {'prompt writes/sec':<32} {writes / elapsed:10.0f}  ({elapsed:.2f}s total)")
+        print(f"  {'version conflicts retried':<32} {sum(conflicts):10d}")
+        print(f"  {'shared prompt consistent':<32} {str(version == expected and len(prompt) == expected):>10}")
+        state.delete_session(session_id)
+        state.close()
+        if version != expected or len(prompt) != expected:
+            raise SystemExit(f"lost updates: expected version {expected}, got {version}")
+
+def results_log_worker(log_file, index_file, worker, appends):
+    """Append results to a shared log from one worker process"""
+    store = ResultsStore(log_file, index_file)
+    for i in range(appends):
+        store.append({'worker': worker, 'i': i, 'evaluation': 'x' * random.randrange(200)})
+    store.close()
+
+def bench_results_log(args):
+    """Append results from several processes and check the log and index agree"""
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, 'results.jsonl')
+        index_file = os.path.join(tmp, 'results.idx')
+        
+        print(f"results log: {args.workers} workers x {args.appends} appends")
+        start = time.perf_counter()
+        with multiprocessing.Pool(args.workers) as pool:
+            pool.starmap(results_log_worker, [
+                (log_file, index_file, worker, args.appends) for worker in range(args.workers)
+            ])
+        elapsed = time.perf_counter() - start
+        
+        # Every index entry must point at the start of its own line
+        with open(log_file, 'rb') as f:
+            lines = f.read().split(b'\n')[:-1]
+        starts, offset = [], 0
+        for line in lines:
+            starts.append(offset)
+            offset += len(line) + 1
+        with open(index_file, 'rb') as f:
+            offsets = [entry[0] for entry in INDEX_ENTRY.iter_unpack(f.read())]
+        
+        store = ResultsStore(log_file, index_file)
+        records = store.read_all()
+        expected = args.workers * args.appends
+        seen = {(record['worker'], record['i']) for record in records}
+        consistent = (offsets == starts and len(records) == expected and len(seen) == expected
+                      and all(store.read(i) == records[i] for i in range(0, expected, max(1, expected // 100))))
+        store.close()
+        
+        print(f"  {'appends/sec':<32} {expected / elapsed:10.0f}  ({elapsed:.2f}s total)")
+        print(f"  {'log and index consistent':<32} {str(consistent):>10}")
+        if not consistent:
+            raise SystemExit(f"inconsistent results log: {len(lines)} lines, {len(offsets)} index entries, "
+                             f"{len(seen)} of {expected} records")
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def start_server(tmp, users, args):
+    """Start flask_app.py in a scratch directory seeded with users and a question"""
+    backend = create_backend('json', admin_data_file=os.path.join(tmp, 'admin_data.json'),
+                             results_log_file=os.path.join(tmp, 'results.jsonl'),
+                             results_index_file=os.path.join(tmp, 'results.idx'))
+    question = make_questions(1)[0]
+    backend.save_admin_data({
+        'admins': [{'email': 'admin@example.com', 'password': 'admin123'}],
+        'users': users,
+        'questions': [question]
+    })
+    backend.close()
+    
+    env = dict(os.environ, SOCKETIO_ASYNC_MODE=args.mode, PORT=str(args.port),
+               PROMPT_SYNC_WINDOW_MS=str(args.window_ms))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'flask_app.py')],
+        cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return server, question
+
+async def run_socket_load(base_url, users, question, args):
+    """Connect simulated players and a monitor, then stream prompt updates"""
+    import aiohttp
+    import socketio
+    
+    async def login(http, path, email, password):
+        async with http.post(f"{base_url}{path}", json={'email': email, 'password': password}) as resp:
+            if not (await resp.json())['success']:
+                raise RuntimeError(f"login failed for {email}")
+            return f"session={resp.cookies['session'].value}"
+    
+    for _ in range(100):
+        try:
+            async with aiohttp.ClientSession() as http:
+                async with http.get(f"{base_url}/get-questions"):
+                    break
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.1)
+    
+    latencies = []
+    
+    # One request per connection keeps the login burst from tripping over
+    # keep-alive connections the server is about to close
+    connector = aiohttp.TCPConnector(force_close=True)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=60)) as http:
+        admin_cookie = await login(http, '/admin-login', 'admin@example.com', 'admin123')
+        limit = asyncio.Semaphore(100)
+        
+        async def player_login(user):
+            async with limit:
+                return await login(http, '/player-login', user['emailid'], user['password'])
+        
+        player_cookies = await asyncio.gather(*(player_login(user) for user in users))
+        
+        async with http.post(f"{base_url}/start-game", headers={'Cookie': admin_cookie}, json={
+            'question_id': question['id'],
+            'timer_duration': args.duration + 600,
+            'selected_players': [user['user_id'] for user in users]
+        }) as resp:
+            session_id = (await resp.json())['session_id']
+    
+    monitor = socketio.AsyncClient()
+    
+    @monitor.on('prompts_updated')
+    def on_prompts_updated(data):
+        received = time.time()
+        for update in data['updates']:
+            latencies.append(received - float(update['prompt'].split('|', 1)[0]))
+    
+    await monitor.connect(base_url, headers={'Cookie': admin_cookie}, transports=['websocket'])
+    await monitor.emit('join_game', {'session_id': session_id})
+    
+    clients = []
+    
+    async def connect_player(cookie):
+        async with limit:
+            client = socketio.AsyncClient(reconnection=False)
+            await client.connect(base_url, headers={'Cookie': cookie}, transports=['websocket'])
+            await client.emit('join_game', {'session_id': session_id})
+            clients.append(client)
+    
+    start = time.perf_counter()
+    results = await asyncio.gather(*(connect_player(cookie) for cookie in player_cookies),
+                                   return_exceptions=True)
+    connect_time = time.perf_counter() - start
+    failed = sum(1 for result in results if isinstance(result, Exception))
+    
+    acked = 0
+    stop_at = time.perf_counter() + args.duration
+    
+    async def stream_prompts(client):
+        nonlocal acked
+        await asyncio.sleep(random.random() / args.rate)
+        i = 0
+        while time.perf_counter() < stop_at:
+            try:
+                await client.call('update_prompt', {
+                    'session_id': session_id,
+                    'prompt': f"{time.time():.6f}|prompt text {i}"
+                }, timeout=10)
+                acked += 1
+            except socketio.exceptions.SocketIOError:
+                pass
+            i += 1
+            await asyncio.sleep(1 / args.rate)
+    
+    await asyncio.gather(*(stream_prompts(client) for client in clients))
+    sustained = sum(1 for client in clients if client.connected)
+    await asyncio.sleep(1)
+    
+    await asyncio.wait_for(asyncio.gather(*(client.disconnect() for client in clients + [monitor]),
+                                          return_exceptions=True), timeout=10)
+    
+    return {
+        'connect_time': connect_time,
+        'failed': failed,
+        'sustained': sustained,
+        'throughput': acked / args.duration,
+        'p50': percentile(latencies, 0.50),
+        'p99': percentile(latencies, 0.99)
+    }
+
+def bench_sockets(args):
+    """Measure sustained connections, throughput and prompt latency of the Flask server"""
+    print(f"{args.mode} server, {args.rate} updates/sec per client for {args.duration}s, "
+          f"{args.window_ms}ms coalescing window")
+    print(f"  {'clients':>8} {'connect s':>10} {'failed':>7} {'sustained':>10} "
+          f"{'events/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    
+    for count in args.clients:
+        users = make_users(count)
+        with tempfile.TemporaryDirectory() as tmp:
+            server, question = start_server(tmp, users, args)
+            try:
+                stats = asyncio.run(run_socket_load(f"http://127.0.0.1:{args.port}", users, question, args))
+            finally:
+                server.terminate()
+                server.wait()
+        print(f"  {count:>8} {stats['connect_time']:>10.2f} {stats['failed']:>7} {stats['sustained']:>10} "
+              f"{stats['throughput']:>10.0f} {stats['p50'] * 1000:>8.1f} {stats['p99'] * 1000:>8.1f}")
+
+def bench_evaluation(args):
+    """Evaluate one battle against the fake LLM server at several concurrency limits"""
+    server = start_fake_llm_server(latency=args.latency, jitter=args.jitter,
+                                   failure_rate=args.failure_rate, hang_rate=args.hang_rate,
+                                   hang=args.timeout * 2, token_latency=args.token_latency)
+    client = OpenAIClient('fake', api_key='fake', base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    prompts = {str(i): f"Prompt text from player {i}, explain it simply " * 3 for i in range(args.players)}
+    
+    print(f"{args.players} prompts, {args.latency}s mean latency, {args.failure_rate:.0%} failures, "
+          f"{args.hang_rate:.0%} stalls")
+    for concurrency in args.concurrency:
+        engine = EvaluationEngine(client, max_concurrency=concurrency, timeout=args.timeout,
+                                  retries=args.retries, backoff=0.1, deadline=args.deadline)
+        server.config['requests'] = 0
+        first_output = []
+        
+        def on_output(*_):
+            if not first_output:
+                first_output.append(time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        results = engine.evaluate('Explain recursion', prompts, on_result=on_output,
+                                  on_chunk=on_output if args.stream else None)
+        elapsed = time.perf_counter() - start
+        
+        scored = sum(1 for result in results if result['status'] == 'ok')
+        print(f"  concurrency {concurrency:<4} {elapsed:8.2f}s  {scored}/{len(results)} scored, "
+              f"{server.config['requests']} upstream calls, first output after "
+              f"{first_output[0] * 1000 if first_output else float('nan'):.0f}ms")
+    server.shutdown()
+
+def make_prompts(count):
+    vocabulary = ['Explain', 'explain', 'recursion', 'simply', 'to', 'a', 'beginner,', 'with',
+                  'examples', 'Examples', 'step', 'by', 'and', 'code,', 'analogy', 'the', 'base', 'case']
+    return {
+        str(i): ' '.join(random.choice(vocabulary) for _ in range(random.randint(0, 40)))
+        for i in range(count)
+    }
+
+def bench_scoring(args):
+    """Compare per-prompt heuristic scoring with the vectorized batch scorer"""
+    random.seed(0)
+    for count in args.prompts:
+        prompts = make_prompts(count)
+        print(f"{count} prompts")
+        
+        def loop():
+            results = [score_prompt(player, prompt) for player, prompt in prompts.items()]
+            results.sort(key=lambda x: x['total_score'], reverse=True)
+            return results
+        
+        expected = loop()
+        if score_prompts_batch(prompts) != expected:
+            raise SystemExit("  batch scores differ from score_prompt")
+        if score_prompts_batch(prompts, top_k=args.top_k) != expected[:args.top_k]:
+            raise SystemExit(f"  top {args.top_k} differs from score_prompt")
+        print(f"  scores identical to score_prompt")
+        
+        loop_time = timed('score_prompt loop + sort', loop, args.repeat)
+        batch_time = timed('batch, full ranking', lambda: score_prompts_batch(prompts), args.repeat)
+        top_time = timed(f"batch, top {args.top_k}", lambda: score_prompts_batch(prompts, top_k=args.top_k),
+                         args.repeat)
+        print(f"  speedup {loop_time / batch_time:.1f}x full, {loop_time / top_time:.1f}x top {args.top_k}")
+
+def bench_ratings(args):
+    """Rate a game history, then time incremental updates and balanced player suggestions"""
+    random.seed(0)
+    users = make_users(args.players)
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = create_backend('json', os.path.join(tmp, 'admin_data.json'),
+                                 os.path.join(tmp, 'results.jsonl'), os.path.join(tmp, 'results.idx'))
+        for i in range(args.games):
+            result = make_result(i, users)
+            result['evaluation'] = score_prompts_batch(make_prompts_for(result['prompts']))
+            backend.append_result(result)
+        book = RatingBook(os.path.join(tmp, 'ratings.db'))
+        print(f"{args.games} games between {args.players} players")
+        
+        timed('rebuild from the results log', lambda: book.rebuild(backend))
+        
+        def append_one():
+            result = make_result(0, users)
+            result['evaluation'] = score_prompts_batch(make_prompts_for(result['prompts']))
+            backend.append_result(result)
+            book.refresh(backend)
+        timed('append a game and refresh', append_one, repeat=200)
+        
+        pool = [user['user_id'] for user in users]
+        timed(f"suggest {args.count} of {len(pool)}", lambda: book.suggest(backend, pool, args.count), repeat=100)
+        timed(f"suggest {args.count} around a player",
+              lambda: book.suggest(backend, pool, args.count, random.choice(pool)), repeat=100)
+        backend.close()
+
+def bench_user_search(args):
+    """Index a roster, then time player searches against scanning every user"""
+    users = make_users(args.users)
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = create_backend('json', os.path.join(tmp, 'admin_data.json'),
+                                 os.path.join(tmp, 'results.jsonl'), os.path.join(tmp, 'results.idx'))
+        backend.replace_users(users)
+        search = UserSearch()
+        print(f"{args.users} users")
+        
+        timed('build the index', lambda: search.search(backend))
+        for query in args.queries:
+            def scan():
+                terms = query.lower().split()
+                return [user for user in backend.get_users()
+                        if all(term in f"{user['fullname']}\n{user['emailid']}".lower() for term in terms)]
+            total = search.search(backend, query)['total']
+            timed(f"scan for {query!r} ({total})", scan, repeat=10)
+            timed(f"search {query!r}", lambda: search.search(backend, query), repeat=100)
+        backend.close()
+
+def make_prompts_for(prompts):
+    """Give each player a prompt of random length so games have a ranking"""
+    return {player: prompt[:random.randint(1, len(prompt))] for player, prompt in prompts.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description='Prompt Battle benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    storage_parser = subparsers.add_parser('storage', help=bench_storage.__doc__)
+    storage_parser.add_argument('--users', type=int, default=10000)
+    storage_parser.add_argument('--questions', type=int, default=10000)
+    storage_parser.add_argument('--results', type=int, default=100000)
+    storage_parser.set_defaults(func=bench_storage)
+    
+    state_parser = subparsers.add_parser('game-state', help=bench_game_state.__doc__)
+    state_parser.add_argument('--backend', choices=['sqlite', 'redis'], default='sqlite')
+    state_parser.add_argument('--url', help='SQLite path or Redis URL, defaults to a temporary database')
+    state_parser.add_argument('--workers', type=int, default=2)
+    state_parser.add_argument('--players', type=int, default=10)
+    state_parser.add_argument('--updates', type=int, default=2000)
+    state_parser.set_defaults(func=bench_game_state)
+    
+    log_parser = subparsers.add_parser('results-log', help=bench_results_log.__doc__)
+    log_parser.add_argument('--workers', type=int, default=2)
+    log_parser.add_argument('--appends', type=int, default=2000)
+    log_parser.set_defaults(func=bench_results_log)
+    
+    socket_parser = subparsers.add_parser('sockets', help=bench_sockets.__doc__)
+    socket_parser.add_argument('--mode', choices=['threading', 'eventlet', 'gevent'], default='gevent')
+    socket_parser.add_argument('--clients', type=int, nargs='+', default=[100, 1000, 5000])
+    socket_parser.add_argument('--duration', type=float, default=10, help='Seconds of prompt updates')
+    socket_parser.add_argument('--rate', type=float, default=2, help='Updates per second per client')
+    socket_parser.add_argument('--window-ms', type=int, default=150)
+    socket_parser.add_argument('--port', type=int, default=5055)
+    socket_parser.set_defaults(func=bench_sockets)
+    
+    eval_parser = subparsers.add_parser('evaluation', help=bench_evaluation.__doc__)
+    eval_parser.add_argument('--players', type=int, default=30)
+    eval_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 30])
+    eval_parser.add_argument('--latency', type=float, default=0.5)
+    eval_parser.add_argument('--jitter', type=float, default=0.2)
+    eval_parser.add_argument('--failure-rate', type=float, default=0.1)
+    eval_parser.add_argument('--hang-rate', type=float, default=0.0)
+    eval_parser.add_argument('--timeout', type=float, default=5)
+    eval_parser.add_argument('--retries', type=int, default=2)
+    eval_parser.add_argument('--deadline', type=float, default=60)
+    eval_parser.add_argument('--stream', action='store_true', help='Stream replies instead of waiting for them')
+    eval_parser.add_argument('--token-latency', type=float, default=0.02)
+    eval_parser.set_defaults(func=bench_evaluation)
+    
+    scoring_parser = subparsers.add_parser('scoring', help=bench_scoring.__doc__)
+    scoring_parser.add_argument('--prompts', type=int, nargs='+', default=[10000, 100000])
+    scoring_parser.add_argument('--top-k', type=int, default=10)
+    scoring_parser.add_argument('--repeat', type=int, default=3)
+    scoring_parser.set_defaults(func=bench_scoring)
+    
+    ratings_parser = subparsers.add_parser('ratings', help=bench_ratings.__doc__)
+    ratings_parser.add_argument('--players', type=int, default=10000)
+    ratings_parser.add_argument('--games', type=int, default=20000)
+    ratings_parser.add_argument('--count', type=int, default=4, help='Players per suggested battle')
+    ratings_parser.set_defaults(func=bench_ratings)
+    
+    search_parser = subparsers.add_parser('user-search', help=bench_user_search.__doc__)
+    search_parser.add_argument('--users', type=int, default=50000)
+    search_parser.add_argument('--queries', nargs='+', default=['pl', 'player 12', 'layer 4999', '@example'])
+    search_parser.set_defaults(func=bench_user_search)
+    
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import native_locks
+
+def cache_key(question, prompt, model, rubric_version):
+    """Content address of one evaluation"""
+    payload = json.dumps([question, prompt, model, rubric_version], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class EvaluationCache:
+    """Two-tier cache of evaluation results keyed by cache_key
+    
+    Recent entries stay in an in-memory LRU of memory_entries items. Every
+    entry is also written to an SQLite file, which is trimmed least
+    recently used first once its values exceed max_disk_bytes.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS eval_cache (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_eval_cache_last_used ON eval_cache (last_used);
+    """
+    
+    def __init__(self, db_file, memory_entries=1024, max_disk_bytes=64 * 1024 * 1024):
+        self.db_file = db_file
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        self._local = threading.local()
+        self._connections = []
+        self._lock = native_locks.Lock()
+        
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        self.disk_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM eval_cache").fetchone()[0]
+    
+    def _connect(self):
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _remember(self, key, value):
+        """Put an entry at the front of the memory tier"""
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+    
+    def get(self, key):
+        """Cached value for key, or None"""
+        with self._lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return self.memory[key]
+        
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM eval_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            with self._lock:
+                self.counters['misses'] += 1
+            return None
+        
+        with conn:
+            conn.execute("UPDATE eval_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        value = json.loads(row[0])
+        with self._lock:
+            self.counters['disk_hits'] += 1
+            self._remember(key, value)
+        return value
+    
+    def put(self, key, value):
+        """Store a value in both tiers"""
+        payload = json.dumps(value, separators=(',', ':'))
+        conn = self._connect()
+        with conn:
+            old = conn.execute("SELECT size FROM eval_cache WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO eval_cache (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload), time.time())
+            )
+        with self._lock:
+            self.disk_bytes += len(payload) - (old[0] if old else 0)
+            self.counters['writes'] += 1
+            self._remember(key, value)
+            over = self.disk_bytes > self.max_disk_bytes
+        if over:
+            self._trim()
+    
+    def _trim(self):
+        """Evict least recently used disk entries down to 90% of the budget"""
+        target = self.max_disk_bytes * 0.9
+        conn = self._connect()
+        with conn:
+            freed = 0
+            evicted = []
+            cursor = conn.execute("SELECT key, size FROM eval_cache ORDER BY last_used")
+            for key, size in cursor:
+                if self.disk_bytes - freed <= target:
+                    break
+                evicted.append((key,))
+                freed += size
+            cursor.close()
+            conn.executemany("DELETE FROM eval_cache WHERE key = ?", evicted)
+        with self._lock:
+            self.disk_bytes -= freed
+            self.counters['evictions'] += len(evicted)
+            for (key,) in evicted:
+                self.memory.pop(key, None)
+    
+    def stats(self):
+        """Hit and miss counters plus the size of both tiers"""
+        with self._lock:
+            stats = dict(self.counters)
+            stats['memory_entries'] = len(self.memory)
+            stats['disk_bytes'] = self.disk_bytes
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0.0
+        stats['disk_entries'] = self._connect().execute("SELECT COUNT(*) FROM eval_cache").fetchone()[0]
+        return stats
+    
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
@@ -0,0 +1,266 @@
+import json
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from eval_cache import cache_key
+from scoring import heuristic_criteria
+
+# Criteria every evaluation scores from 0 to 10; total_score is their mean
+CRITERIA = ('relevance', 'creativity', 'clarity')
+
+SYSTEM_PROMPT = "You are an expert prompt evaluator."
+
+# Bump whenever the criteria or the evaluation prompt change, so cached
+# evaluations made under the old rubric are no longer used
+RUBRIC_VERSION = 2
+
+class LLMError(Exception):
+    """An LLM call failed and should not be retried"""
+
+class TransientLLMError(LLMError):
+    """An LLM call failed in a way that may succeed on retry"""
+
+def build_evaluation_prompt(question, player, prompt):
+    """Ask the model for feedback on a single player's prompt, then scores as JSON"""
+    return (
+        f"Question: {question}\n\n"
+        f"Player {player} wrote this prompt:\n{prompt}\n\n"
+        "Rate the prompt's relevance to the question, creativity and clarity from 0 to 10. "
+        "First give your feedback in two or three sentences, then finish with a line "
+        "containing only a JSON object with the keys relevance, creativity and clarity."
+    )
+
+def parse_scores(text):
+    """Pull the scores and the feedback before them out of a model reply"""
+    match = re.search(r'\{[^{}]*\}\s*$', text) or re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        raise LLMError("Evaluation reply did not contain JSON")
+    try:
+        data = json.loads(match.group(0))
+        scores = {criterion: max(0.0, min(10.0, float(data[criterion]))) for criterion in CRITERIA}
+    except (ValueError, KeyError, TypeError) as e:
+        raise LLMError(f"Evaluation reply was malformed: {e}")
+    scores['feedback'] = str(data.get('feedback') or text[:match.start()].strip())
+    return scores
+
+def merge_chunks(previous, update):
+    """Join buffered output chunks of one evaluation, dropping a failed attempt's"""
+    if previous['attempt'] == update['attempt']:
+        return dict(update, text=previous['text'] + update['text'])
+    return update
+
+class LLMClient:
+    """Interface for the model behind the evaluation engine"""
+    
+    model = None
+    
+    def complete(self, system, user, timeout):
+        """Return the model's reply text, raising TransientLLMError for retryable failures"""
+        raise NotImplementedError
+    
+    def stream(self, system, user, timeout):
+        """Yield the model's reply in chunks as they arrive"""
+        yield self.complete(system, user, timeout)
+
+class MockLLMClient(LLMClient):
+    """Offline client that scores prompts with simple text heuristics"""
+    
+    model = 'mock'
+    
+    def complete(self, system, user, timeout):
+        prompt = user.split('wrote this prompt:\n', 1)[-1].rsplit('\n\nRate the prompt', 1)[0]
+        relevance, creativity, clarity = heuristic_criteria(prompt)
+        feedback = f"Mock evaluation of a {len(prompt.split())} word prompt."
+        scores = json.dumps({'relevance': relevance, 'creativity': creativity, 'clarity': clarity})
+        return f"{feedback}\n{scores}"
+    
+    def stream(self, system, user, timeout):
+        for word in re.findall(r'\S+\s*', self.complete(system, user, timeout)):
+            yield word
+
+class OpenAIClient(LLMClient):
+    """Client for the OpenAI chat API or any server compatible with it"""
+    
+    def __init__(self, model='gpt-3.5-turbo', api_key=None, base_url=None):
+        import openai
+        self.model = model
+        # The engine does its own retries, so the SDK should not retry as well
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.transient_errors = (openai.APITimeoutError, openai.APIConnectionError,
+                                 openai.RateLimitError, openai.InternalServerError)
+        self.errors = openai.OpenAIError
+    
+    def complete(self, system, user, timeout):
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user}
+                ],
+                timeout=timeout
+            )
+        except self.transient_errors as e:
+            raise TransientLLMError(str(e))
+        except self.errors as e:
+            raise LLMError(str(e))
+        return response.choices[0].message.content
+    
+    def stream(self, system, user, timeout):
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user}
+                ],
+                timeout=timeout,
+                stream=True
+            )
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except self.transient_errors as e:
+            raise TransientLLMError(str(e))
+        except self.errors as e:
+            raise LLMError(str(e))
+
+def create_llm_client(kind, model=None, api_key=None, base_url=None):
+    """Create the LLM client selected by configuration"""
+    if kind == 'mock':
+        return MockLLMClient()
+    if kind == 'openai':
+        return OpenAIClient(model or 'gpt-3.5-turbo', api_key=api_key, base_url=base_url)
+    raise ValueError(f"Unknown LLM client: {kind}")
+
+class EvaluationEngine:
+    """Scores every prompt of a battle with its own LLM call, concurrently
+    
+    At most max_concurrency calls are in flight. Each call gets timeout
+    seconds and is retried up to retries times with exponential backoff
+    and jitter on transient errors. Prompts that still fail, or are not
+    done when the overall deadline passes, come back with status 'error'
+    or 'timeout' next to the ones that were scored.
+    
+    With a cache, prompts scored before under the same question, model and
+    rubric are answered from it and only the rest are sent upstream.
+    
+    With on_chunk, replies are streamed and each piece is passed on as
+    on_chunk(player, attempt, text) while the reply is still being written.
+    """
+    
+    # Fields of a successful result that are stored in the cache
+    CACHED_FIELDS = CRITERIA + ('feedback', 'total_score')
+    
+    def __init__(self, client, max_concurrency=8, timeout=30.0, retries=2,
+                 backoff=0.5, max_backoff=8.0, deadline=120.0, cache=None):
+        self.client = client
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+    
+    def _delay(self, attempt):
+        """Backoff before the given retry, with full jitter"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+    
+    def evaluate_one(self, question, player, prompt, stop_at=None, on_chunk=None):
+        """Score one prompt, retrying transient failures"""
+        start = time.monotonic()
+        result = {'player': player, 'prompt': prompt, 'cached': False}
+        user = build_evaluation_prompt(question, player, prompt)
+        
+        for attempt in range(self.retries + 1):
+            result['attempts'] = attempt + 1
+            try:
+                if on_chunk:
+                    parts = []
+                    for chunk in self.client.stream(SYSTEM_PROMPT, user, self.timeout):
+                        parts.append(chunk)
+                        on_chunk(player, attempt + 1, chunk)
+                    reply = ''.join(parts)
+                else:
+                    reply = self.client.complete(SYSTEM_PROMPT, user, self.timeout)
+                result.update(parse_scores(reply))
+                result['total_score'] = round(sum(result[c] for c in CRITERIA) / len(CRITERIA), 1)
+                for criterion in CRITERIA:
+                    result[criterion] = round(result[criterion], 1)
+                result['status'] = 'ok'
+                result.pop('error', None)
+                break
+            except TransientLLMError as e:
+                result.update(status='error', error=str(e), total_score=None)
+                delay = self._delay(attempt)
+                if attempt == self.retries or (stop_at and time.monotonic() + delay >= stop_at):
+                    break
+                time.sleep(delay)
+            except LLMError as e:
+                result.update(status='error', error=str(e), total_score=None)
+                break
+        
+        result['latency'] = round(time.monotonic() - start, 3)
+        return result
+    
+    def evaluate(self, question, prompts, on_result=None, on_chunk=None):
+        """Score all prompts and return per-player results, best first
+        
+        on_result is called with each result as soon as it is ready.
+        """
+        stop_at = time.monotonic() + self.deadline if self.deadline else None
+        results = {}
+        keys = {}
+        uncached = {}
+        
+        for player, prompt in prompts.items():
+            if self.cache is None:
+                uncached[player] = prompt
+                continue
+            keys[player] = cache_key(question, prompt, self.client.model, RUBRIC_VERSION)
+            cached = self.cache.get(keys[player])
+            if cached is None:
+                uncached[player] = prompt
+            else:
+                results[player] = dict(cached, player=player, prompt=prompt, status='ok',
+                                       attempts=0, latency=0.0, cached=True)
+                if on_result:
+                    on_result(results[player])
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_concurrency, len(uncached))))
+        try:
+            pending = {
+                executor.submit(self.evaluate_one, question, player, prompt, stop_at, on_chunk): player
+                for player, prompt in uncached.items()
+            }
+            while pending:
+                remaining = stop_at - time.monotonic() if stop_at else None
+                if remaining is not None and remaining <= 0:
+                    break
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    player = pending.pop(future)
+                    try:
+                        results[player] = future.result()
+                    except Exception as e:
+                        results[player] = {'player': player, 'prompt': prompts[player],
+                                           'status': 'error', 'error': str(e), 'total_score': None}
+                    if self.cache is not None and results[player]['status'] == 'ok':
+                        self.cache.put(keys[player], {field: results[player][field]
+                                                      for field in self.CACHED_FIELDS})
+                    if on_result:
+                        on_result(results[player])
+        finally:
+            # Calls still running past the deadline are abandoned, not awaited
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        for player, prompt in prompts.items():
+            if player not in results:
+                results[player] = {'player': player, 'prompt': prompt, 'status': 'timeout',
+                                   'error': 'Evaluation deadline exceeded', 'total_score': None}
+        
+        return sorted(results.values(),
+                      key=lambda result: (result['total_score'] is None, -(result['total_score'] or 0)))
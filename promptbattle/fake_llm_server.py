@@ -0,0 +1,141 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from evaluation import MockLLMClient
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """Answers OpenAI-style chat completion requests after an injected delay"""
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _reply(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, which is what stalls are for
+            pass
+    
+    def _stream(self, model, content):
+        """Send the reply as server-sent chat completion chunks, a word at a time"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = re.findall(r'\S+\s*', content)
+        try:
+            for i, word in enumerate(words):
+                time.sleep(self.server.config['token_latency'])
+                chunk = {
+                    'id': completion_id,
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{
+                        'index': 0,
+                        'delta': {'role': 'assistant', 'content': word} if i == 0 else {'content': word},
+                        'finish_reason': None
+                    }]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+    
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._reply(404, {'error': {'message': 'Not found'}})
+            return
+        
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        config = self.server.config
+        config['requests'] += 1
+        
+        roll = random.random()
+        if roll < config['hang_rate']:
+            time.sleep(config['hang'])
+        else:
+            time.sleep(max(0.0, random.gauss(config['latency'], config['jitter'])))
+        if roll >= 1 - config['failure_rate']:
+            self._reply(503, {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+            return
+        
+        messages = {message['role']: message['content'] for message in request['messages']}
+        content = MockLLMClient().complete(messages.get('system', ''), messages.get('user', ''), None)
+        if request.get('stream'):
+            self._stream(request.get('model', 'fake'), content)
+            return
+        # A non-streamed reply arrives only once every word has been generated
+        time.sleep(len(content.split()) * config['token_latency'])
+        self._reply(200, {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'fake'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        })
+
+def start_fake_llm_server(host='127.0.0.1', port=0, latency=0.5, jitter=0.2,
+                          failure_rate=0.0, hang_rate=0.0, hang=60.0, token_latency=0.02):
+    """Serve fake completions on a background thread and return the server
+    
+    The base URL for an OpenAI-compatible client is
+    f"http://{host}:{server.server_port}/v1".
+    """
+    server = ThreadingHTTPServer((host, port), FakeLLMHandler)
+    server.daemon_threads = True
+    server.config = {
+        'latency': latency,
+        'jitter': jitter,
+        'failure_rate': failure_rate,
+        'hang_rate': hang_rate,
+        'hang': hang,
+        'token_latency': token_latency,
+        'requests': 0
+    }
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake OpenAI-compatible LLM server for offline testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='Mean seconds per completion')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Standard deviation of the latency')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='Fraction of requests that stall')
+    parser.add_argument('--hang', type=float, default=60.0, help='Seconds a stalled request takes')
+    parser.add_argument('--token-latency', type=float, default=0.02,
+                        help='Seconds between words of a streamed reply')
+    args = parser.parse_args()
+    
+    server = start_fake_llm_server(args.host, args.port, args.latency, args.jitter,
+                                   args.failure_rate, args.hang_rate, args.hang, args.token_latency)
+    print(f"Fake LLM server on http://{args.host}:{server.server_port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -1,112 +1,373 @@
+import os
+
+# Server mode, selected at startup: 'threading' runs the Werkzeug dev server,
+# 'eventlet' and 'gevent' run a green server that can hold thousands of
+# sockets. The green modes must patch the standard library before anything
+# else is imported. Storage I/O then runs on a small pool of native worker
+# threads (see run_blocking), so a long import or rebuild does not hold up
+# logins; the storage modules take native locks (see native_locks).
+SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
+STORAGE_THREADS = int(os.environ.get('STORAGE_THREADS', '4'))
+if SOCKETIO_ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+    from eventlet import tpool
+    tpool.set_num_threads(STORAGE_THREADS)
+elif SOCKETIO_ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+    from gevent.threadpool import ThreadPool
+    storage_pool = ThreadPool(STORAGE_THREADS)
+
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import json
 import csv
-import os
+import functools
 from datetime import datetime
 import openai
 from werkzeug.security import check_password_hash, generate_password_hash
 import uuid
+import threading
+import time
+from storage import create_backend
+from game_state import MemoryGameState, create_game_state
+from prompt_sync import PromptCoalescer, apply_patch, merge_updates
+from evaluation import EvaluationEngine, create_llm_client, merge_chunks
+from eval_cache import EvaluationCache
+from job_queue import JobQueue, JobWorkerPool
+from leaderboard import Leaderboard
+from ratings import RatingBook
+from history import ResultHistory
+from search import QuestionSearch, UserSearch
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-socketio = SocketIO(app, cors_allowed_origins="*")
+
+# Running several workers needs a shared game state backend and a message
+# queue (e.g. redis://localhost:6379/0) so emits reach every worker's clients
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=SOCKETIO_ASYNC_MODE,
+                    message_queue=SOCKETIO_MESSAGE_QUEUE)
 
 # File paths
 ADMIN_DATA_FILE = 'admin_data.json'
-RESULTS_FILE = 'results.json'
+RESULTS_FILE = 'results.json'  # Legacy format, migrated to the log on startup
+RESULTS_LOG_FILE = 'results.jsonl'
+RESULTS_INDEX_FILE = 'results.idx'
+SQLITE_DB_FILE = 'promptbattle.db'
+LEADERBOARD_FILE = 'leaderboard.db'  # Player and question stats, kept in step with the results
+RATINGS_FILE = 'ratings.db'  # Elo ratings from every game's ranking
+HISTORY_FILE = 'history.db'  # Index of results by date, question and player
 USERS_CSV_FILE = 'users.csv'
 
+# Rows per chunk when importing users from CSV, and seconds between progress events
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_PROGRESS_INTERVAL = 0.5
+
+# Results per page of /results by default, and the most a client may ask for
+RESULTS_PAGE_SIZE = 20
+MAX_RESULTS_PAGE_SIZE = 100
+# Matching results counted at most for the total of /results
+RESULTS_TOTAL_LIMIT = 1000
+
+# Users per page of /users/search by default, and the most a client may ask for
+USER_SEARCH_PAGE_SIZE = 20
+MAX_USER_SEARCH_PAGE_SIZE = 100
+
+# Questions per page of /questions/search by default, and the most a client may ask for
+QUESTION_SEARCH_PAGE_SIZE = 20
+MAX_QUESTION_SEARCH_PAGE_SIZE = 100
+
+# Socket.IO room joined by every admin connection
+ADMIN_ROOM = 'admins'
+
+# Prompt updates are coalesced for this long before being sent to monitors
+PROMPT_SYNC_WINDOW_MS = int(os.environ.get('PROMPT_SYNC_WINDOW_MS', '150'))
+
+# Session lifecycle: idle sessions are archived after SESSION_IDLE_TTL seconds,
+# archived sessions are evicted least recently used first once the session
+# table grows past MAX_SESSIONS or roughly MAX_SESSION_BYTES of prompt text
+SESSION_IDLE_TTL = int(os.environ.get('SESSION_IDLE_TTL', '1800'))
+MAX_SESSIONS = int(os.environ.get('MAX_SESSIONS', '500'))
+MAX_SESSION_BYTES = int(os.environ.get('MAX_SESSION_BYTES', str(64 * 1024 * 1024)))
+SESSION_SWEEP_INTERVAL = 60
+
+# Where game sessions live: 'memory' for one process, 'sqlite' or 'redis'
+# to share them between workers. GAME_STATE_URL is the database path or
+# Redis URL for the shared backends
+GAME_STATE_BACKEND = os.environ.get('GAME_STATE_BACKEND', 'memory')
+GAME_STATE_URL = os.environ.get('GAME_STATE_URL')
+
+# Storage backend: 'json' (admin_data.json + results log) or 'sqlite'
+STORAGE_BACKEND = os.environ.get('PROMPTBATTLE_STORAGE', 'json')
+
 # OpenAI API key (set your API key)
 # openai.api_key = 'your-openai-api-key'
 
+# Evaluation: LLM_CLIENT is 'mock' (offline heuristics) or 'openai', which
+# also works against any compatible server at LLM_BASE_URL, such as
+# fake_llm_server.py. Each prompt is scored by its own call, EVAL_CONCURRENCY
+# at a time, with EVAL_TIMEOUT seconds per call, EVAL_RETRIES retries and
+# EVAL_DEADLINE seconds for the whole battle
+LLM_CLIENT = os.environ.get('LLM_CLIENT', 'mock')
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gpt-3.5-turbo')
+LLM_BASE_URL = os.environ.get('LLM_BASE_URL')
+EVAL_CONCURRENCY = int(os.environ.get('EVAL_CONCURRENCY', '8'))
+EVAL_TIMEOUT = float(os.environ.get('EVAL_TIMEOUT', '30'))
+EVAL_RETRIES = int(os.environ.get('EVAL_RETRIES', '2'))
+EVAL_DEADLINE = float(os.environ.get('EVAL_DEADLINE', '120'))
+
+# Stream evaluation output to admins as it is written, in batches sent
+# every EVAL_STREAM_FLUSH_MS
+EVAL_STREAM = os.environ.get('EVAL_STREAM', '1') == '1'
+EVAL_STREAM_FLUSH_MS = int(os.environ.get('EVAL_STREAM_FLUSH_MS', '100'))
+
+# Evaluations run as jobs from a persistent queue on EVAL_WORKERS background
+# workers, so the request returns at once and queued jobs survive restarts
+JOBS_DB_FILE = os.environ.get('JOBS_DB_FILE', 'jobs.db')
+EVAL_WORKERS = int(os.environ.get('EVAL_WORKERS', '2'))
+
+# Evaluations are cached by question, prompt, model and rubric version: the
+# most recent EVAL_CACHE_MEMORY_ENTRIES in memory, the rest in EVAL_CACHE_FILE
+# up to EVAL_CACHE_MAX_BYTES
+EVAL_CACHE_FILE = os.environ.get('EVAL_CACHE_FILE', 'eval_cache.db')
+EVAL_CACHE_MEMORY_ENTRIES = int(os.environ.get('EVAL_CACHE_MEMORY_ENTRIES', '1024'))
+EVAL_CACHE_MAX_BYTES = int(os.environ.get('EVAL_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+def run_blocking(func, *args, **kwargs):
+    """Run blocking file or database I/O without stalling the event loop
+    
+    In the green server modes the call runs on one of the storage worker
+    threads while the calling greenlet waits, so other sockets keep being
+    served.
+    """
+    if SOCKETIO_ASYNC_MODE == 'eventlet':
+        return tpool.execute(func, *args, **kwargs)
+    if SOCKETIO_ASYNC_MODE == 'gevent':
+        return storage_pool.apply(func, args, kwargs)
+    return func(*args, **kwargs)
+
+class BlockingCalls:
+    """Runs the named methods of an SQLite-backed helper through run_blocking
+    
+    For the evaluation cache, the job queue and the SQLite game state,
+    which are called from handlers and background tasks directly rather
+    than through DataManager. Other attributes are passed through.
+    """
+    
+    def __init__(self, target, methods):
+        self._target = target
+        for name in methods:
+            setattr(self, name, functools.partial(run_blocking, getattr(target, name)))
+    
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+storage = create_backend(STORAGE_BACKEND, ADMIN_DATA_FILE, RESULTS_LOG_FILE, RESULTS_INDEX_FILE,
+                         SQLITE_DB_FILE, legacy_results_file=RESULTS_FILE)
+
+def get_storage():
+    """Get the process-wide storage backend"""
+    return storage
+
+leaderboard = Leaderboard(LEADERBOARD_FILE)
+ratings = RatingBook(RATINGS_FILE)
+history = ResultHistory(HISTORY_FILE)
+user_search = UserSearch()
+question_search = QuestionSearch()
+
+evaluation_cache = BlockingCalls(
+    EvaluationCache(EVAL_CACHE_FILE, memory_entries=EVAL_CACHE_MEMORY_ENTRIES,
+                    max_disk_bytes=EVAL_CACHE_MAX_BYTES),
+    ('get', 'put', 'stats')
+)
+
+evaluation_engine = EvaluationEngine(
+    create_llm_client(LLM_CLIENT, model=LLM_MODEL, base_url=LLM_BASE_URL),
+    max_concurrency=EVAL_CONCURRENCY, timeout=EVAL_TIMEOUT,
+    retries=EVAL_RETRIES, deadline=EVAL_DEADLINE, cache=evaluation_cache
+)
+
 class DataManager:
-    """Handles all data operations for JSON files"""
+    """Handles all data operations through the configured storage backend
+    
+    Every call goes through run_blocking so storage I/O never runs on the
+    event loop in the green server modes.
+    """
     
     @staticmethod
     def load_admin_data():
-        """Load admin data from JSON file"""
-        if os.path.exists(ADMIN_DATA_FILE):
-            with open(ADMIN_DATA_FILE, 'r') as f:
-                return json.load(f)
-        return {
-            'admins': [{'email': 'admin@example.com', 'password': 'admin123'}],
-            'users': [],
-            'questions': []
-        }
+        """Load admins, users and questions as one document"""
+        return run_blocking(get_storage().load_admin_data)
     
     @staticmethod
     def save_admin_data(data):
-        """Save admin data to JSON file"""
-        with open(ADMIN_DATA_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        """Save admins, users and questions from one document"""
+        run_blocking(get_storage().save_admin_data, data)
+    
+    @staticmethod
+    def admin_data_version():
+        """Version counter that changes whenever admin data changes"""
+        return run_blocking(get_storage().version)
+    
+    @staticmethod
+    def get_admins():
+        """Get all admins"""
+        return run_blocking(get_storage().get_admins)
+    
+    @staticmethod
+    def get_users():
+        """Get all users"""
+        return run_blocking(get_storage().get_users)
+    
+    @staticmethod
+    def get_admin_by_email(email):
+        """Get an admin by case-insensitive email"""
+        return run_blocking(get_storage().get_admin_by_email, email)
+    
+    @staticmethod
+    def get_user_by_email(email):
+        """Get a user by case-insensitive email"""
+        return run_blocking(get_storage().get_user_by_email, email)
+    
+    @staticmethod
+    def replace_users(users):
+        """Replace all users"""
+        run_blocking(get_storage().replace_users, users)
+    
+    @staticmethod
+    def upsert_users(chunks, progress=None):
+        """Insert or update users by user_id, chunk by chunk"""
+        return run_blocking(get_storage().upsert_users, chunks, progress)
+    
+    @staticmethod
+    def search_users(query='', is_technical=None, page=1, page_size=USER_SEARCH_PAGE_SIZE):
+        """One page of users whose name or email matches the query, without passwords"""
+        return run_blocking(user_search.search, get_storage(), query, is_technical, page, page_size)
+    
+    @staticmethod
+    def get_questions():
+        """Get all questions"""
+        return run_blocking(get_storage().get_questions)
+    
+    @staticmethod
+    def get_question(question_id):
+        """Get a question by ID"""
+        return run_blocking(get_storage().get_question, question_id)
+    
+    @staticmethod
+    def add_question(question):
+        """Store a new question and add it to the search index"""
+        version = run_blocking(get_storage().version)
+        run_blocking(get_storage().add_question, question)
+        run_blocking(question_search.add, get_storage(), question, version)
+    
+    @staticmethod
+    def search_questions(query='', page=1, page_size=QUESTION_SEARCH_PAGE_SIZE):
+        """One page of questions ranked by how well they match the query"""
+        return run_blocking(question_search.search, get_storage(), query, page, page_size)
     
     @staticmethod
     def load_results():
-        """Load results from JSON file"""
-        if os.path.exists(RESULTS_FILE):
-            with open(RESULTS_FILE, 'r') as f:
-                return json.load(f)
-        return []
+        """Load all results"""
+        return run_blocking(get_storage().load_results)
     
     @staticmethod
     def save_results(results):
-        """Save results to JSON file"""
-        with open(RESULTS_FILE, 'w') as f:
-            json.dump(results, f, indent=2)
+        """Replace all results"""
+        run_blocking(get_storage().save_results, results)
+        run_blocking(leaderboard.rebuild, get_storage())
+        run_blocking(ratings.rebuild, get_storage())
+        run_blocking(history.rebuild, get_storage())
+    
+    @staticmethod
+    def append_result(result):
+        """Append a single result and count it on the leaderboard, ratings and history"""
+        position = run_blocking(get_storage().append_result, result)
+        run_blocking(leaderboard.refresh, get_storage())
+        run_blocking(ratings.refresh, get_storage())
+        run_blocking(history.refresh, get_storage())
+        return position
+    
+    @staticmethod
+    def find_recent_result(field, value, since):
+        """The newest result saved since an ISO timestamp with the given field value"""
+        return run_blocking(get_storage().find_recent_result, field, value, since)
+    
+    @staticmethod
+    def query_results(since=None, until=None, question_id=None, player=None, sort='newest', cursor=None,
+                      page_size=RESULTS_PAGE_SIZE):
+        """One page of saved results matching the filters, after cursor"""
+        return run_blocking(history.query, get_storage(), since, until, question_id, player, sort, cursor,
+                            page_size, RESULTS_TOTAL_LIMIT)
+    
+    @staticmethod
+    def leaderboard_players(sort='wins', limit=None):
+        """Per-player stats from the leaderboard, best first"""
+        return run_blocking(leaderboard.players, get_storage(), sort, limit)
+    
+    @staticmethod
+    def leaderboard_questions():
+        """Per-question stats from the leaderboard"""
+        return run_blocking(leaderboard.questions, get_storage())
+    
+    @staticmethod
+    def suggest_players(pool, count, around=None):
+        """Players from pool with the closest ratings"""
+        return run_blocking(ratings.suggest, get_storage(), pool, count, around)
 
 class UserManager:
     """Handles user-related operations"""
     
     @staticmethod
-    def import_users_from_csv():
-        """Import users from CSV file"""
-        admin_data = DataManager.load_admin_data()
-        users = []
-        
-        if os.path.exists(USERS_CSV_FILE):
-            with open(USERS_CSV_FILE, 'r') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    user = {
-                        'user_id': row['user_id'],
-                        'fullname': row['fullname'],
-                        'emailid': row['emailid'],
-                        'phonenumber': row['phonenumber'],
-                        'is_technical': row['IsTechnical'].lower() == 'yes',
-                        'password': row['phonenumber']  # Default password is phone number
-                    }
-                    users.append(user)
-        
-        admin_data['users'] = users
-        DataManager.save_admin_data(admin_data)
-        return users
+    def iter_csv_user_chunks(chunk_size=IMPORT_CHUNK_SIZE):
+        """Stream users from the CSV file in fixed-size chunks"""
+        with open(USERS_CSV_FILE, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            chunk = []
+            for row in reader:
+                chunk.append({
+                    'user_id': row['user_id'],
+                    'fullname': row['fullname'],
+                    'emailid': row['emailid'],
+                    'phonenumber': row['phonenumber'],
+                    'is_technical': row['IsTechnical'].lower() == 'yes',
+                    'password': row['phonenumber']  # Default password is phone number
+                })
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+    
+    @staticmethod
+    def import_users_from_csv(progress=None):
+        """Import users from CSV file, upserting them by user_id chunk by chunk"""
+        if not os.path.exists(USERS_CSV_FILE):
+            return {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        return DataManager.upsert_users(UserManager.iter_csv_user_chunks(), progress)
     
     @staticmethod
     def authenticate_user(email, password):
-        """Authenticate user login"""
-        admin_data = DataManager.load_admin_data()
-        
-        for user in admin_data['users']:
-            if user['emailid'] == email and user['password'] == password:
-                return user
+        """Authenticate user login with an indexed email lookup"""
+        user = DataManager.get_user_by_email(email)
+        if user and user['password'] == password:
+            return user
         return None
     
     @staticmethod
     def authenticate_admin(email, password):
-        """Authenticate admin login"""
-        admin_data = DataManager.load_admin_data()
-        
-        for admin in admin_data['admins']:
-            if admin['email'] == email and admin['password'] == password:
-                return admin
+        """Authenticate admin login with an indexed email lookup"""
+        admin = DataManager.get_admin_by_email(email)
+        if admin and admin['password'] == password:
+            return admin
         return None
     
     @staticmethod
     def get_all_users():
         """Get all users"""
-        admin_data = DataManager.load_admin_data()
-        return admin_data['users']
+        return DataManager.get_users()
 
 class QuestionManager:
     """Handles question-related operations"""
@@ -114,106 +375,401 @@ class QuestionManager:
     @staticmethod
     def add_question(question_text):
         """Add a new question"""
-        admin_data = DataManager.load_admin_data()
-        
         question = {
             'id': str(uuid.uuid4()),
             'text': question_text,
             'created_at': datetime.now().isoformat()
         }
         
-        admin_data['questions'].append(question)
-        DataManager.save_admin_data(admin_data)
+        DataManager.add_question(question)
         return question
     
     @staticmethod
     def get_all_questions():
         """Get all questions"""
-        admin_data = DataManager.load_admin_data()
-        return admin_data['questions']
+        return DataManager.get_questions()
     
     @staticmethod
     def get_question_by_id(question_id):
         """Get question by ID"""
-        admin_data = DataManager.load_admin_data()
-        
-        for question in admin_data['questions']:
-            if question['id'] == question_id:
-                return question
-        return None
+        return DataManager.get_question(question_id)
+
+def game_room(session_id):
+    """Room for the selected players of a game session"""
+    return f'game:{session_id}'
+
+def monitor_room(session_id):
+    """Room for the admins monitoring a game session"""
+    return f'monitor:{session_id}'
+
+def player_room(player_id):
+    """Room for every connection of a single player"""
+    return f'user:{player_id}'
+
+def player_id_of(player):
+    """Selected players may be sent as user dicts or bare user IDs"""
+    return str(player['user_id']) if isinstance(player, dict) else str(player)
 
 class GameManager:
-    """Handles game session management"""
+    """Handles game session management and Socket.IO room membership
+    
+    Sessions go created -> active -> stopped -> archived. Sessions are
+    archived once evaluated or after idle_ttl seconds without activity,
+    and are written to the results store before that if they were played
+    but never evaluated. Archived sessions are evicted least recently used first
+    once there are more than max_sessions or max_bytes of them.
+    
+    Session state lives in a GameStateStore so several worker processes
+    can share it; room membership is per connection and stays local.
+    """
     
-    def __init__(self):
-        self.active_sessions = {}
-        self.player_prompts = {}
+    # Minimum seconds between last_activity writes for the same session
+    TOUCH_INTERVAL = 1.0
+    
+    def __init__(self, state=None, max_sessions=MAX_SESSIONS, max_bytes=MAX_SESSION_BYTES,
+                 idle_ttl=SESSION_IDLE_TTL, on_archive=None):
+        self.state = state or MemoryGameState()
+        self.session_members = {}
+        self.sid_sessions = {}
+        self.session_players = {}
+        self.last_touched = {}
+        self.evicted_count = 0
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.on_archive = on_archive
+        self._lock = threading.RLock()
+    
+    def _touch(self, session_id, fields=None, expect=None, force=True):
+        """Update a session's lifecycle fields and mark it as recently used"""
+        now = time.time()
+        if not force and not fields and now - self.last_touched.get(session_id, 0) < self.TOUCH_INTERVAL:
+            return True
+        self.last_touched[session_id] = now
+        return self.state.update_session(session_id, dict(fields or {}, last_activity=now), expect)
     
     def create_session(self, session_id, question, timer_duration, selected_players):
-        """Create a new game session"""
-        self.active_sessions[session_id] = {
+        """Create a new game session, or return False if there is no room for it
+        
+        Room is made before the session is added, so the new session itself
+        is never evicted.
+        """
+        if not self.enforce_budget(extra=1):
+            return False
+        self.state.create_session(session_id, {
             'question': question,
             'timer_duration': timer_duration,
             'selected_players': selected_players,
+            'player_ids': [player_id_of(player) for player in selected_players],
+            'status': 'created',
             'is_active': False,
             'start_time': None,
-            'player_prompts': {}
-        }
+            'deadline': None,
+            'last_activity': time.time(),
+            'player_prompts': {},
+            'prompt_versions': {}
+        })
+        return True
     
     def start_session(self, session_id):
-        """Start a game session"""
-        if session_id in self.active_sessions:
-            self.active_sessions[session_id]['is_active'] = True
-            self.active_sessions[session_id]['start_time'] = datetime.now()
+        """Start a game session and return its absolute deadline (epoch seconds)"""
+        session_data = self.state.get_session(session_id)
+        if session_data is None:
+            return None
+        
+        deadline = None
+        if session_data['timer_duration']:
+            deadline = time.time() + float(session_data['timer_duration'])
+        self._touch(session_id, {
+            'status': 'active',
+            'is_active': True,
+            'start_time': datetime.now().isoformat(),
+            'deadline': deadline
+        })
+        return deadline
+    
+    def expire_session(self, session_id, deadline):
+        """Stop a session if it is still running against the given deadline"""
+        return self._touch(session_id, {'status': 'stopped', 'is_active': False},
+                           expect={'is_active': True, 'deadline': deadline})
     
     def stop_session(self, session_id):
         """Stop a game session"""
-        if session_id in self.active_sessions:
-            self.active_sessions[session_id]['is_active'] = False
+        fields = self.state.get_session_fields(session_id)
+        if fields is not None:
+            if fields['status'] == 'archived':
+                self._touch(session_id, {'is_active': False})
+            else:
+                self._touch(session_id, {'status': 'stopped', 'is_active': False})
+    
+    def get_session(self, session_id):
+        """Get a session, marking it as recently used"""
+        session_data = self.state.get_session(session_id)
+        if session_data is not None:
+            self._touch(session_id, force=False)
+        return session_data
+    
+    def archive_session(self, session_id, persisted=False):
+        """Move a finished session to the archived state
+        
+        Sessions whose results were not saved yet are handed to on_archive
+        first, so nothing is lost when they are evicted later. Sessions
+        that were never started have no game to save. Only the worker that
+        wins the state change archives the session.
+        """
+        fields = self.state.get_session_fields(session_id)
+        if fields is None or fields['status'] == 'archived':
+            return
+        if not self.state.update_session(session_id, {'status': 'archived', 'is_active': False},
+                                         expect={'status': fields['status']}):
+            return
+        
+        if not persisted and fields['status'] != 'created' and self.on_archive:
+            self.on_archive(session_id, self.state.get_session(session_id))
+    
+    def _evict(self, session_id):
+        """Drop a session and its bookkeeping"""
+        self.state.delete_session(session_id)
+        with self._lock:
+            self.session_players.pop(session_id, None)
+            self.last_touched.pop(session_id, None)
+            for sid in self.session_members.pop(session_id, {}):
+                self.sid_sessions.get(sid, set()).discard(session_id)
+            self.evicted_count += 1
+    
+    def sweep(self, now=None):
+        """Archive idle sessions, then evict down to the memory budget"""
+        now = now or time.time()
+        for summary in self.state.list_sessions():
+            if (summary['status'] in ('created', 'stopped') and
+                    now - summary['last_activity'] >= self.idle_ttl):
+                self.archive_session(summary['session_id'])
+        self.enforce_budget()
+    
+    def enforce_budget(self, extra=0):
+        """Evict least recently used finished sessions until within budget
+        
+        extra is the number of sessions about to be added. Sessions that
+        were created but not started yet are never evicted. Returns whether
+        the budget could be met.
+        """
+        sessions = self.state.list_sessions()
+        count = len(sessions) + extra
+        total_bytes = sum(summary['bytes'] for summary in sessions)
+        
+        # Prefer sessions that are already archived, then stopped ones
+        candidates = ([summary for summary in sessions if summary['status'] == 'archived'] +
+                      [summary for summary in sessions
+                       if summary['status'] == 'stopped' and not summary['is_active']])
+        for summary in candidates:
+            if count <= self.max_sessions and total_bytes <= self.max_bytes:
+                return True
+            if summary['status'] != 'archived':
+                self.archive_session(summary['session_id'])
+            self._evict(summary['session_id'])
+            count -= 1
+            total_bytes -= summary['bytes']
+        return count <= self.max_sessions and total_bytes <= self.max_bytes
+    
+    def memory_stats(self):
+        """Size of the session table for monitoring"""
+        sessions = self.state.list_sessions()
+        by_status = {}
+        for summary in sessions:
+            by_status[summary['status']] = by_status.get(summary['status'], 0) + 1
+        return {
+            'backend': type(self.state).__name__,
+            'sessions': len(sessions),
+            'by_status': by_status,
+            'approx_bytes': sum(summary['bytes'] for summary in sessions),
+            'evicted': self.evicted_count,
+            'max_sessions': self.max_sessions,
+            'max_bytes': self.max_bytes,
+            'idle_ttl': self.idle_ttl
+        }
+    
+    def _is_active(self, session_id):
+        fields = self.state.get_session_fields(session_id)
+        return fields is not None and fields['is_active']
     
     def update_player_prompt(self, session_id, player_id, prompt):
-        """Update player's prompt"""
-        if session_id in self.active_sessions:
-            self.active_sessions[session_id]['player_prompts'][player_id] = prompt
+        """Replace a player's prompt and return its new version"""
+        if not self._is_active(session_id):
+            return None
+        version = self.state.set_prompt(session_id, player_id, prompt)
+        if version is not None:
+            self._touch(session_id, force=False)
+        return version
+    
+    def patch_player_prompt(self, session_id, player_id, base_version, offset, delete_len, insert_text):
+        """Apply a delta to a player's prompt
+        
+        Returns the new version, or None if base_version is stale or the
+        patch does not fit, in which case the client needs a snapshot.
+        """
+        if not self._is_active(session_id):
+            return None
+        prompt, version = self.state.get_prompt(session_id, player_id)
+        if version != base_version:
+            return None
+        
+        try:
+            prompt = apply_patch(prompt, offset, delete_len, insert_text)
+        except ValueError:
+            return None
+        
+        # Another worker may have written in between, the store re-checks the version
+        version = self.state.set_prompt(session_id, player_id, prompt, expected_version=base_version)
+        if version is not None:
+            self._touch(session_id, force=False)
+        return version
+    
+    def get_player_prompt(self, session_id, player_id):
+        """Get a player's prompt and its version"""
+        return self.state.get_prompt(session_id, player_id)
+    
+    def player_ids(self, session_id):
+        """Players selected for a session, cached since they never change"""
+        player_ids = self.session_players.get(session_id)
+        if player_ids is None:
+            session_data = self.state.get_session(session_id)
+            if session_data is None:
+                return []
+            player_ids = self.session_players[session_id] = session_data['player_ids']
+        return player_ids
+    
+    def is_selected(self, session_id, player_id):
+        """Check whether a player was selected for a session"""
+        return str(player_id) in self.player_ids(session_id)
+    
+    def invite_rooms(self, session_id):
+        """Rooms that should hear about a session starting"""
+        return [ADMIN_ROOM] + [player_room(player_id) for player_id in self.player_ids(session_id)]
+    
+    def audience_rooms(self, session_id):
+        """Rooms that should hear about a session's state changes"""
+        return [game_room(session_id), monitor_room(session_id)]
+    
+    def add_member(self, session_id, sid, room):
+        """Record that a connection joined one of a session's rooms"""
+        with self._lock:
+            self.session_members.setdefault(session_id, {})[sid] = room
+            self.sid_sessions.setdefault(sid, set()).add(session_id)
+    
+    def remove_member(self, session_id, sid):
+        """Record that a connection left a session's rooms"""
+        with self._lock:
+            members = self.session_members.get(session_id, {})
+            members.pop(sid, None)
+            if not members:
+                self.session_members.pop(session_id, None)
+            self.sid_sessions.get(sid, set()).discard(session_id)
+    
+    def remove_connection(self, sid):
+        """Forget a disconnected connection and return the sessions it was in"""
+        with self._lock:
+            session_ids = self.sid_sessions.pop(sid, set())
+            for session_id in session_ids:
+                members = self.session_members.get(session_id, {})
+                members.pop(sid, None)
+                if not members:
+                    self.session_members.pop(session_id, None)
+            return session_ids
+    
+    def room_size(self, session_id, room):
+        """Number of connections in one of a session's rooms"""
+        with self._lock:
+            members = self.session_members.get(session_id, {})
+            return sum(1 for member_room in members.values() if member_room == room)
+
+def archive_to_results(session_id, session_data):
+    """Persist a session that was never evaluated before it leaves memory"""
+    DataManager.append_result({
+        'session_id': session_id,
+        'question_id': session_data['question'].get('id'),
+        'question': session_data['question']['text'],
+        'prompts': dict(session_data['player_prompts']),
+        'evaluation': None,
+        'status': 'archived',
+        'timestamp': datetime.now().isoformat()
+    })
 
-game_manager = GameManager()
+game_state = create_game_state(GAME_STATE_BACKEND, GAME_STATE_URL)
+if GAME_STATE_BACKEND == 'sqlite':
+    # The memory backend never blocks, and Redis talks through patched sockets
+    game_state = BlockingCalls(game_state, ('create_session', 'get_session', 'get_session_fields',
+                                            'update_session', 'delete_session', 'list_sessions',
+                                            'get_prompt', 'set_prompt'))
+game_manager = GameManager(game_state, on_archive=archive_to_results)
+
+def sweep_sessions_forever():
+    """Background task that archives idle sessions and enforces the budget"""
+    while True:
+        socketio.sleep(SESSION_SWEEP_INTERVAL)
+        game_manager.sweep()
+
+session_sweeper_lock = threading.Lock()
+session_sweeper_started = False
+
+def ensure_session_sweeper():
+    """Start the session sweeper once per process"""
+    global session_sweeper_started
+    with session_sweeper_lock:
+        if not session_sweeper_started:
+            socketio.start_background_task(sweep_sessions_forever)
+            session_sweeper_started = True
+
+def flush_prompt_updates(session_id, updates):
+    """Send the queued update of each player to monitors as one batch"""
+    batch = []
+    for player_id, update in updates.items():
+        if update.pop('snapshot', False):
+            update['prompt'], update['version'] = game_manager.get_player_prompt(session_id, player_id)
+        batch.append(update)
+    
+    socketio.emit('prompts_updated', {
+        'session_id': session_id,
+        'updates': batch
+    }, to=monitor_room(session_id))
+
+prompt_coalescer = PromptCoalescer(PROMPT_SYNC_WINDOW_MS / 1000, flush_prompt_updates,
+                                   start_task=socketio.start_background_task, sleep=socketio.sleep)
+
+def expire_session_at(session_id, deadline):
+    """Background task that stops a session when its deadline passes"""
+    remaining = deadline - time.time()
+    if remaining > 0:
+        socketio.sleep(remaining)
+    
+    prompt_coalescer.flush(session_id)
+    if game_manager.expire_session(session_id, deadline):
+        socketio.emit('game_stopped', {'session_id': session_id, 'reason': 'time_up'},
+                      to=game_manager.audience_rooms(session_id))
+
+def finish_evaluated_session(session_id):
+    """Archive a session whose result was saved, stopping it first if it is still running"""
+    fields = game_manager.state.get_session_fields(session_id)
+    if fields is None:
+        return
+    prompt_coalescer.flush(session_id)
+    # Stopped like an expired session, so only one of the two announces it
+    if fields['is_active'] and game_manager.expire_session(session_id, fields['deadline']):
+        socketio.emit('game_stopped', {'session_id': session_id, 'reason': 'evaluated'},
+                      to=game_manager.audience_rooms(session_id))
+    game_manager.archive_session(session_id, persisted=True)
+
+def schedule_session_expiry(session_id, deadline):
+    """Schedule the single expiry task for a session"""
+    if deadline is not None:
+        socketio.start_background_task(expire_session_at, session_id, deadline)
 
 class LLMEvaluator:
-    """Handles LLM evaluation using OpenAI"""
+    """Handles LLM evaluation through the concurrent evaluation engine"""
     
     @staticmethod
-    def evaluate_prompts(question, prompts):
-        """Evaluate prompts using OpenAI LLM"""
-        try:
-            # Prepare evaluation prompt
-            evaluation_prompt = f"""
-            Question: {question}
-            
-            Please evaluate the following prompts and provide analysis:
-            
-            """
-            
-            for i, (player, prompt) in enumerate(prompts.items(), 1):
-                evaluation_prompt += f"Player {i} ({player}): {prompt}\n"
-            
-            evaluation_prompt += "\nProvide detailed analysis of each prompt's effectiveness, creativity, and relevance to the question."
-            
-            # Note: Uncomment and configure when you have OpenAI API key
-            # response = openai.ChatCompletion.create(
-            #     model="gpt-3.5-turbo",
-            #     messages=[
-            #         {"role": "system", "content": "You are an expert prompt evaluator."},
-            #         {"role": "user", "content": evaluation_prompt}
-            #     ]
-            # )
-            # 
-            # return response.choices[0].message.content
-            
-            # Mock response for demonstration
-            return f"Mock evaluation for question: {question}\nPrompts evaluated: {len(prompts)}"
-            
-        except Exception as e:
-            return f"Error in evaluation: {str(e)}"
+    def evaluate_prompts(question, prompts, on_result=None, on_chunk=None):
+        """Score each player's prompt and return per-player results, best first"""
+        return evaluation_engine.evaluate(question, prompts, on_result, on_chunk)
 
 # Routes
 @app.route('/')
@@ -279,17 +835,50 @@ def playground():
                          user_type=session.get('user_type'),
                          user_name=session.get('user_name', ''))
 
+# Only one CSV import runs at a time
+import_lock = threading.Lock()
+
 @app.route('/import-users', methods=['POST'])
 def import_users():
     """Import users from CSV"""
     if session.get('user_type') != 'admin':
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
+    if not import_lock.acquire(blocking=False):
+        return jsonify({'success': False, 'message': 'An import is already running'})
+    
+    socketio.start_background_task(run_user_import)
+    return jsonify({'success': True, 'message': 'Import started'})
+
+def run_user_import():
+    """Import users in the background and report progress to admins"""
+    # The import runs off the event loop, so progress is handed over through
+    # a plain dict and emitted from here rather than from the worker thread
+    latest = {}
+    finished = threading.Event()
+    
+    def relay_progress():
+        reported = None
+        while True:
+            socketio.sleep(IMPORT_PROGRESS_INTERVAL)
+            if finished.is_set():
+                break
+            counts = dict(latest)
+            if counts and counts != reported:
+                socketio.emit('import_progress', counts, to=ADMIN_ROOM)
+                reported = counts
+    
+    socketio.start_background_task(relay_progress)
     try:
-        users = UserManager.import_users_from_csv()
-        return jsonify({'success': True, 'message': f'Imported {len(users)} users'})
+        counts = UserManager.import_users_from_csv(progress=latest.update)
+        message = (f"Imported {counts['inserted']} new and {counts['updated']} updated users "
+                   f"({counts['unchanged']} unchanged)")
+        socketio.emit('import_done', dict(counts, success=True, message=message), to=ADMIN_ROOM)
     except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+        socketio.emit('import_done', {'success': False, 'message': str(e)}, to=ADMIN_ROOM)
+    finally:
+        finished.set()
+        import_lock.release()
 
 @app.route('/add-question', methods=['POST'])
 def add_question():
@@ -320,6 +909,40 @@ def get_users():
     users = UserManager.get_all_users()
     return jsonify({'users': users})
 
+@app.route('/users/search')
+def search_users():
+    """Users whose name or email matches q, one page at a time"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    is_technical = request.args.get('is_technical')
+    if is_technical is not None:
+        flags = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
+        if is_technical.lower() not in flags:
+            return jsonify({'success': False, 'message': 'is_technical must be true or false'}), 400
+        is_technical = flags[is_technical.lower()]
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', USER_SEARCH_PAGE_SIZE, type=int)
+    if page < 1 or not 1 <= page_size <= MAX_USER_SEARCH_PAGE_SIZE:
+        return jsonify({'success': False, 'message': f"page must be at least 1 and page_size 1 to {MAX_USER_SEARCH_PAGE_SIZE}"}), 400
+    
+    users = DataManager.search_users(request.args.get('q', ''), is_technical, page, page_size)
+    return jsonify(dict(users, success=True))
+
+@app.route('/questions/search')
+def search_questions():
+    """Questions matching q, best first, one page at a time"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', QUESTION_SEARCH_PAGE_SIZE, type=int)
+    if page < 1 or not 1 <= page_size <= MAX_QUESTION_SEARCH_PAGE_SIZE:
+        return jsonify({'success': False, 'message': f"page must be at least 1 and page_size 1 to {MAX_QUESTION_SEARCH_PAGE_SIZE}"}), 400
+    
+    questions = DataManager.search_questions(request.args.get('q', ''), page, page_size)
+    return jsonify(dict(questions, success=True))
+
 @app.route('/start-game', methods=['POST'])
 def start_game():
     """Start game session"""
@@ -336,15 +959,23 @@ def start_game():
     question = QuestionManager.get_question_by_id(question_id)
     
     if question:
-        game_manager.create_session(session_id, question, timer_duration, selected_players)
-        game_manager.start_session(session_id)
+        ensure_session_sweeper()
+        if not game_manager.create_session(session_id, question, timer_duration, selected_players):
+            return jsonify({'success': False, 'message': 'Too many game sessions in progress, try again later'}), 503
+        deadline = game_manager.start_session(session_id)
+        if deadline is None and game_manager.state.get_session_fields(session_id) is None:
+            return jsonify({'success': False, 'message': 'Game session could not be started'}), 500
+        schedule_session_expiry(session_id, deadline)
         
-        # Emit game start to all clients
+        # Only the selected players and admins hear about the new game. Clients
+        # count down locally to the deadline, corrected by server_time.
         socketio.emit('game_started', {
             'session_id': session_id,
             'question': question['text'],
-            'timer_duration': timer_duration
-        })
+            'timer_duration': timer_duration,
+            'deadline': deadline,
+            'server_time': time.time()
+        }, to=game_manager.invite_rooms(session_id))
         
         return jsonify({'success': True, 'session_id': session_id})
     else:
@@ -359,49 +990,291 @@ def stop_game():
     session_id = request.json.get('session_id')
     
     if session_id:
+        # Make sure the final text of every prompt is applied before stopping
+        prompt_coalescer.flush(session_id)
         game_manager.stop_session(session_id)
-        socketio.emit('game_stopped', {'session_id': session_id})
+        socketio.emit('game_stopped', {'session_id': session_id},
+                      to=game_manager.audience_rooms(session_id))
         return jsonify({'success': True})
     else:
         return jsonify({'success': False, 'message': 'Session ID required'})
 
+def flush_evaluation_chunks(job_id, chunks):
+    """Send buffered evaluation output to admins"""
+    socketio.emit('evaluation_chunk', {
+        'job_id': job_id,
+        'session_id': next(iter(chunks.values()))['session_id'],
+        'chunks': [{'player': player, 'attempt': chunk['attempt'], 'text': chunk['text']}
+                   for player, chunk in chunks.items()]
+    }, to=ADMIN_ROOM)
+
+# Streamed evaluation output is buffered per job and flushed every
+# EVAL_STREAM_FLUSH_MS instead of emitting every token
+chunk_coalescer = PromptCoalescer(EVAL_STREAM_FLUSH_MS / 1000, flush_evaluation_chunks,
+                                  start_task=socketio.start_background_task, sleep=socketio.sleep)
+
+def run_evaluation_job(job, report):
+    """Evaluate a battle's prompts and save the result
+    
+    The result carries the job id. A job retried after its worker died is
+    only saved again if no earlier attempt saved it already.
+    """
+    payload = job['payload']
+    prompts = payload['prompts']
+    
+    if job['attempts'] > 1:
+        saved = DataManager.find_recent_result('job_id', job['id'],
+                                               datetime.fromtimestamp(job['created_at']).isoformat())
+        if saved is not None:
+            finish_evaluated_session(payload['session_id'])
+            return evaluation_job_result(payload['session_id'], saved['evaluation'])
+    
+    done = []
+    
+    def on_result(entry):
+        done.append(entry['player'])
+        report({'completed': len(done), 'total': len(prompts), 'player': entry['player'],
+                'status': entry['status']})
+    
+    def on_chunk(player, attempt, text):
+        chunk_coalescer.submit(job['id'], player, {
+            'session_id': payload['session_id'],
+            'attempt': attempt,
+            'text': text
+        }, merge=merge_chunks)
+    
+    try:
+        evaluation = LLMEvaluator.evaluate_prompts(payload['question'], prompts, on_result,
+                                                   on_chunk if EVAL_STREAM else None)
+    finally:
+        # Admins get the last buffered output before evaluation_done
+        chunk_coalescer.flush(job['id'])
+    
+    DataManager.append_result({
+        'job_id': job['id'],
+        'session_id': payload['session_id'],
+        'question_id': payload.get('question_id'),
+        'question': payload['question'],
+        'prompts': prompts,
+        'evaluation': evaluation,
+        'timestamp': datetime.now().isoformat()
+    })
+    finish_evaluated_session(payload['session_id'])
+    return evaluation_job_result(payload['session_id'], evaluation)
+
+def evaluation_job_result(session_id, evaluation):
+    """What an evaluation job returns to admins"""
+    return {
+        'session_id': session_id,
+        'evaluation': evaluation,
+        'failed': sum(1 for entry in evaluation if entry['status'] != 'ok'),
+        'cached': sum(1 for entry in evaluation if entry.get('cached'))
+    }
+
+def emit_evaluation_progress(job, progress):
+    """Tell admins how far an evaluation job has got"""
+    socketio.emit('evaluation_progress', dict(progress, job_id=job['id'],
+                                              session_id=job['payload']['session_id']), to=ADMIN_ROOM)
+
+def emit_evaluation_done(job):
+    """Tell admins an evaluation job finished"""
+    socketio.emit('evaluation_done', {
+        'job_id': job['id'],
+        'session_id': job['payload']['session_id'],
+        'status': job['status'],
+        'result': job.get('result'),
+        'error': job.get('error')
+    }, to=ADMIN_ROOM)
+
+job_queue = BlockingCalls(JobQueue(JOBS_DB_FILE), ('submit', 'get', 'claim', 'heartbeat', 'set_progress',
+                                                    'complete', 'fail', 'counts'))
+job_workers = JobWorkerPool(job_queue, {'evaluate': run_evaluation_job}, workers=EVAL_WORKERS,
+                            on_progress=emit_evaluation_progress, on_done=emit_evaluation_done,
+                            start_task=socketio.start_background_task, sleep=socketio.sleep)
+# Workers start in the process that serves requests: when run as a script, or
+# on the first request under any other server. Importing the app starts
+# nothing, so the reloader's watcher process never claims jobs it cannot
+# report to clients.
+
+@app.before_request
+def ensure_job_workers():
+    """Start the job workers in the serving process"""
+    job_workers.start()
+
 @app.route('/evaluate-prompts', methods=['POST'])
 def evaluate_prompts():
-    """Evaluate prompts using LLM"""
+    """Queue an evaluation of a session's prompts and return the job id"""
     if session.get('user_type') != 'admin':
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
     session_id = request.json.get('session_id')
+    prompt_coalescer.flush(session_id)
     
-    if session_id in game_manager.active_sessions:
-        session_data = game_manager.active_sessions[session_id]
-        question = session_data['question']['text']
-        prompts = session_data['player_prompts']
-        
-        evaluation = LLMEvaluator.evaluate_prompts(question, prompts)
-        
-        # Save results
-        result = {
+    session_data = game_manager.get_session(session_id)
+    if session_data is not None:
+        # The job carries its own copy of the prompts, so it can still run
+        # after a restart or once the session has been evicted
+        job_id = job_queue.submit('evaluate', {
             'session_id': session_id,
-            'question': question,
-            'prompts': prompts,
-            'evaluation': evaluation,
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        results = DataManager.load_results()
-        results.append(result)
-        DataManager.save_results(results)
-        
-        return jsonify({'success': True, 'evaluation': evaluation})
+            'question_id': session_data['question'].get('id'),
+            'question': session_data['question']['text'],
+            'prompts': session_data['player_prompts']
+        })
+        return jsonify({'success': True, 'job_id': job_id, 'status': 'queued'})
     else:
         return jsonify({'success': False, 'message': 'Session not found'})
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status, progress and result of a background job"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/leaderboard')
+def leaderboard_stats():
+    """Per-player and per-question stats across all saved games"""
+    if 'user_type' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    sort = request.args.get('sort', 'wins')
+    if sort not in Leaderboard.SORT_KEYS:
+        return jsonify({'success': False, 'message': f"sort must be one of {', '.join(Leaderboard.SORT_KEYS)}"}), 400
+    limit = request.args.get('limit', type=int)
+    
+    return jsonify({
+        'success': True,
+        'players': DataManager.leaderboard_players(sort, limit),
+        'questions': DataManager.leaderboard_questions()
+    })
+
+@app.route('/results')
+def results_history():
+    """Saved results, filtered, sorted and one page at a time
+    
+    Pass the next_cursor of a page as cursor to get the page after it.
+    Players only see the games they played in.
+    """
+    if 'user_type' not in session:
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    sort = request.args.get('sort', 'newest')
+    if sort not in ResultHistory.SORTS:
+        return jsonify({'success': False, 'message': f"sort must be one of {', '.join(ResultHistory.SORTS)}"}), 400
+    page_size = request.args.get('page_size', RESULTS_PAGE_SIZE, type=int)
+    if not 1 <= page_size <= MAX_RESULTS_PAGE_SIZE:
+        return jsonify({'success': False, 'message': f"page_size must be 1 to {MAX_RESULTS_PAGE_SIZE}"}), 400
+    
+    player = request.args.get('player')
+    if session.get('user_type') != 'admin':
+        player = str(session.get('user_id'))
+    
+    try:
+        results = DataManager.query_results(
+            since=request.args.get('since'), until=request.args.get('until'),
+            question_id=request.args.get('question_id'), player=player,
+            sort=sort, cursor=request.args.get('cursor'), page_size=page_size
+        )
+    except ValueError:
+        return jsonify({'success': False, 'message': 'since and until must be ISO dates or datetimes, '
+                                                     'and cursor the next_cursor of a page with the same sort'}), 400
+    
+    return jsonify(dict(results, success=True))
+
+@app.route('/players/suggest')
+def suggest_players():
+    """Suggest evenly matched players for the next battle by rating"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    count = request.args.get('count', 2, type=int)
+    around = request.args.get('around')
+    users = {str(user['user_id']): user for user in DataManager.get_users()}
+    if around is not None and around not in users:
+        return jsonify({'success': False, 'message': 'Player not found'}), 404
+    
+    suggested = DataManager.suggest_players(users.keys(), count, around)
+    if not suggested:
+        return jsonify({'success': False, 'message': f"Cannot pick {count} of {len(users)} players"}), 400
+    
+    return jsonify({
+        'success': True,
+        'players': [
+            dict(entry, fullname=users[entry['player']]['fullname'], emailid=users[entry['player']]['emailid'])
+            for entry in suggested
+        ]
+    })
+
+@app.route('/session-stats')
+def session_stats():
+    """Memory usage of the in-process session table"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    return jsonify({'success': True, 'stats': game_manager.memory_stats()})
+
+@app.route('/eval-cache-stats')
+def eval_cache_stats():
+    """Hit and miss counters of the evaluation cache"""
+    if session.get('user_type') != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    return jsonify({'success': True, 'stats': evaluation_cache.stats()})
+
 # WebSocket events
+@socketio.on('connect')
+def on_connect():
+    """Put admins in the admin room and players in their own room"""
+    if session.get('user_type') == 'admin':
+        join_room(ADMIN_ROOM)
+    elif session.get('user_id'):
+        join_room(player_room(session.get('user_id')))
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    """Drop the connection from every game session it joined"""
+    game_manager.remove_connection(request.sid)
+
+@socketio.on('join_game')
+def on_join_game(data):
+    """Join a game session as a selected player or as a monitoring admin"""
+    session_id = data.get('session_id')
+    
+    if game_manager.get_session(session_id) is None:
+        emit('join_error', {'session_id': session_id, 'message': 'Session not found'})
+    elif session.get('user_type') == 'admin':
+        join_room(monitor_room(session_id))
+        game_manager.add_member(session_id, request.sid, monitor_room(session_id))
+        emit('game_joined', {'session_id': session_id, 'role': 'monitor'})
+    elif game_manager.is_selected(session_id, session.get('user_id')):
+        join_room(game_room(session_id))
+        game_manager.add_member(session_id, request.sid, game_room(session_id))
+        emit('game_joined', {'session_id': session_id, 'role': 'player'})
+    else:
+        emit('join_error', {'session_id': session_id, 'message': 'You are not selected for this game'})
+
+@socketio.on('leave_game')
+def on_leave_game(data):
+    """Leave a game session's rooms"""
+    session_id = data.get('session_id')
+    leave_room(game_room(session_id))
+    leave_room(monitor_room(session_id))
+    game_manager.remove_member(session_id, request.sid)
+
+def is_reserved_room(room):
+    """Game, monitor, player and admin rooms are managed by the server"""
+    return room == ADMIN_ROOM or room.startswith(('game:', 'monitor:', 'user:'))
+
 @socketio.on('join_room')
 def on_join(data):
     """Handle user joining room"""
     room = data['room']
+    if is_reserved_room(room):
+        return
     join_room(room)
     emit('status', {'msg': f'{session.get("user_name", "User")} has entered the room.'}, room=room)
 
@@ -419,21 +1292,85 @@ def handle_prompt_update(data):
     player_id = session.get('user_id')
     prompt = data.get('prompt', '')
     
-    if session_id and player_id:
-        game_manager.update_player_prompt(session_id, player_id, prompt)
+    if session_id and player_id and game_manager.is_selected(session_id, player_id):
+        version = game_manager.update_player_prompt(session_id, player_id, prompt)
+        if version is None:
+            return {'version': None}
         
-        # Emit to admin for real-time monitoring
-        emit('prompt_updated', {
+        # Keystrokes are merged and sent to the session's monitors in batches
+        prompt_coalescer.submit(session_id, player_id, {
             'player_id': player_id,
             'player_name': session.get('user_name'),
-            'prompt': prompt
-        }, broadcast=True)
+            'prompt': prompt,
+            'version': version
+        }, merge=merge_updates)
+        return {'version': version}
 
-@socketio.on('timer_update')
-def handle_timer_update(data):
-    """Handle timer updates"""
-    if session.get('user_type') == 'admin':
-        emit('timer_sync', data, broadcast=True)
+@socketio.on('patch_prompt')
+def handle_prompt_patch(data):
+    """Handle a delta update (base_version, offset, delete_len, insert_text)"""
+    session_id = data.get('session_id')
+    player_id = session.get('user_id')
+    
+    if not (session_id and player_id and game_manager.is_selected(session_id, player_id)):
+        return None
+    
+    base_version = data.get('base_version')
+    patch = {
+        'offset': data.get('offset'),
+        'delete_len': data.get('delete_len', 0),
+        'insert_text': data.get('insert_text', '')
+    }
+    version = game_manager.patch_player_prompt(session_id, player_id, base_version, **patch)
+    
+    if version is None:
+        # The client is out of sync, send it the full prompt to rebase on
+        prompt, version = game_manager.get_player_prompt(session_id, player_id)
+        emit('prompt_snapshot', {
+            'session_id': session_id,
+            'player_id': player_id,
+            'prompt': prompt,
+            'version': version
+        })
+        return {'ok': False, 'version': version}
+    
+    prompt_coalescer.submit(session_id, player_id, {
+        'player_id': player_id,
+        'player_name': session.get('user_name'),
+        'base_version': base_version,
+        'version': version,
+        'patches': [patch]
+    }, merge=merge_updates)
+    return {'ok': True, 'version': version}
+
+@socketio.on('request_prompt_snapshot')
+def handle_prompt_snapshot_request(data):
+    """Send every current prompt of a session to a monitor that lost track"""
+    session_id = data.get('session_id')
+    
+    session_data = game_manager.get_session(session_id) if session.get('user_type') == 'admin' else None
+    if session_data is not None:
+        updates = []
+        for player_id in session_data['player_ids']:
+            updates.append({
+                'player_id': player_id,
+                'prompt': session_data['player_prompts'].get(player_id, ''),
+                'version': session_data['prompt_versions'].get(player_id, 0)
+            })
+        emit('prompts_updated', {'session_id': session_id, 'updates': updates})
+
+@socketio.on('sync_timer')
+def handle_timer_sync(data):
+    """Send a session's deadline to a client that joined late or lost its clock"""
+    session_id = data.get('session_id')
+    session_data = game_manager.get_session(session_id)
+    if session_data:
+        emit('timer_sync', {
+            'session_id': session_id,
+            'deadline': session_data['deadline'],
+            'is_active': session_data['is_active'],
+            'server_time': time.time()
+        })
 
 if __name__ == '__main__':
     # Create sample CSV file if it doesn't exist
@@ -444,4 +1381,13 @@ if __name__ == '__main__':
             writer.writerow(['1', 'Nandhu', 'nandhu@python.com', '0123456789', 'yes'])
             writer.writerow(['2', 'Jane', 'jane@python.com', '0123456789', 'no'])
     
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    port = int(os.environ.get('PORT', '5000'))
+    # In debug mode the reloader runs the server in a child process and only
+    # watches files in this one, so jobs queued before a restart are resumed
+    # by the child
+    if SOCKETIO_ASYNC_MODE != 'threading' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_workers.start()
+    if SOCKETIO_ASYNC_MODE == 'threading':
+        socketio.run(app, debug=True, host='0.0.0.0', port=port)
+    else:
+        socketio.run(app, host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,501 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import native_locks
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Session fields that change over a session's lifetime; everything else
+# (question, players, timer) is fixed when the session is created
+SESSION_FIELDS = ('status', 'is_active', 'deadline', 'start_time', 'last_activity')
+
+def base_session_bytes(data):
+    """Rough size of a session without its prompts"""
+    return 512 + len(data['question'].get('text', '')) + 128 * len(data['player_ids'])
+
+def split_session(data):
+    """Split a new session into its lifecycle fields and its fixed data"""
+    fields = {field: data.get(field) for field in SESSION_FIELDS}
+    fixed = {key: value for key, value in data.items()
+             if key not in SESSION_FIELDS and key not in ('player_prompts', 'prompt_versions')}
+    return fields, fixed
+
+class GameStateStore:
+    """Interface for where GameManager keeps its sessions and prompts
+    
+    Every method is safe to call from several threads, and from several
+    processes for the shared backends. Conditional writes (expect= on
+    update_session, expected_version= on set_prompt) are atomic so workers
+    can race on the same session without losing updates.
+    """
+    
+    def create_session(self, session_id, data):
+        raise NotImplementedError
+    
+    def get_session(self, session_id):
+        """Full session with player_prompts and prompt_versions, or None"""
+        raise NotImplementedError
+    
+    def get_session_fields(self, session_id):
+        """Only the lifecycle fields of a session, or None"""
+        raise NotImplementedError
+    
+    def update_session(self, session_id, fields, expect=None):
+        """Set lifecycle fields if every expect field matches, return whether it did"""
+        raise NotImplementedError
+    
+    def delete_session(self, session_id):
+        raise NotImplementedError
+    
+    def list_sessions(self):
+        """Summary of every session, least recently active first"""
+        raise NotImplementedError
+    
+    def get_prompt(self, session_id, player_id):
+        """A player's prompt and its version"""
+        raise NotImplementedError
+    
+    def set_prompt(self, session_id, player_id, prompt, expected_version=None):
+        """Store a prompt and return its new version
+        
+        With expected_version the write only happens if the stored version
+        still matches, otherwise None is returned.
+        """
+        raise NotImplementedError
+    
+    def close(self):
+        pass
+
+class MemoryGameState(GameStateStore):
+    """Sessions in a dict, for a single worker process"""
+    
+    def __init__(self):
+        self.sessions = OrderedDict()
+        self._lock = native_locks.Lock()
+    
+    def create_session(self, session_id, data):
+        session_data = dict(data)
+        session_data.setdefault('player_prompts', {})
+        session_data.setdefault('prompt_versions', {})
+        with self._lock:
+            self.sessions[session_id] = session_data
+    
+    def get_session(self, session_id):
+        with self._lock:
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return None
+            session_data = dict(session_data)
+            session_data['player_prompts'] = dict(session_data['player_prompts'])
+            session_data['prompt_versions'] = dict(session_data['prompt_versions'])
+            return session_data
+    
+    def get_session_fields(self, session_id):
+        with self._lock:
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return None
+            return {field: session_data[field] for field in SESSION_FIELDS}
+    
+    def update_session(self, session_id, fields, expect=None):
+        with self._lock:
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return False
+            if expect and any(session_data.get(key) != value for key, value in expect.items()):
+                return False
+            session_data.update(fields)
+            if 'last_activity' in fields:
+                self.sessions.move_to_end(session_id)
+            return True
+    
+    def delete_session(self, session_id):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+    
+    def list_sessions(self):
+        with self._lock:
+            return [
+                {
+                    'session_id': session_id,
+                    'status': session_data['status'],
+                    'is_active': session_data['is_active'],
+                    'last_activity': session_data['last_activity'],
+                    'bytes': base_session_bytes(session_data) +
+                             sum(len(prompt) for prompt in session_data['player_prompts'].values())
+                }
+                for session_id, session_data in self.sessions.items()
+            ]
+    
+    def get_prompt(self, session_id, player_id):
+        with self._lock:
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return '', 0
+            return (session_data['player_prompts'].get(player_id, ''),
+                    session_data['prompt_versions'].get(player_id, 0))
+    
+    def set_prompt(self, session_id, player_id, prompt, expected_version=None):
+        with self._lock:
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return None
+            version = session_data['prompt_versions'].get(player_id, 0)
+            if expected_version is not None and version != expected_version:
+                return None
+            session_data['player_prompts'][player_id] = prompt
+            session_data['prompt_versions'][player_id] = version + 1
+            return version + 1
+
+class SQLiteGameState(GameStateStore):
+    """Sessions in an SQLite database shared by every worker on one host
+    
+    Prompts live in their own rows so a keystroke only rewrites one
+    player's prompt. Read-modify-write operations run inside BEGIN
+    IMMEDIATE so concurrent workers serialize on the database lock.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS game_sessions (
+            session_id TEXT PRIMARY KEY,
+            status TEXT,
+            is_active INTEGER,
+            deadline REAL,
+            start_time TEXT,
+            last_activity REAL,
+            base_bytes INTEGER NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_game_sessions_last_activity
+            ON game_sessions (last_activity);
+        
+        CREATE TABLE IF NOT EXISTS game_prompts (
+            session_id TEXT NOT NULL,
+            player_id TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (session_id, player_id)
+        );
+    """
+    
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._connections = []
+        self._lock = native_locks.Lock()
+        self._connect().executescript(self.SCHEMA)
+    
+    def _connect(self):
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None,
+                                   cached_statements=128, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    @staticmethod
+    def _encode(field, value):
+        if field == 'is_active':
+            return 1 if value else 0
+        return value
+    
+    @staticmethod
+    def _decode(row):
+        return {
+            'status': row[0],
+            'is_active': bool(row[1]),
+            'deadline': row[2],
+            'start_time': row[3],
+            'last_activity': row[4]
+        }
+    
+    def create_session(self, session_id, data):
+        fields, fixed = split_session(data)
+        self._connect().execute(
+            "INSERT OR REPLACE INTO game_sessions (session_id, status, is_active, deadline, "
+            "start_time, last_activity, base_bytes, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (session_id, fields['status'], self._encode('is_active', fields['is_active']),
+             fields['deadline'], fields['start_time'], fields['last_activity'],
+             base_session_bytes(data), json.dumps(fixed))
+        )
+    
+    def get_session(self, session_id):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT status, is_active, deadline, start_time, last_activity, data "
+            "FROM game_sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        
+        session_data = json.loads(row[5])
+        session_data.update(self._decode(row))
+        session_data['player_prompts'] = {}
+        session_data['prompt_versions'] = {}
+        for player_id, prompt, version in conn.execute(
+                "SELECT player_id, prompt, version FROM game_prompts WHERE session_id = ?",
+                (session_id,)):
+            session_data['player_prompts'][player_id] = prompt
+            session_data['prompt_versions'][player_id] = version
+        return session_data
+    
+    def get_session_fields(self, session_id):
+        row = self._connect().execute(
+            "SELECT status, is_active, deadline, start_time, last_activity "
+            "FROM game_sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        return self._decode(row) if row else None
+    
+    def update_session(self, session_id, fields, expect=None):
+        # Column names come from SESSION_FIELDS, never from the caller's data
+        assignments = [f"{field} = ?" for field in SESSION_FIELDS if field in fields]
+        params = [self._encode(field, fields[field]) for field in SESSION_FIELDS if field in fields]
+        conditions = ["session_id = ?"]
+        params.append(session_id)
+        for field in SESSION_FIELDS:
+            if expect and field in expect:
+                conditions.append(f"{field} IS ?")
+                params.append(self._encode(field, expect[field]))
+        
+        cursor = self._connect().execute(
+            f"UPDATE game_sessions SET {', '.join(assignments)} WHERE {' AND '.join(conditions)}",
+            params
+        )
+        return cursor.rowcount == 1
+    
+    def delete_session(self, session_id):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM game_prompts WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM game_sessions WHERE session_id = ?", (session_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def list_sessions(self):
+        rows = self._connect().execute(
+            "SELECT s.session_id, s.status, s.is_active, s.last_activity, "
+            "s.base_bytes + COALESCE(SUM(LENGTH(p.prompt)), 0) "
+            "FROM game_sessions s LEFT JOIN game_prompts p ON p.session_id = s.session_id "
+            "GROUP BY s.session_id ORDER BY s.last_activity"
+        )
+        return [
+            {
+                'session_id': row[0],
+                'status': row[1],
+                'is_active': bool(row[2]),
+                'last_activity': row[3],
+                'bytes': row[4]
+            }
+            for row in rows
+        ]
+    
+    def get_prompt(self, session_id, player_id):
+        row = self._connect().execute(
+            "SELECT prompt, version FROM game_prompts WHERE session_id = ? AND player_id = ?",
+            (session_id, player_id)
+        ).fetchone()
+        return (row[0], row[1]) if row else ('', 0)
+    
+    def set_prompt(self, session_id, player_id, prompt, expected_version=None):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM game_sessions WHERE session_id = ?",
+                            (session_id,)).fetchone() is None:
+                conn.execute("ROLLBACK")
+                return None
+            
+            row = conn.execute(
+                "SELECT version FROM game_prompts WHERE session_id = ? AND player_id = ?",
+                (session_id, player_id)
+            ).fetchone()
+            version = row[0] if row else 0
+            if expected_version is not None and version != expected_version:
+                conn.execute("ROLLBACK")
+                return None
+            
+            conn.execute(
+                "INSERT OR REPLACE INTO game_prompts (session_id, player_id, prompt, version) "
+                "VALUES (?, ?, ?, ?)",
+                (session_id, player_id, prompt, version + 1)
+            )
+            conn.execute("COMMIT")
+            return version + 1
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+class RedisGameState(GameStateStore):
+    """Sessions in Redis, shared by workers on any number of hosts
+    
+    Each session is a hash of JSON-encoded fields plus a hash of prompts,
+    and a sorted set keyed on last activity gives the LRU order.
+    Conditional writes use WATCH/MULTI and retry when another worker
+    touched the same keys in between.
+    """
+    
+    def __init__(self, url, prefix='promptbattle'):
+        if redis is None:
+            raise RuntimeError("The redis game state backend needs the 'redis' package installed")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+    
+    def _session_key(self, session_id):
+        return f"{self.prefix}:session:{session_id}"
+    
+    def _prompts_key(self, session_id):
+        return f"{self.prefix}:prompts:{session_id}"
+    
+    @property
+    def _index_key(self):
+        return f"{self.prefix}:sessions"
+    
+    def create_session(self, session_id, data):
+        fields, fixed = split_session(data)
+        mapping = {field: json.dumps(value) for field, value in fields.items()}
+        mapping['data'] = json.dumps(fixed)
+        mapping['base_bytes'] = base_session_bytes(data)
+        
+        pipe = self.client.pipeline()
+        pipe.delete(self._session_key(session_id), self._prompts_key(session_id))
+        pipe.hset(self._session_key(session_id), mapping=mapping)
+        pipe.zadd(self._index_key, {session_id: fields['last_activity'] or time.time()})
+        pipe.execute()
+    
+    def get_session(self, session_id):
+        pipe = self.client.pipeline()
+        pipe.hgetall(self._session_key(session_id))
+        pipe.hgetall(self._prompts_key(session_id))
+        raw, prompts = pipe.execute()
+        if not raw:
+            return None
+        
+        session_data = json.loads(raw['data'])
+        session_data.update({field: json.loads(raw[field]) for field in SESSION_FIELDS})
+        session_data['player_prompts'] = {}
+        session_data['prompt_versions'] = {}
+        for player_id, value in prompts.items():
+            prompt, version = json.loads(value)
+            session_data['player_prompts'][player_id] = prompt
+            session_data['prompt_versions'][player_id] = version
+        return session_data
+    
+    def get_session_fields(self, session_id):
+        values = self.client.hmget(self._session_key(session_id), list(SESSION_FIELDS))
+        if values[0] is None:
+            return None
+        return {field: json.loads(value) for field, value in zip(SESSION_FIELDS, values)}
+    
+    def update_session(self, session_id, fields, expect=None):
+        key = self._session_key(session_id)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    if not pipe.exists(key):
+                        return False
+                    if expect:
+                        current = pipe.hmget(key, list(expect))
+                        if any(json.loads(value) != expected
+                               for value, expected in zip(current, expect.values())):
+                            return False
+                    pipe.multi()
+                    pipe.hset(key, mapping={field: json.dumps(fields[field])
+                                            for field in SESSION_FIELDS if field in fields})
+                    if fields.get('last_activity'):
+                        pipe.zadd(self._index_key, {session_id: fields['last_activity']})
+                    pipe.execute()
+                    return True
+                except redis.WatchError:
+                    continue
+    
+    def delete_session(self, session_id):
+        pipe = self.client.pipeline()
+        pipe.delete(self._session_key(session_id), self._prompts_key(session_id))
+        pipe.zrem(self._index_key, session_id)
+        pipe.execute()
+    
+    def list_sessions(self):
+        session_ids = self.client.zrange(self._index_key, 0, -1)
+        pipe = self.client.pipeline()
+        for session_id in session_ids:
+            pipe.hmget(self._session_key(session_id), 'status', 'is_active', 'last_activity', 'base_bytes')
+            pipe.hvals(self._prompts_key(session_id))
+        replies = pipe.execute()
+        
+        sessions = []
+        for session_id, (status, is_active, last_activity, base_bytes), prompts in zip(
+                session_ids, replies[0::2], replies[1::2]):
+            if status is None:
+                continue
+            sessions.append({
+                'session_id': session_id,
+                'status': json.loads(status),
+                'is_active': json.loads(is_active),
+                'last_activity': json.loads(last_activity),
+                'bytes': int(base_bytes) + sum(len(json.loads(value)[0]) for value in prompts)
+            })
+        return sessions
+    
+    def get_prompt(self, session_id, player_id):
+        value = self.client.hget(self._prompts_key(session_id), player_id)
+        if value is None:
+            return '', 0
+        prompt, version = json.loads(value)
+        return prompt, version
+    
+    def set_prompt(self, session_id, player_id, prompt, expected_version=None):
+        session_key = self._session_key(session_id)
+        prompts_key = self._prompts_key(session_id)
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(session_key, prompts_key)
+                    if not pipe.exists(session_key):
+                        return None
+                    value = pipe.hget(prompts_key, player_id)
+                    version = json.loads(value)[1] if value else 0
+                    if expected_version is not None and version != expected_version:
+                        return None
+                    pipe.multi()
+                    pipe.hset(prompts_key, player_id, json.dumps([prompt, version + 1]))
+                    pipe.execute()
+                    return version + 1
+                except redis.WatchError:
+                    continue
+    
+    def close(self):
+        self.client.close()
+
+def create_game_state(kind, url=None):
+    """Create the game state backend selected by configuration"""
+    if kind == 'memory':
+        return MemoryGameState()
+    if kind == 'sqlite':
+        return SQLiteGameState(url or 'game_state.db')
+    if kind == 'redis':
+        return RedisGameState(url or 'redis://localhost:6379/0')
+    raise ValueError(f"Unknown game state backend: {kind}")
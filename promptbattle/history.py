@@ -0,0 +1,266 @@
+import base64
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import native_locks
+from leaderboard import scored_entries
+
+def time_bounds(since=None, until=None):
+    """Lower and exclusive upper timestamp bounds for a date or datetime range
+    
+    Both ends are ISO strings. A bare date as until includes that whole
+    day. Raises ValueError for anything else.
+    """
+    lower = upper = None
+    if since:
+        lower = datetime.fromisoformat(since).isoformat()
+    if until:
+        end = datetime.fromisoformat(until)
+        # A date covers the whole day, a datetime is included itself
+        end += timedelta(days=1) if len(until) == 10 else timedelta(microseconds=1)
+        upper = end.isoformat()
+    return lower, upper
+
+def encode_cursor(sort, key, position):
+    """Opaque cursor for the page after a result with this sort key and position"""
+    return base64.urlsafe_b64encode(json.dumps([sort, key, position]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, sort):
+    """Sort key and position from a cursor made for the same sort
+    
+    Raises ValueError for anything else.
+    """
+    try:
+        cursor_sort, key, position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+    if cursor_sort != sort or not isinstance(position, int):
+        raise ValueError(f"cursor does not belong to sort {sort!r}")
+    return key, position
+
+class ResultHistory:
+    """Index of saved results for filtered, paginated history queries
+    
+    Each result gets one row with its timestamp, question id and best
+    score, plus one row per player, in SQLite next to the count and
+    generation of the results indexed. refresh() indexes only the results saved since,
+    like RatingBook. query() pages through the index with a cursor, the
+    sort key and position of the last result on the previous page, and
+    then reads just the results on the page by position, so every page
+    costs O(page size) however far into the history it is.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            position INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            question_id TEXT,
+            top_score REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp, position);
+        CREATE INDEX IF NOT EXISTS idx_history_question ON history (question_id, timestamp, position);
+        CREATE INDEX IF NOT EXISTS idx_history_top_score ON history (top_score, position);
+        
+        CREATE TABLE IF NOT EXISTS history_players (
+            player TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (player, timestamp, position)
+        ) WITHOUT ROWID;
+        
+        CREATE TABLE IF NOT EXISTS history_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO history_meta (key, value) VALUES ('results', 0);
+        INSERT OR IGNORE INTO history_meta (key, value) VALUES ('generation', 0);
+    """
+    
+    # Sort key, tie breaker and direction; {t} is the table whose timestamp
+    # index serves the query
+    SORTS = {
+        'newest': ('{t}.timestamp', '{t}.position', 'DESC'),
+        'oldest': ('{t}.timestamp', '{t}.position', 'ASC'),
+        'top_score': ('h.top_score', 'h.position', 'DESC')
+    }
+    # Sorts whose key can be NULL, which SQLite puts last in descending order
+    NULLABLE_SORTS = {'top_score'}
+    
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._connections = []
+        self._lock = native_locks.Lock()
+        self._connect().executescript(self.SCHEMA)
+    
+    def _connect(self):
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _state(self, conn):
+        """Generation of the indexed results and how many of them are indexed"""
+        meta = dict(conn.execute("SELECT key, value FROM history_meta"))
+        return meta['generation'], meta['results']
+    
+    def refresh(self, storage):
+        """Index the results saved since the last refresh and return how many are indexed"""
+        state = (storage.results_generation(), storage.count_results())
+        if self._state(self._connect()) == state:
+            return state[1]
+        return self._update(storage)
+    
+    def rebuild(self, storage):
+        """Index every result again from scratch"""
+        return self._update(storage, reset=True)
+    
+    def _update(self, storage, reset=False):
+        """Index the results not indexed yet, all of them with reset or once they were replaced"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Read only now: another worker may have caught up, or appended
+            # more results, while this one waited for the lock
+            generation = storage.results_generation()
+            indexed_generation, applied = self._state(conn)
+            if reset or indexed_generation != generation:
+                # The results were replaced, index them again from the start
+                conn.execute("DELETE FROM history")
+                conn.execute("DELETE FROM history_players")
+                applied = 0
+            
+            question_ids = None
+            rows, player_rows = [], []
+            for result in storage.iter_results(applied):
+                question_id = result.get('question_id')
+                if question_id is None and result.get('question'):
+                    # Results saved before question ids were recorded are
+                    # matched to a question by its text
+                    if question_ids is None:
+                        question_ids = {}
+                        for question in storage.get_questions():
+                            question_ids.setdefault(question['text'], question['id'])
+                    question_id = question_ids.get(result['question'])
+                
+                timestamp = result.get('timestamp') or ''
+                scores = [entry['total_score'] for entry in scored_entries(result)]
+                rows.append((applied, timestamp, question_id, max(scores) if scores else None))
+                player_rows.extend((str(player), timestamp, applied) for player in result.get('prompts') or {})
+                applied += 1
+            
+            conn.executemany(
+                "INSERT OR REPLACE INTO history (position, timestamp, question_id, top_score) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO history_players (player, timestamp, position) VALUES (?, ?, ?)",
+                player_rows
+            )
+            conn.execute("UPDATE history_meta SET value = ? WHERE key = 'results'", (applied,))
+            conn.execute("UPDATE history_meta SET value = ? WHERE key = 'generation'", (generation,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return applied
+    
+    def query(self, storage, since=None, until=None, question_id=None, player=None,
+              sort='newest', cursor=None, page_size=20, total_limit=1000):
+        """One page of results matching the filters, and the cursor of the next page
+        
+        since and until are ISO dates or datetimes, see time_bounds().
+        cursor is the next_cursor of the previous page, None for the first;
+        next_cursor is None on the last page. player is one key or a list
+        of the keys a player's games are saved under, such as a user id
+        and a name. Each result on the page carries its position in the
+        results log. Matches are counted up to
+        total_limit only; total_exact is False when there are more, and
+        total is None when total_limit is None. Raises ValueError for
+        invalid dates or cursors.
+        """
+        lower, upper = time_bounds(since, until)
+        after = decode_cursor(cursor, sort) if cursor is not None else None
+        self.refresh(storage)
+        
+        tables, table, where, params = 'history h', 'h', [], []
+        distinct = ''
+        if player is not None:
+            # A single player's own index rows are already in timestamp order
+            players = [str(key) for key in player] if isinstance(player, (list, tuple)) else [str(player)]
+            tables += ' JOIN history_players p ON p.position = h.position'
+            table = 'p'
+            where.append(f"p.player IN ({', '.join('?' * len(players))})")
+            params.extend(players)
+            if len(players) > 1:
+                # A game that has the player under two keys is listed once
+                distinct = 'DISTINCT '
+        if question_id is not None:
+            where.append('h.question_id = ?')
+            params.append(question_id)
+        if lower is not None:
+            where.append(f'{table}.timestamp >= ?')
+            params.append(lower)
+        if upper is not None:
+            where.append(f'{table}.timestamp < ?')
+            params.append(upper)
+        condition = f" WHERE {' AND '.join(where)}" if where else ''
+        
+        conn = self._connect()
+        total = None
+        if total_limit is not None:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM (SELECT {distinct}h.position FROM {tables}{condition} LIMIT ?)",
+                params + [total_limit + 1]
+            ).fetchone()[0]
+        
+        # Rows after the cursor in sort order, each range read along an index
+        key, tie, direction = (column.format(t=table) for column in self.SORTS[sort])
+        op = '<' if direction == 'DESC' else '>'
+        ranges = [([], [])]
+        if after is not None and after[0] is None:
+            ranges = [([f'{key} IS NULL', f'{tie} {op} ?'], [after[1]])]
+        elif after is not None:
+            ranges = [([f'({key}, {tie}) {op} (?, ?)'], list(after))]
+            if sort in self.NULLABLE_SORTS:
+                # The comparison skips NULL keys, which come after all others
+                ranges.append(([f'{key} IS NULL'], []))
+        
+        rows = []
+        for range_where, range_params in ranges:
+            if len(rows) > page_size:
+                break
+            condition = f" WHERE {' AND '.join(where + range_where)}" if where or range_where else ''
+            rows += conn.execute(
+                f"SELECT {distinct}h.position, {key} FROM {tables}{condition} "
+                f"ORDER BY {key} {direction}, {tie} {direction} LIMIT ?",
+                params + range_params + [page_size + 1 - len(rows)]
+            ).fetchall()
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor(sort, rows[-1][1], rows[-1][0])
+        
+        return {
+            'total': min(total, total_limit) if total is not None else None,
+            'total_exact': total is not None and total <= total_limit,
+            'page_size': page_size,
+            'next_cursor': next_cursor,
+            'results': [dict(storage.get_result(position), position=position) for position, _ in rows]
+        }
+    
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
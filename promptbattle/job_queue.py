@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import native_locks
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """Persistent job queue in SQLite, shared by every worker process
+    
+    Jobs go queued -> running -> done or failed. A running job is leased
+    to one worker for lease seconds and the worker keeps renewing the
+    lease while it works. If the worker dies, including on a restart, the
+    lease runs out and the job is claimed again, up to max_attempts times.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            owner TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+    """
+    
+    COLUMNS = ('id', 'kind', 'payload', 'status', 'progress', 'result', 'error',
+               'attempts', 'created_at', 'started_at', 'finished_at')
+    
+    def __init__(self, db_file, lease=30.0, max_attempts=3):
+        self.db_file = db_file
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._connections = []
+        self._lock = native_locks.Lock()
+        self._connect().executescript(self.SCHEMA)
+    
+    def _connect(self):
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _job_dict(self, row):
+        job = dict(zip(self.COLUMNS, row))
+        for field in ('payload', 'progress', 'result'):
+            if job[field] is not None:
+                job[field] = json.loads(job[field])
+        return job
+    
+    def submit(self, kind, payload):
+        """Queue a job and return its id"""
+        job_id = str(uuid.uuid4())
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+            (job_id, kind, json.dumps(payload), time.time())
+        )
+        return job_id
+    
+    def get(self, job_id):
+        """A job's current state, or None"""
+        row = self._connect().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._job_dict(row) if row else None
+    
+    def claim(self, owner):
+        """Lease the oldest runnable job to owner and return it, or None"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    f"SELECT {', '.join(self.COLUMNS)} FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                
+                job = self._job_dict(row)
+                if job['attempts'] >= self.max_attempts:
+                    # The job keeps taking its worker down, stop retrying it
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, owner = NULL "
+                        "WHERE id = ?",
+                        (f"Gave up after {job['attempts']} attempts", now, job['id'])
+                    )
+                    continue
+                
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (owner, now + self.lease, now, job['id'])
+                )
+                conn.execute("COMMIT")
+                job.update(status='running', attempts=job['attempts'] + 1, started_at=now)
+                return job
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    
+    def heartbeat(self, job_ids, owner):
+        """Renew the lease on jobs this owner is still working on"""
+        expires = time.time() + self.lease
+        self._connect().executemany(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND owner = ? AND status = 'running'",
+            [(expires, job_id, owner) for job_id in job_ids]
+        )
+    
+    def set_progress(self, job_id, owner, progress):
+        """Record progress of a running job"""
+        self._connect().execute(
+            "UPDATE jobs SET progress = ?, lease_expires = ? WHERE id = ? AND owner = ?",
+            (json.dumps(progress), time.time() + self.lease, job_id, owner)
+        )
+    
+    def complete(self, job_id, owner, result):
+        """Mark a job done with its result"""
+        self._connect().execute(
+            "UPDATE jobs SET status = 'done', result = ?, finished_at = ?, owner = NULL "
+            "WHERE id = ? AND owner = ?",
+            (json.dumps(result), time.time(), job_id, owner)
+        )
+    
+    def fail(self, job_id, owner, error):
+        """Mark a job failed"""
+        self._connect().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, owner = NULL "
+            "WHERE id = ? AND owner = ?",
+            (error, time.time(), job_id, owner)
+        )
+    
+    def counts(self):
+        """Number of jobs in each status"""
+        return dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+    
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+class JobWorkerPool:
+    """Runs queued jobs on a fixed number of background workers
+    
+    handlers maps a job kind to handler(job, report), where report
+    records a progress dict. on_progress(job, progress) and on_done(job)
+    are called from the worker so the app can forward them to clients.
+    start_task and sleep default to threads, and can be swapped for the
+    Socket.IO server's so the pool also works under eventlet or gevent.
+    """
+    
+    def __init__(self, queue, handlers, workers=2, poll_interval=0.5, on_progress=None,
+                 on_done=None, start_task=None, sleep=time.sleep):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.start_task = start_task or self._start_thread
+        self.sleep = sleep
+        self.owner = str(uuid.uuid4())
+        self.running = set()
+        self._started_pid = None
+        self._lock = native_locks.Lock()
+    
+    @staticmethod
+    def _start_thread(target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+    
+    def start(self):
+        """Start the workers and the lease heartbeat, once per process
+        
+        A server that forks workers after importing the app starts them
+        again in each worker, where the parent's threads do not exist.
+        """
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        for _ in range(self.workers):
+            self.start_task(self._work)
+        self.start_task(self._heartbeat)
+    
+    def _heartbeat(self):
+        while True:
+            self.sleep(self.queue.lease / 3)
+            with self._lock:
+                running = list(self.running)
+            if running:
+                try:
+                    self.queue.heartbeat(running, self.owner)
+                except Exception:
+                    logger.exception("Could not renew job leases")
+    
+    def _work(self):
+        # A failure here, e.g. a locked database, must not end the worker
+        # or the pool runs short until the next restart
+        while True:
+            try:
+                job = self.queue.claim(self.owner)
+                if job is not None:
+                    self.run(job)
+                    continue
+            except Exception:
+                logger.exception("Job worker failed")
+            self.sleep(self.poll_interval)
+    
+    def run(self, job):
+        """Run one claimed job to completion"""
+        with self._lock:
+            self.running.add(job['id'])
+        
+        def report(progress):
+            self.queue.set_progress(job['id'], self.owner, progress)
+            if self.on_progress:
+                self.on_progress(job, progress)
+        
+        try:
+            handler = self.handlers[job['kind']]
+            result = handler(job, report)
+            self.queue.complete(job['id'], self.owner, result)
+            job.update(status='done', result=result)
+        except Exception as e:
+            self.queue.fail(job['id'], self.owner, str(e))
+            job.update(status='failed', error=str(e))
+        finally:
+            with self._lock:
+                self.running.discard(job['id'])
+        
+        if self.on_done:
+            self.on_done(job)
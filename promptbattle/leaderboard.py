@@ -0,0 +1,240 @@
+import sqlite3
+import threading
+
+import native_locks
+
+def scored_entries(result):
+    """Evaluation entries of a result that received a score"""
+    evaluation = result.get('evaluation')
+    if not isinstance(evaluation, list):
+        return []
+    return [entry for entry in evaluation
+            if isinstance(entry, dict) and entry.get('total_score') is not None]
+
+def apply_result(data, result):
+    """Add one saved result to the player and question stats in data, in place"""
+    entries = scored_entries(result)
+    if not entries:
+        return
+    
+    # Evaluations are saved best first, like the winner shown after a game
+    winner = entries[0]
+    for entry in entries:
+        player = data['players'].setdefault(str(entry['player']), {
+            'games': 0, 'wins': 0, 'score_sum': 0.0, 'best_score': None
+        })
+        player['games'] += 1
+        player['score_sum'] += entry['total_score']
+        if player['best_score'] is None or entry['total_score'] > player['best_score']:
+            player['best_score'] = entry['total_score']
+        if entry is winner:
+            player['wins'] += 1
+    
+    question = data['questions'].setdefault(result.get('question') or '', {
+        'games': 0, 'entries': 0, 'score_sum': 0.0, 'winning_score_sum': 0.0,
+        'best_score': None, 'best_player': None
+    })
+    question['games'] += 1
+    question['entries'] += len(entries)
+    question['score_sum'] += sum(entry['total_score'] for entry in entries)
+    question['winning_score_sum'] += winner['total_score']
+    if question['best_score'] is None or winner['total_score'] > question['best_score']:
+        question['best_score'] = winner['total_score']
+        question['best_player'] = str(winner['player'])
+
+class Leaderboard:
+    """Per-player and per-question statistics kept in step with the results log
+    
+    Stats live in SQLite next to the count of results they include and
+    the generation of the results (see results_generation), like
+    RatingBook. refresh() only reads the results saved since then and
+    upserts just the rows of their players and questions, so keeping it
+    current costs O(new results) however many players there are, and
+    reading it costs O(players). Every process catches up from the same
+    log, so results saved by another worker are picked up too.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS leaderboard_players (
+            player TEXT PRIMARY KEY,
+            games INTEGER NOT NULL,
+            wins INTEGER NOT NULL,
+            score_sum REAL NOT NULL,
+            best_score REAL
+        );
+        CREATE TABLE IF NOT EXISTS leaderboard_questions (
+            question TEXT PRIMARY KEY,
+            games INTEGER NOT NULL,
+            entries INTEGER NOT NULL,
+            score_sum REAL NOT NULL,
+            winning_score_sum REAL NOT NULL,
+            best_score REAL,
+            best_player TEXT
+        );
+        CREATE TABLE IF NOT EXISTS leaderboard_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO leaderboard_meta (key, value) VALUES ('results', 0);
+        INSERT OR IGNORE INTO leaderboard_meta (key, value) VALUES ('generation', 0);
+    """
+    
+    PLAYER_FIELDS = ('games', 'wins', 'score_sum', 'best_score')
+    QUESTION_FIELDS = ('games', 'entries', 'score_sum', 'winning_score_sum', 'best_score', 'best_player')
+    
+    SORT_KEYS = {
+        'wins': lambda row: (row['wins'], row['average_score']),
+        'average': lambda row: (row['average_score'], row['games']),
+        'best': lambda row: (row['best_score'], row['average_score']),
+        'games': lambda row: (row['games'], row['wins'])
+    }
+    
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._connections = []
+        self._lock = native_locks.Lock()
+        self._connect().executescript(self.SCHEMA)
+    
+    def _connect(self):
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _state(self, conn):
+        """Generation of the counted results and how many of them are counted"""
+        meta = dict(conn.execute("SELECT key, value FROM leaderboard_meta"))
+        return meta['generation'], meta['results']
+    
+    def _load(self, conn, data, result):
+        """Read the stored stats of a result's players and question into data, if not there yet"""
+        entries = scored_entries(result)
+        if not entries:
+            return
+        
+        missing = list({str(entry['player']) for entry in entries} - data['players'].keys())
+        if missing:
+            rows = conn.execute(
+                f"SELECT player, {', '.join(self.PLAYER_FIELDS)} FROM leaderboard_players "
+                f"WHERE player IN ({', '.join('?' * len(missing))})",
+                missing
+            )
+            for player, *values in rows:
+                data['players'][player] = dict(zip(self.PLAYER_FIELDS, values))
+        
+        question = result.get('question') or ''
+        if question not in data['questions']:
+            row = conn.execute(
+                f"SELECT {', '.join(self.QUESTION_FIELDS)} FROM leaderboard_questions WHERE question = ?",
+                (question,)
+            ).fetchone()
+            if row is not None:
+                data['questions'][question] = dict(zip(self.QUESTION_FIELDS, row))
+    
+    def refresh(self, storage):
+        """Count the results saved since the last refresh and return how many are counted"""
+        state = (storage.results_generation(), storage.count_results())
+        if self._state(self._connect()) == state:
+            return state[1]
+        return self._update(storage)
+    
+    def rebuild(self, storage):
+        """Recount every result from scratch"""
+        return self._update(storage, reset=True)
+    
+    def _update(self, storage, reset=False):
+        """Count the results not counted yet, all of them with reset or once they were replaced"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Read only now: another worker may have caught up, or appended
+            # more results, while this one waited for the lock
+            generation = storage.results_generation()
+            counted_generation, applied = self._state(conn)
+            if reset or counted_generation != generation:
+                # The results were replaced, count them again from the start
+                conn.execute("DELETE FROM leaderboard_players")
+                conn.execute("DELETE FROM leaderboard_questions")
+                applied = 0
+            
+            # Stats of the players and questions touched since, by key
+            data = {'players': {}, 'questions': {}}
+            for result in storage.iter_results(applied):
+                self._load(conn, data, result)
+                apply_result(data, result)
+                applied += 1
+            
+            conn.executemany(
+                f"INSERT INTO leaderboard_players (player, {', '.join(self.PLAYER_FIELDS)}) "
+                f"VALUES (?, {', '.join('?' * len(self.PLAYER_FIELDS))}) ON CONFLICT(player) DO UPDATE SET "
+                + ', '.join(f"{field} = excluded.{field}" for field in self.PLAYER_FIELDS),
+                [(player, *(stats[field] for field in self.PLAYER_FIELDS)) for player, stats in data['players'].items()]
+            )
+            conn.executemany(
+                f"INSERT INTO leaderboard_questions (question, {', '.join(self.QUESTION_FIELDS)}) "
+                f"VALUES (?, {', '.join('?' * len(self.QUESTION_FIELDS))}) ON CONFLICT(question) DO UPDATE SET "
+                + ', '.join(f"{field} = excluded.{field}" for field in self.QUESTION_FIELDS),
+                [(question, *(stats[field] for field in self.QUESTION_FIELDS))
+                 for question, stats in data['questions'].items()]
+            )
+            conn.execute("UPDATE leaderboard_meta SET value = ? WHERE key = 'results'", (applied,))
+            conn.execute("UPDATE leaderboard_meta SET value = ? WHERE key = 'generation'", (generation,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return applied
+    
+    def players(self, storage, sort='wins', limit=None):
+        """Player rows, best first by the given sort key"""
+        self.refresh(storage)
+        rows = [
+            {
+                'player': player,
+                'games': games,
+                'wins': wins,
+                'win_rate': round(wins / games, 3),
+                'average_score': round(score_sum / games, 2),
+                'best_score': best_score
+            }
+            for player, games, wins, score_sum, best_score in self._connect().execute(
+                f"SELECT player, {', '.join(self.PLAYER_FIELDS)} FROM leaderboard_players"
+            )
+        ]
+        rows.sort(key=self.SORT_KEYS[sort], reverse=True)
+        return rows[:limit] if limit else rows
+    
+    def questions(self, storage):
+        """Question rows, most played first"""
+        self.refresh(storage)
+        rows = [
+            {
+                'question': question,
+                'games': games,
+                'average_score': round(score_sum / entries, 2),
+                'average_winning_score': round(winning_score_sum / games, 2),
+                'best_score': best_score,
+                'best_player': best_player
+            }
+            for question, games, entries, score_sum, winning_score_sum, best_score, best_player
+            in self._connect().execute(
+                f"SELECT question, {', '.join(self.QUESTION_FIELDS)} FROM leaderboard_questions"
+            )
+        ]
+        rows.sort(key=lambda row: row['games'], reverse=True)
+        return rows
+    
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
@@ -0,0 +1,42 @@
+import _thread
+import threading
+import time
+
+# In the eventlet and gevent server modes the threading module is patched and
+# its locks are green: they only work between greenlets of one thread. Storage
+# code runs on a pool of native threads there (see run_blocking in flask_app),
+# so it takes the original locks instead. Without patching these are the
+# usual threading locks. Storage background tasks likewise run on a native
+# thread and sleep with the original time.sleep.
+
+def _original(name, module='threading'):
+    """The unpatched attribute name of module"""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched(module):
+            return monkey.get_original(module, name)
+    except ImportError:
+        pass
+    try:
+        from eventlet import patcher
+        if patcher.is_monkey_patched('thread' if module in ('threading', '_thread') else module):
+            return getattr(patcher.original(module), name)
+    except ImportError:
+        pass
+    return getattr({'threading': threading, '_thread': _thread, 'time': time}[module], name)
+
+def Lock():
+    """A lock shared safely by native threads"""
+    return _original('Lock')()
+
+def RLock():
+    """A reentrant lock shared safely by native threads"""
+    return _original('RLock')()
+
+def start_thread(target, *args):
+    """Run target on a new native daemon thread"""
+    return _original('start_new_thread', '_thread')(target, args)
+
+def sleep(seconds):
+    """Block the calling native thread"""
+    _original('sleep', 'time')(seconds)
@@ -0,0 +1,94 @@
+import threading
+import time
+
+# Longer patch chains are replaced by a full snapshot when flushed
+MAX_QUEUED_PATCHES = 64
+
+def apply_patch(text, offset, delete_len, insert_text):
+    """Apply one (offset, delete_len, insert_text) edit to a prompt
+    
+    Offsets count Unicode code points. Raises ValueError if the edit does
+    not fit the text.
+    """
+    if (not isinstance(offset, int) or not isinstance(delete_len, int) or
+            not isinstance(insert_text, str)):
+        raise ValueError('malformed patch')
+    if not 0 <= offset <= len(text) or not 0 <= delete_len <= len(text) - offset:
+        raise ValueError('patch does not fit the prompt')
+    return text[:offset] + insert_text + text[offset + delete_len:]
+
+def merge_updates(previous, update):
+    """Merge two queued updates for the same player
+    
+    Consecutive patches are chained so monitors can replay them. Anything
+    else collapses into a snapshot, and the flush fills in the latest text.
+    """
+    if ('patches' in previous and 'patches' in update and
+            previous['version'] == update['base_version'] and
+            len(previous['patches']) < MAX_QUEUED_PATCHES):
+        return dict(update, base_version=previous['base_version'],
+                    patches=previous['patches'] + update['patches'])
+    if 'prompt' in update:
+        return update
+    
+    snapshot = {key: value for key, value in update.items() if key not in ('patches', 'base_version')}
+    snapshot['snapshot'] = True
+    return snapshot
+
+class PromptCoalescer:
+    """Merges prompt updates per session and flushes them in batches
+    
+    The first update for a session opens a window. Later updates inside
+    the window replace the pending update for that player, or are
+    combined with it by ``merge``. When the window closes,
+    ``on_flush(session_id, updates)`` gets one update per player.
+    """
+    
+    def __init__(self, window, on_flush, start_task=None, sleep=time.sleep):
+        self.window = window
+        self.on_flush = on_flush
+        self.start_task = start_task or self._start_thread
+        self.sleep = sleep
+        self._pending = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _start_thread(target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+    
+    def submit(self, session_id, player_id, update, merge=None):
+        """Queue a player's update for the next flush of its session"""
+        with self._lock:
+            pending = self._pending.get(session_id)
+            opens_window = pending is None
+            if opens_window:
+                pending = self._pending[session_id] = {}
+            if merge is not None and player_id in pending:
+                update = merge(pending[player_id], update)
+            pending[player_id] = update
+        
+        if opens_window:
+            if self.window > 0:
+                self.start_task(self._flush_later, session_id)
+            else:
+                self.flush(session_id)
+    
+    def _flush_later(self, session_id):
+        self.sleep(self.window)
+        self.flush(session_id)
+    
+    def flush(self, session_id):
+        """Deliver a session's pending updates now"""
+        with self._lock:
+            pending = self._pending.pop(session_id, None)
+        if pending:
+            self.on_flush(session_id, pending)
+    
+    def flush_all(self):
+        """Deliver every session's pending updates now"""
+        with self._lock:
+            session_ids = list(self._pending)
+        for session_id in session_ids:
+            self.flush(session_id)
@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from storage import create_backend
+from results_store import ResultsStore
+from scoring import score_prompts_batch
+from evaluation import RUBRIC_VERSION, EvaluationEngine, create_llm_client
+
+def score_games(games):
+    """Heuristic evaluations for a chunk of games, run in a worker process
+    
+    All prompts of the chunk are scored in one batch. Sorting the batch and
+    then splitting it by game keeps each game's entries in the order a
+    per-game sort would give.
+    """
+    batch = {(i, player): prompt for i, game in enumerate(games) for player, prompt in game['prompts'].items()}
+    evaluations = [[] for _ in games]
+    for entry in score_prompts_batch(batch):
+        i, player = entry['player']
+        evaluations[i].append(dict(entry, player=player))
+    return evaluations
+
+def ignore_interrupts():
+    """Leave Ctrl+C to the main process, which stops the pool itself"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+class LLMGameScorer:
+    """Re-evaluates chunks of games with the evaluation engine, from a thread pool"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+    
+    def __call__(self, games):
+        return [self.engine.evaluate(game['question'], game['prompts']) for game in games]
+
+def chunked(iterable, size):
+    """Yield lists of up to size items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def game_task(result):
+    """The part of a result a scorer needs"""
+    return {'question': result.get('question', ''), 'prompts': result.get('prompts') or {}}
+
+def run_ordered(executor, func, chunks, in_flight):
+    """Score chunks of results on the executor, yielding (chunk, evaluations) in input order
+    
+    At most in_flight chunks are submitted ahead of the one being
+    yielded, so a long results log is never read into memory at once.
+    """
+    pending = deque()
+    for chunk in chunks:
+        pending.append((chunk, executor.submit(func, [game_task(result) for result in chunk])))
+        if len(pending) >= in_flight:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+    while pending:
+        chunk, future = pending.popleft()
+        yield chunk, future.result()
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_checkpoint(path, checkpoint):
+    """Replace the checkpoint atomically"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+def rescore(source, output, checkpoint_file, settings, executor, func, in_flight, chunk_size=200,
+            report_interval=5.0, log=print):
+    """Re-evaluate every result in source into the output ResultsStore
+    
+    func(games) scores a chunk of games on the executor. Records are
+    written in source order and the checkpoint is updated after every
+    chunk, so an interrupted run picks up after the last chunk that
+    reached the output. settings describe the run and must match the
+    checkpoint's to resume it.
+    """
+    checkpoint = load_checkpoint(checkpoint_file)
+    if checkpoint is not None and checkpoint['settings'] != settings:
+        raise RuntimeError(f"{checkpoint_file} was written by a run with different settings, "
+                           f"remove it and the output to start over")
+    if checkpoint is None and len(output):
+        raise RuntimeError(f"{output.log_file} already has records but no checkpoint")
+    # Records that reached the output after the last checkpoint are kept,
+    # and a finished run only picks up results added since
+    start = len(output)
+    total = source.count_results()
+    if checkpoint is not None and checkpoint['done'] and start >= total:
+        log(f"Already up to date: {start} games in {output.log_file}")
+        return checkpoint
+    checkpoint = {'settings': settings, 'position': start, 'total': total, 'done': False,
+                  'started_at': checkpoint['started_at'] if checkpoint else datetime.now().isoformat()}
+    save_checkpoint(checkpoint_file, checkpoint)
+    if start:
+        log(f"Resuming at game {start} of {total}")
+    
+    began = time.monotonic()
+    last_report = began
+    position = start
+    chunks = chunked(source.iter_results(start), chunk_size)
+    try:
+        for chunk, evaluations in run_ordered(executor, func, chunks, in_flight):
+            for result, evaluation in zip(chunk, evaluations):
+                output.append(dict(result, evaluation=evaluation, rubric_version=settings['rubric_version'],
+                                   scorer=settings['scorer'], source_position=position,
+                                   rescored_at=datetime.now().isoformat()))
+                position += 1
+            output.sync()
+            checkpoint['position'] = position
+            save_checkpoint(checkpoint_file, checkpoint)
+            
+            now = time.monotonic()
+            if now - last_report >= report_interval:
+                log(f"{position}/{total} games, {(position - start) / (now - began):.1f} games/sec")
+                last_report = now
+    finally:
+        output.sync()
+    
+    elapsed = time.monotonic() - began
+    checkpoint.update(done=True, finished_at=datetime.now().isoformat(),
+                      games_per_sec=round((position - start) / elapsed, 1) if elapsed else None)
+    save_checkpoint(checkpoint_file, checkpoint)
+    log(f"Rescored {position - start} games in {elapsed:.1f}s "
+        f"({checkpoint['games_per_sec']} games/sec) into {output.log_file}")
+    return checkpoint
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-evaluate every historical result under the current rubric')
+    parser.add_argument('--storage', choices=['json', 'sqlite'],
+                        default=os.environ.get('PROMPTBATTLE_STORAGE', 'json'))
+    parser.add_argument('--admin-data', default='admin_data.json')
+    parser.add_argument('--results-log', default='results.jsonl')
+    parser.add_argument('--results-index', default='results.idx')
+    parser.add_argument('--legacy-results', default='results.json')
+    parser.add_argument('--db', default='promptbattle.db')
+    parser.add_argument('--scorer', choices=['heuristic', 'llm'], default='heuristic',
+                        help='heuristic scores in a process pool, llm calls LLM_CLIENT from a thread pool')
+    parser.add_argument('--rubric-version', type=int, default=RUBRIC_VERSION)
+    parser.add_argument('--output', help='defaults to results.v<rubric version>.jsonl')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4,
+                        help='processes for heuristic, games in flight for llm')
+    parser.add_argument('--chunk-size', type=int, help='games per task, defaults to 500 for heuristic, 1 for llm')
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    args = parser.parse_args()
+    
+    output_log = args.output or f"results.v{args.rubric_version}.jsonl"
+    output_index = os.path.splitext(output_log)[0] + '.idx'
+    checkpoint_file = output_log + '.checkpoint'
+    settings = {
+        'source': os.path.abspath(args.db if args.storage == 'sqlite' else args.results_log),
+        'scorer': args.scorer,
+        'rubric_version': args.rubric_version
+    }
+    chunk_size = args.chunk_size or (500 if args.scorer == 'heuristic' else 1)
+    
+    if args.scorer == 'llm':
+        client = create_llm_client(os.environ.get('LLM_CLIENT', 'mock'),
+                                   model=os.environ.get('LLM_MODEL', 'gpt-3.5-turbo'),
+                                   base_url=os.environ.get('LLM_BASE_URL'))
+        settings['model'] = client.model
+        engine = EvaluationEngine(
+            client,
+            max_concurrency=int(os.environ.get('EVAL_CONCURRENCY', '8')),
+            timeout=float(os.environ.get('EVAL_TIMEOUT', '30')),
+            retries=int(os.environ.get('EVAL_RETRIES', '2')),
+            deadline=float(os.environ.get('EVAL_DEADLINE', '120'))
+        )
+        # Each game's prompts are already scored concurrently by the engine,
+        # so threads only need to keep several games in flight
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+        func = LLMGameScorer(engine)
+    else:
+        executor = ProcessPoolExecutor(max_workers=args.workers, initializer=ignore_interrupts)
+        func = score_games
+    
+    source = create_backend(args.storage, args.admin_data, args.results_log, args.results_index,
+                            args.db, legacy_results_file=args.legacy_results)
+    output = ResultsStore(output_log, output_index, fsync_batch=chunk_size)
+    try:
+        rescore(source, output, checkpoint_file, settings, executor, func, args.workers * 2,
+                chunk_size, args.report_interval)
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
+    except KeyboardInterrupt:
+        parser.exit(130, f"Interrupted, run again to resume from {checkpoint_file}\n")
+    finally:
+        executor.shutdown(cancel_futures=True)
+        output.close()
+        source.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+import json
+import os
+import struct
+import tempfile
+import time
+import atexit
+from contextlib import contextmanager
+
+import native_locks
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock (Windows) appends are only serialized within one process
+    fcntl = None
+
+# Each index entry is the byte offset of one record in the log file
+INDEX_ENTRY = struct.Struct('<Q')
+
+class ResultsStore:
+    """Append-only JSONL results log with a sidecar offset index
+    
+    Several processes may append to the same log. Appends, repairs and
+    rewrites hold an exclusive flock on a sidecar lock file, which is
+    never replaced, so each record's offset and index entry are written
+    together. Every rewrite also bumps the generation kept in a third
+    sidecar file, so readers can tell a replaced log from a longer one.
+    
+    Appends are fsynced in batches of fsync_batch, and none stays unsynced
+    for more than fsync_interval seconds: a background thread syncs the
+    tail of a burst that no later append synced. close(), also run at
+    exit, syncs whatever is left.
+    """
+    
+    def __init__(self, log_file, index_file, fsync_batch=32, fsync_interval=1.0):
+        self.log_file = log_file
+        self.index_file = index_file
+        self.lock_file = log_file + '.lock'
+        self.generation_file = log_file + '.gen'
+        self._lock_handle = None
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self._lock = native_locks.Lock()
+        self._log = None
+        self._index = None
+        self._log_reader = None
+        self._index_reader = None
+        self._unsynced = 0
+        self._first_unsynced = None
+        self._last_sync = time.monotonic()
+        self._flusher_running = False
+        atexit.register(self.close)
+    
+    @contextmanager
+    def _file_lock(self):
+        """Hold the lock shared with other processes using this log"""
+        if fcntl is None:
+            yield
+            return
+        if self._lock_handle is None:
+            self._lock_handle = open(self.lock_file, 'ab')
+        fcntl.flock(self._lock_handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_handle.fileno(), fcntl.LOCK_UN)
+    
+    def _open(self):
+        """Open the log and index for appending, repairing the index if needed
+        
+        Files another process replaced with rewrite() are opened again.
+        """
+        if self._log is not None:
+            try:
+                replaced = os.stat(self.log_file).st_ino != os.fstat(self._log.fileno()).st_ino
+            except FileNotFoundError:
+                replaced = True
+            if replaced:
+                self._close_files()
+        if self._log is None:
+            self._log = open(self.log_file, 'ab', buffering=0)
+            self._index = open(self.index_file, 'ab', buffering=0)
+            self._log_reader = open(self.log_file, 'rb')
+            self._index_reader = open(self.index_file, 'rb')
+            with self._file_lock():
+                self._repair()
+    
+    def _repair(self):
+        """Bring the index in line with the log after a crash or manual edit"""
+        index_size = os.fstat(self._index.fileno()).st_size
+        if index_size % INDEX_ENTRY.size:
+            index_size -= index_size % INDEX_ENTRY.size
+            self._index.truncate(index_size)
+        
+        # Resume scanning from the last indexed record
+        position = 0
+        if index_size:
+            position = self._offset_at(index_size // INDEX_ENTRY.size - 1)
+            self._log_reader.seek(position)
+            line = self._log_reader.readline()
+            if line.endswith(b'\n'):
+                position += len(line)
+            else:
+                # Last indexed record is torn, rebuild the index from scratch
+                self._index.truncate(0)
+                position = 0
+        
+        self._log_reader.seek(position)
+        entries = []
+        for line in self._log_reader:
+            if not line.endswith(b'\n'):
+                # Drop a partially written trailing record
+                self._log.truncate(position)
+                break
+            entries.append(INDEX_ENTRY.pack(position))
+            position += len(line)
+        
+        if entries:
+            self._index.write(b''.join(entries))
+    
+    def _offset_at(self, position):
+        """Look up the log offset of a record in the index"""
+        self._index_reader.seek(position * INDEX_ENTRY.size)
+        offset, = INDEX_ENTRY.unpack(self._index_reader.read(INDEX_ENTRY.size))
+        return offset
+    
+    def _count(self):
+        """Number of records currently in the index"""
+        return os.fstat(self._index.fileno()).st_size // INDEX_ENTRY.size
+    
+    def append(self, record):
+        """Append a record and return its position in the log"""
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        
+        with self._lock:
+            self._open()
+            with self._file_lock():
+                # Index a record left behind by a process that died mid-append,
+                # then take the offset only now that no one else is appending
+                self._repair()
+                offset = os.fstat(self._log.fileno()).st_size
+                self._log.write(line)
+                self._index.write(INDEX_ENTRY.pack(offset))
+                position = self._count() - 1
+            
+            self._unsynced += 1
+            if self._first_unsynced is None:
+                self._first_unsynced = time.monotonic()
+            if (self._unsynced >= self.fsync_batch or
+                    time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            elif not self._flusher_running:
+                self._flusher_running = True
+                native_locks.start_thread(self._flush_pending)
+        
+        return position
+    
+    def _flush_pending(self):
+        """Background thread that syncs appends still pending after fsync_interval
+        
+        It exits once nothing is pending, the next unsynced append starts
+        another one.
+        """
+        while True:
+            with self._lock:
+                if not self._unsynced:
+                    self._flusher_running = False
+                    return
+                delay = self._first_unsynced + self.fsync_interval - time.monotonic()
+                if delay <= 0:
+                    self._sync()
+                    continue
+            native_locks.sleep(delay)
+    
+    def _sync(self):
+        """Flush pending appends to disk"""
+        if self._log is not None and self._unsynced:
+            os.fsync(self._log.fileno())
+            os.fsync(self._index.fileno())
+        self._unsynced = 0
+        self._first_unsynced = None
+        self._last_sync = time.monotonic()
+    
+    def sync(self):
+        """Force pending appends to disk"""
+        with self._lock:
+            self._sync()
+    
+    def close(self):
+        """Sync and close the underlying files"""
+        with self._lock:
+            self._sync()
+            self._close_files()
+            if self._lock_handle is not None:
+                self._lock_handle.close()
+                self._lock_handle = None
+    
+    def _close_files(self):
+        """Close all open file handles"""
+        if self._log is not None:
+            for f in (self._log, self._index, self._log_reader, self._index_reader):
+                f.close()
+            self._log = None
+            self._index = None
+    
+    def __len__(self):
+        with self._lock:
+            self._open()
+            return self._count()
+    
+    def read(self, position):
+        """Read a single record by its position using the offset index"""
+        with self._lock:
+            self._open()
+            count = self._count()
+            if position < 0:
+                position += count
+            if not 0 <= position < count:
+                raise IndexError('result position out of range')
+            
+            self._log_reader.seek(self._offset_at(position))
+            line = self._log_reader.readline()
+        return json.loads(line)
+    
+    def iter_records(self, start=0):
+        """Iterate over records starting at the given position"""
+        if not os.path.exists(self.log_file):
+            return
+        
+        offset = 0
+        if start:
+            with self._lock:
+                self._open()
+                if start >= self._count():
+                    return
+                offset = self._offset_at(start)
+        
+        # Use a separate handle so appends can continue while iterating
+        with open(self.log_file, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                yield json.loads(line)
+    
+    def generation(self):
+        """Counter bumped each time the log is rewritten, 0 for a log never rewritten"""
+        try:
+            with open(self.generation_file, 'rb') as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+    
+    def read_all(self):
+        """Read every record in the log"""
+        return list(self.iter_records())
+    
+    def rewrite(self, records):
+        """Atomically replace the log and index with the given records"""
+        with self._lock:
+            self._sync()
+            self._close_files()
+            
+            with self._file_lock():
+                self._rewrite(records)
+    
+    def _rewrite(self, records):
+        """Write the records to temporary files and move them over the log and index"""
+        # Temporary names are unique, so processes never write to each other's
+        log_fd, log_tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.log_file)),
+                                           prefix=os.path.basename(self.log_file) + '.', suffix='.tmp')
+        index_fd, index_tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.index_file)),
+                                               prefix=os.path.basename(self.index_file) + '.', suffix='.tmp')
+        with open(log_fd, 'wb') as log, open(index_fd, 'wb') as index:
+            offset = 0
+            for record in records:
+                line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+                log.write(line)
+                index.write(INDEX_ENTRY.pack(offset))
+                offset += len(line)
+            log.flush()
+            index.flush()
+            os.fsync(log.fileno())
+            os.fsync(index.fileno())
+        
+        os.replace(log_tmp, self.log_file)
+        os.replace(index_tmp, self.index_file)
+        
+        # Bumped last: a reader that sees the new generation also sees the new log
+        generation_fd, generation_tmp = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.generation_file)),
+            prefix=os.path.basename(self.generation_file) + '.', suffix='.tmp'
+        )
+        with open(generation_fd, 'wb') as f:
+            f.write(str(self.generation() + 1).encode('ascii'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(generation_tmp, self.generation_file)
+    
+    def migrate_legacy(self, json_file):
+        """Migrate a legacy results.json array into the log, once"""
+        if not os.path.exists(json_file):
+            return 0
+        if os.path.exists(self.log_file) and os.path.getsize(self.log_file) > 0:
+            return 0
+        
+        with open(json_file, 'r') as f:
+            results = json.load(f)
+        
+        self.rewrite(results)
+        os.replace(json_file, json_file + '.migrated')
+        return len(results)
@@ -0,0 +1,113 @@
+from functools import lru_cache
+
+def heuristic_criteria(prompt):
+    """Unrounded relevance, creativity and clarity of a prompt"""
+    relevance = min(10, len(prompt.split()) * 0.5)  # Simple word count scoring
+    creativity = min(10, len(set(prompt.lower().split())) * 0.3)  # Unique words
+    clarity = min(10, 10 - prompt.count(',') * 0.5) if ',' in prompt else 8
+    return relevance, creativity, clarity
+
+def score_prompt(player, prompt):
+    """Heuristic evaluation of a single prompt"""
+    relevance, creativity, clarity = heuristic_criteria(prompt)
+    total_score = (relevance + creativity + clarity) / 3
+    return {
+        'player': player,
+        'prompt': prompt,
+        'relevance': round(relevance, 1),
+        'creativity': round(creativity, 1),
+        'clarity': round(clarity, 1),
+        'total_score': round(total_score, 1)
+    }
+
+def round_exact(values):
+    """Round an array to one decimal exactly like Python's round()
+    
+    np.round scales by ten first and can land on the other side of a tie,
+    so each distinct value is rounded by round() instead. Scores only take
+    a few hundred distinct values, however many prompts there are.
+    """
+    import numpy as np
+    import pandas as pd
+    codes, distinct = pd.factorize(values)
+    return np.array([round(value, 1) for value in distinct.tolist()], dtype=float)[codes]
+
+@lru_cache(maxsize=None)
+def _whitespace_table():
+    """Lookup table of the code points str.split() treats as whitespace"""
+    import numpy as np
+    return np.array([chr(code).isspace() for code in range(0x3001)])
+
+def score_prompts_batch(prompts, top_k=None):
+    """Heuristic evaluation of many prompts at once, best first
+    
+    Returns the same entries in the same order as calling score_prompt on
+    every prompt and sorting by total_score, but computes the features
+    for all prompts together on NumPy arrays. With top_k only the best
+    top_k entries are selected and built, without a full sort.
+    """
+    import numpy as np
+    import pandas as pd
+    
+    players = list(prompts)
+    texts = list(prompts.values())
+    count = len(texts)
+    if count == 0:
+        return []
+    
+    # All prompts as one array of code points, separated by newlines so no
+    # word runs from one prompt into the next
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=count)
+    offsets = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+    joined = '\n'.join(texts)
+    codes = np.frombuffer(joined.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    
+    whitespace = _whitespace_table()
+    space = (codes < len(whitespace)) & whitespace[np.minimum(codes, len(whitespace) - 1)]
+    word_starts = np.flatnonzero(~space & np.concatenate(([True], space[:-1])))
+    owner = np.searchsorted(offsets, word_starts, side='right') - 1
+    word_counts = np.bincount(owner, minlength=count)
+    comma_owner = np.searchsorted(offsets, np.flatnonzero(codes == ord(',')), side='right') - 1
+    commas = np.bincount(comma_owner, minlength=count)
+    
+    # Lowercasing never adds or removes whitespace, so the lowered words
+    # line up with the words counted above
+    word_ids, vocabulary = pd.factorize(np.array(joined.lower().split(), dtype=object))
+    stride = max(len(vocabulary), 1)
+    pairs = np.sort(owner * stride + word_ids)
+    first = np.ones(len(pairs), dtype=bool)
+    first[1:] = pairs[1:] != pairs[:-1]
+    unique_counts = np.bincount(pairs[first] // stride, minlength=count)
+    
+    relevance = np.minimum(10, word_counts * 0.5)
+    creativity = np.minimum(10, unique_counts * 0.3)
+    clarity = np.where(commas > 0, np.minimum(10, 10 - commas * 0.5), 8.0)
+    total = round_exact((relevance + creativity + clarity) / 3)
+    
+    # Best first, earlier prompts first among equal scores like a stable sort
+    if top_k is not None and top_k < count:
+        if top_k <= 0:
+            return []
+        kth = np.partition(total, count - top_k)[count - top_k]
+        above = np.flatnonzero(total > kth)
+        ties = np.flatnonzero(total == kth)[:top_k - len(above)]
+        selected = np.concatenate([above, ties])
+    else:
+        selected = np.arange(count)
+    order = selected[np.lexsort((selected, -total[selected]))]
+    
+    relevance = round_exact(relevance[order]).tolist()
+    creativity = round_exact(creativity[order]).tolist()
+    clarity = round_exact(clarity[order]).tolist()
+    total = total.tolist()
+    return [
+        {
+            'player': players[i],
+            'prompt': texts[i],
+            'relevance': relevance[rank],
+            'creativity': creativity[rank],
+            'clarity': clarity[rank],
+            'total_score': total[i]
+        }
+        for rank, i in enumerate(order.tolist())
+    ]
@@ -0,0 +1,255 @@
+import math
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+import native_locks
+
+# Words of a name or email address
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def trigrams(text):
+    """Distinct three-character substrings of text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def paginate(items, page, page_size):
+    """One page of items with the total count; page_size None returns them all"""
+    total = len(items)
+    if page_size is None:
+        return {'total': total, 'page': 1, 'page_size': total, 'pages': 1, 'items': list(items)}
+    start = (page - 1) * page_size
+    return {
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'pages': -(-total // page_size),
+        'items': list(items[start:start + page_size])
+    }
+
+class UserSearch:
+    """Search-as-you-type index over users' full names and emails
+    
+    Users are numbered in name order. Every word of a name or email is
+    kept in one sorted list for prefix lookups by bisection, and every
+    trigram maps to the users containing it, so terms of three or more
+    characters also match anywhere inside a name or email. A search looks
+    up its most selective term and only checks the users it matched
+    against the other terms, so it costs O(log users + candidates)
+    instead of a scan of the roster. The index is rebuilt in memory when
+    the storage version changes. Passwords are never returned.
+    """
+    
+    def __init__(self):
+        self._lock = native_locks.Lock()
+        self._version = None
+        self._index = None
+    
+    @staticmethod
+    def _build(users):
+        """Index a list of users"""
+        users = sorted(
+            ({key: value for key, value in user.items() if key != 'password'} for user in users),
+            key=lambda user: (user['fullname'].lower(), str(user['user_id']))
+        )
+        texts, spaced, words, grams = [], [], [], defaultdict(list)
+        flags = []
+        for i, user in enumerate(users):
+            text = f"{user['fullname']}\n{user['emailid']}".lower()
+            tokens = {*TOKEN_PATTERN.findall(text), user['emailid'].lower()}
+            texts.append(text)
+            # ' ' + term is in here when term starts one of the user's words
+            spaced.append(' ' + ' '.join(tokens))
+            words.extend((token, i) for token in tokens)
+            for gram in trigrams(text):
+                grams[gram].append(i)
+            flags.append(bool(user['is_technical']))
+        
+        words.sort()
+        return {
+            'users': users,
+            'texts': texts,
+            'spaced': spaced,
+            'flags': flags,
+            'word_keys': [token for token, _ in words],
+            'word_ids': [i for _, i in words],
+            'grams': dict(grams),
+            'by_flag': {
+                None: range(len(users)),
+                True: [i for i, flag in enumerate(flags) if flag],
+                False: [i for i, flag in enumerate(flags) if not flag]
+            }
+        }
+    
+    def _current(self, storage):
+        """The index for the current users, rebuilt after they changed"""
+        version = storage.version()
+        with self._lock:
+            if self._version != version:
+                self._index = self._build(storage.get_users())
+                self._version = version
+            return self._index
+    
+    @staticmethod
+    def _lookup(index, term):
+        """Candidate ids for one term, without checking them yet
+        
+        Short terms are looked up among word prefixes, longer ones by
+        their rarest trigram.
+        """
+        if len(term) < 3:
+            keys = index['word_keys']
+            start = bisect_left(keys, term)
+            end = bisect_left(keys, term + '\U0010ffff', start)
+            return index['word_ids'][start:end]
+        return min((index['grams'].get(gram, ()) for gram in trigrams(term)), key=len)
+    
+    @staticmethod
+    def _check(index, term):
+        """Strings per user and the needle to find in them for term to match"""
+        if len(term) < 3:
+            return index['spaced'], ' ' + term
+        return index['texts'], term
+    
+    def search(self, storage, query='', is_technical=None, page=1, page_size=20):
+        """One page of users matching every word of query, with the total number of matches
+        
+        Users with a word starting with each query word come first, then
+        those that only contain them; each group is in name order.
+        is_technical True or False keeps only users with that flag.
+        """
+        index = self._current(storage)
+        terms = query.lower().split()
+        if not terms:
+            matches = index['by_flag'][is_technical]
+        else:
+            # Start from the term with the fewest candidates and check the
+            # others against those only
+            lookups = sorted(((self._lookup(index, term), term) for term in terms), key=lambda item: len(item[0]))
+            found = set(lookups[0][0])
+            for _, term in lookups if len(lookups[0][1]) >= 3 else lookups[1:]:
+                strings, needle = self._check(index, term)
+                found = {i for i in found if needle in strings[i]}
+            if is_technical is not None:
+                flags = index['flags']
+                found = {i for i in found if flags[i] == bool(is_technical)}
+            
+            # Short terms already matched word prefixes only
+            prefixed = found
+            spaced = index['spaced']
+            for term in terms:
+                if len(term) >= 3:
+                    prefixed = {i for i in prefixed if ' ' + term in spaced[i]}
+            matches = sorted(prefixed) + sorted(found - prefixed)
+        
+        result = paginate(matches, page, page_size)
+        result['users'] = [index['users'][i] for i in result.pop('items')]
+        return result
+
+# Words too common to help rank questions
+STOPWORDS = frozenset(
+    'a an and are as at be by for from how in is it of on or that the this to was what when where which who why with you your'.split()
+)
+
+def question_terms(text):
+    """Lowercase words of a question or query, without stopwords"""
+    return [word for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+class QuestionSearch:
+    """Full-text index over question text, ranked with BM25
+    
+    Each word maps to the positions of the questions containing it and
+    how often it occurs there. A search only reads the postings of its
+    own words and ranks the questions containing any of them, so it
+    costs O(matching postings) however large the question bank is.
+    Adding a question indexes just that question when nothing else
+    changed since the index was built; any other change to admin data
+    rebuilds it on the next search.
+    """
+    
+    # BM25 term frequency saturation and length normalization
+    K1 = 1.2
+    B = 0.75
+    
+    def __init__(self):
+        self._lock = native_locks.Lock()
+        self._version = None
+        self._index = None
+    
+    @staticmethod
+    def _add(index, question):
+        """Index one question at the next position"""
+        position = len(index['questions'])
+        terms = question_terms(question['text'])
+        index['questions'].append(question)
+        index['lengths'].append(len(terms))
+        index['total_length'] += len(terms)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            index['postings'].setdefault(term, []).append((position, count))
+    
+    @classmethod
+    def _build(cls, questions):
+        """Index a list of questions"""
+        index = {'questions': [], 'lengths': [], 'total_length': 0, 'postings': {}}
+        for question in questions:
+            cls._add(index, question)
+        return index
+    
+    def _current(self, storage):
+        """The index for the current questions, rebuilt after admin data changed"""
+        version = storage.version()
+        with self._lock:
+            if self._version != version:
+                self._index = self._build(storage.get_questions())
+                self._version = version
+            return self._index
+    
+    def add(self, storage, question, version_before):
+        """Index a question that was just stored, given the storage version before it was
+        
+        The question is added in place only if the index was current and
+        storing it was the only change since.
+        """
+        with self._lock:
+            if (self._index is not None and self._version == version_before
+                    and storage.version() == version_before + 1):
+                self._add(self._index, question)
+                self._version = version_before + 1
+    
+    def search(self, storage, query='', page=1, page_size=20):
+        """One page of questions matching any word of query, best first
+        
+        Without query words, every question is listed in the order it was
+        added. Each question carries its position in the question bank,
+        and a score when ranked.
+        """
+        index = self._current(storage)
+        questions = index['questions']
+        terms = set(question_terms(query))
+        if not terms:
+            result = paginate(range(len(questions)), page, page_size)
+            result['questions'] = [dict(questions[i], position=i) for i in result.pop('items')]
+            return result
+        
+        count = len(questions)
+        average_length = index['total_length'] / count if count else 0
+        lengths = index['lengths']
+        scores = {}
+        for term in terms:
+            postings = index['postings'].get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings:
+                norm = self.K1 * (1 - self.B + self.B * lengths[position] / (average_length or 1))
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+        
+        # Best score first, newer questions first among equal scores
+        ranked = sorted(scores, key=lambda position: (-scores[position], -position))
+        result = paginate(ranked, page, page_size)
+        result['questions'] = [
+            dict(questions[i], position=i, score=round(scores[i], 3)) for i in result.pop('items')
+        ]
+        return result
@@ -0,0 +1,756 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import native_locks
+from results_store import ResultsStore
+
+def default_admin_data():
+    """Admin data used before admin_data.json has been created"""
+    return {
+        'admins': [{'email': 'admin@example.com', 'password': 'admin123'}],
+        'users': [],
+        'questions': []
+    }
+
+class JsonFileCache:
+    """Write-through in-memory cache of a parsed JSON file
+    
+    The parsed document is kept in memory and served until the file's
+    mtime, size or inode changes on disk, so external edits are still
+    picked up. Every reload or save bumps ``version``. Callers share the
+    cached object and must save it after mutating it.
+    """
+    
+    def __init__(self, path, default_factory=dict):
+        self.path = path
+        self.default_factory = default_factory
+        self.version = 0
+        self._lock = native_locks.RLock()
+        self._data = None
+        self._signature = None
+    
+    def _stat_signature(self):
+        """Identify the current file contents without reading them"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    
+    def load(self):
+        """Return the cached document, re-reading the file if it changed"""
+        with self._lock:
+            signature = self._stat_signature()
+            if self._data is not None and signature == self._signature:
+                return self._data
+            
+            if signature is None:
+                data = self.default_factory()
+            else:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            
+            self._data = data
+            self._signature = signature
+            self.version += 1
+            return data
+    
+    def save(self, data):
+        """Write the document to disk and keep it as the cached copy"""
+        with self._lock:
+            # A unique temporary name, so processes saving at once never share it
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)),
+                                            prefix=os.path.basename(self.path) + '.', suffix='.tmp')
+            try:
+                with open(fd, 'w') as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            
+            self._data = data
+            self._signature = self._stat_signature()
+            self.version += 1
+    
+    def invalidate(self):
+        """Drop the cached document so the next load re-reads the file"""
+        with self._lock:
+            self._data = None
+            self._signature = None
+            self.version += 1
+
+def email_key(email):
+    """Normalize an email address for case-insensitive lookups"""
+    return (email or '').strip().lower()
+
+def unique_users(chunk):
+    """A chunk's users with one entry per user_id, the last one winning"""
+    return list({str(user['user_id']): user for user in chunk}.values())
+
+class EmailIndex:
+    """Hash index from lowercase email to account record"""
+    
+    def __init__(self, email_field):
+        self.email_field = email_field
+        self._by_email = {}
+    
+    def rebuild(self, records):
+        """Rebuild the index from scratch"""
+        self._by_email = {}
+        for record in records:
+            self.add(record)
+    
+    def add(self, record):
+        """Index a record, keeping the first record seen for an email"""
+        self._by_email.setdefault(email_key(record[self.email_field]), record)
+    
+    def remove(self, record):
+        """Remove a record from the index"""
+        key = email_key(record[self.email_field])
+        if self._by_email.get(key) is record:
+            del self._by_email[key]
+    
+    def get(self, email):
+        """Look up a record by email"""
+        return self._by_email.get(email_key(email))
+    
+    def __len__(self):
+        return len(self._by_email)
+
+class StorageBackend:
+    """Interface for where admins, users, questions and results are stored"""
+    
+    def version(self):
+        """Counter that changes whenever admins, users or questions change"""
+        raise NotImplementedError
+    
+    def load_admin_data(self):
+        """Load admins, users and questions as one document"""
+        raise NotImplementedError
+    
+    def save_admin_data(self, data):
+        """Replace admins, users and questions from one document"""
+        raise NotImplementedError
+    
+    def get_admins(self):
+        """Get all admins"""
+        raise NotImplementedError
+    
+    def get_users(self):
+        """Get all users"""
+        raise NotImplementedError
+    
+    def get_admin_by_email(self, email):
+        """Get an admin by case-insensitive email"""
+        raise NotImplementedError
+    
+    def get_user_by_email(self, email):
+        """Get a user by case-insensitive email"""
+        raise NotImplementedError
+    
+    def replace_users(self, users):
+        """Replace all users"""
+        raise NotImplementedError
+    
+    def upsert_users(self, chunks, progress=None):
+        """Insert or update users by user_id from an iterable of chunks
+        
+        Only new or changed users are written. ``progress`` is called with
+        the running counts after each chunk. Returns the final counts.
+        All chunks are stored or none: if reading a chunk or writing fails,
+        the stored users are left as they were. A user_id repeated within
+        a chunk is counted once, with its last row.
+        """
+        raise NotImplementedError
+    
+    def get_questions(self):
+        """Get all questions"""
+        raise NotImplementedError
+    
+    def get_question(self, question_id):
+        """Get a question by ID"""
+        raise NotImplementedError
+    
+    def add_question(self, question):
+        """Add a single question"""
+        raise NotImplementedError
+    
+    def append_result(self, result):
+        """Append a single result and return its position"""
+        raise NotImplementedError
+    
+    def get_result(self, position):
+        """Get a single result by position"""
+        raise NotImplementedError
+    
+    def count_results(self):
+        """Number of stored results"""
+        raise NotImplementedError
+    
+    def results_generation(self):
+        """Counter that changes whenever the stored results are replaced
+        
+        Appends leave it as it is, so indexes built from the results can
+        tell new results from a different set of results.
+        """
+        raise NotImplementedError
+    
+    def iter_results(self, start=0):
+        """Iterate over results in the order they were saved"""
+        raise NotImplementedError
+    
+    def load_results(self):
+        """Load all results"""
+        return list(self.iter_results())
+    
+    def find_recent_result(self, field, value, since):
+        """The newest result with result[field] == value saved since an ISO timestamp, or None
+        
+        Results are saved in time order, so only the ones since are read,
+        newest first.
+        """
+        for position in range(self.count_results() - 1, -1, -1):
+            result = self.get_result(position)
+            if result.get(field) == value:
+                return result
+            if (result.get('timestamp') or '') < since:
+                return None
+        return None
+    
+    def save_results(self, results):
+        """Replace all results"""
+        raise NotImplementedError
+    
+    def close(self):
+        """Release any open files or connections"""
+
+class JsonBackend(StorageBackend):
+    """Stores admin data in admin_data.json and results in the JSONL log"""
+    
+    def __init__(self, admin_data_file, results_log_file, results_index_file):
+        self.admin_data = JsonFileCache(admin_data_file, default_admin_data)
+        self.results = ResultsStore(results_log_file, results_index_file)
+        self.admin_index = EmailIndex('email')
+        self.user_index = EmailIndex('emailid')
+        self._index_lock = native_locks.Lock()
+        self._index_version = None
+        # Position of each question by id, as of _question_index_version
+        self.question_positions = {}
+        self._question_index_version = None
+    
+    def _email_indexes(self):
+        """Return the email indexes, rebuilding them if admin data was reloaded"""
+        data = self.admin_data.load()
+        with self._index_lock:
+            if self._index_version != self.admin_data.version:
+                self.admin_index.rebuild(data['admins'])
+                self.user_index.rebuild(data['users'])
+                self._index_version = self.admin_data.version
+        return self.admin_index, self.user_index
+    
+    def version(self):
+        self.admin_data.load()
+        return self.admin_data.version
+    
+    def load_admin_data(self):
+        return self.admin_data.load()
+    
+    def save_admin_data(self, data):
+        self.admin_data.save(data)
+    
+    def get_admins(self):
+        return self.admin_data.load()['admins']
+    
+    def get_users(self):
+        return self.admin_data.load()['users']
+    
+    def get_admin_by_email(self, email):
+        admin_index, _ = self._email_indexes()
+        return admin_index.get(email)
+    
+    def get_user_by_email(self, email):
+        _, user_index = self._email_indexes()
+        return user_index.get(email)
+    
+    def replace_users(self, users):
+        data = self.admin_data.load()
+        with self._index_lock:
+            in_sync = self._index_version == self.admin_data.version
+        
+        data['users'] = users
+        self.admin_data.save(data)
+        
+        # Only the user index changed, the admin index is still valid
+        if in_sync:
+            with self._index_lock:
+                self.user_index.rebuild(users)
+                self._index_version = self.admin_data.version
+    
+    def upsert_users(self, chunks, progress=None):
+        data = self.admin_data.load()
+        _, user_index = self._email_indexes()
+        # Chunks are applied to a copy, which replaces the cached users only
+        # once it has been saved
+        users = list(data['users'])
+        positions = {str(user['user_id']): i for i, user in enumerate(users)}
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        changes = []
+        
+        for chunk in chunks:
+            for user in unique_users(chunk):
+                i = positions.get(str(user['user_id']))
+                if i is None:
+                    positions[str(user['user_id'])] = len(users)
+                    users.append(user)
+                    changes.append((None, user))
+                    counts['inserted'] += 1
+                elif users[i] != user:
+                    changes.append((users[i], user))
+                    users[i] = user
+                    counts['updated'] += 1
+                else:
+                    counts['unchanged'] += 1
+            if progress:
+                progress(dict(counts))
+        
+        # The whole document is one file, so write it once at the end
+        if changes:
+            with self._index_lock:
+                in_sync = self._index_version == self.admin_data.version
+            self.admin_data.save(dict(data, users=users))
+            
+            # Only the changed users need reindexing
+            if in_sync:
+                with self._index_lock:
+                    for old, new in changes:
+                        if old is not None:
+                            user_index.remove(old)
+                        user_index.add(new)
+                    self._index_version = self.admin_data.version
+        return counts
+    
+    def get_questions(self):
+        return self.admin_data.load()['questions']
+    
+    def _question_index(self):
+        """Return the questions and their positions by id, reindexing them if admin data was reloaded"""
+        data = self.admin_data.load()
+        with self._index_lock:
+            if self._question_index_version != self.admin_data.version:
+                self.question_positions = {question['id']: i for i, question in enumerate(data['questions'])}
+                self._question_index_version = self.admin_data.version
+        return data['questions'], self.question_positions
+    
+    def get_question(self, question_id):
+        questions, positions = self._question_index()
+        position = positions.get(question_id)
+        return questions[position] if position is not None else None
+    
+    def add_question(self, question):
+        data = self.admin_data.load()
+        with self._index_lock:
+            in_sync = self._question_index_version == self.admin_data.version
+        
+        data['questions'].append(question)
+        self.admin_data.save(data)
+        
+        # Only the new question needs a position, the rest are unchanged
+        if in_sync:
+            with self._index_lock:
+                self.question_positions[question['id']] = len(data['questions']) - 1
+                self._question_index_version = self.admin_data.version
+    
+    def append_result(self, result):
+        return self.results.append(result)
+    
+    def get_result(self, position):
+        return self.results.read(position)
+    
+    def count_results(self):
+        return len(self.results)
+    
+    def results_generation(self):
+        return self.results.generation()
+    
+    def iter_results(self, start=0):
+        return self.results.iter_records(start)
+    
+    def save_results(self, results):
+        self.results.rewrite(results)
+    
+    def close(self):
+        self.results.close()
+
+class SQLiteBackend(StorageBackend):
+    """Stores everything in one SQLite database in WAL mode
+    
+    Users, questions and results live in their own indexed tables, so
+    adding a question or a result touches a single row. Queries are
+    parameterized with constant SQL so sqlite3 reuses its cached prepared
+    statements on every call.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('results_generation', 0);
+        
+        CREATE TABLE IF NOT EXISTS admins (
+            email TEXT PRIMARY KEY,
+            password TEXT NOT NULL
+        );
+        
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            fullname TEXT NOT NULL,
+            emailid TEXT NOT NULL,
+            phonenumber TEXT NOT NULL,
+            is_technical INTEGER NOT NULL,
+            password TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_email ON users (lower(emailid));
+        
+        CREATE TABLE IF NOT EXISTS questions (
+            id TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_questions_created_at ON questions (created_at);
+        
+        CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY,
+            session_id TEXT,
+            timestamp TEXT,
+            payload TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_results_session_id ON results (session_id);
+        CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results (timestamp);
+    """
+    
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._connections = []
+        self._lock = native_locks.Lock()
+        self._connect().executescript(self.SCHEMA)
+    
+    def _connect(self):
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, cached_statements=128, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def _bump_version(self, conn):
+        """Record a change to admins, users or questions"""
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+    
+    def _bump_results_generation(self, conn):
+        """Record that the results were replaced"""
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'results_generation'")
+    
+    @staticmethod
+    def _user_row(user):
+        return (
+            str(user['user_id']),
+            user['fullname'],
+            user['emailid'],
+            str(user['phonenumber']),
+            1 if user['is_technical'] else 0,
+            str(user['password'])
+        )
+    
+    @staticmethod
+    def _user_dict(row):
+        return {
+            'user_id': row[0],
+            'fullname': row[1],
+            'emailid': row[2],
+            'phonenumber': row[3],
+            'is_technical': bool(row[4]),
+            'password': row[5]
+        }
+    
+    def version(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0]
+    
+    def load_admin_data(self):
+        return {
+            'admins': self.get_admins(),
+            'users': self.get_users(),
+            'questions': self.get_questions()
+        }
+    
+    def save_admin_data(self, data):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM admins')
+            conn.executemany(
+                'INSERT OR REPLACE INTO admins (email, password) VALUES (?, ?)',
+                [(admin['email'], admin['password']) for admin in data.get('admins', [])]
+            )
+            self._replace_users(conn, data.get('users', []))
+            conn.execute('DELETE FROM questions')
+            conn.executemany(
+                'INSERT OR REPLACE INTO questions (id, text, created_at) VALUES (?, ?, ?)',
+                [(q['id'], q['text'], q['created_at']) for q in data.get('questions', [])]
+            )
+            self._bump_version(conn)
+    
+    def get_admins(self):
+        rows = self._connect().execute('SELECT email, password FROM admins ORDER BY rowid')
+        admins = [{'email': email, 'password': password} for email, password in rows]
+        # Match the JSON backend, which falls back to the default admin
+        return admins or default_admin_data()['admins']
+    
+    def get_admin_by_email(self, email):
+        row = self._connect().execute(
+            'SELECT email, password FROM admins WHERE lower(email) = ? ORDER BY rowid LIMIT 1',
+            (email_key(email),)
+        ).fetchone()
+        if row is not None:
+            return {'email': row[0], 'password': row[1]}
+        if self._connect().execute('SELECT 1 FROM admins LIMIT 1').fetchone() is None:
+            for admin in default_admin_data()['admins']:
+                if email_key(admin['email']) == email_key(email):
+                    return admin
+        return None
+    
+    def get_user_by_email(self, email):
+        row = self._connect().execute(
+            'SELECT user_id, fullname, emailid, phonenumber, is_technical, password '
+            'FROM users WHERE lower(emailid) = ? ORDER BY rowid LIMIT 1',
+            (email_key(email),)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._user_dict(row)
+    
+    def get_users(self):
+        rows = self._connect().execute(
+            'SELECT user_id, fullname, emailid, phonenumber, is_technical, password '
+            'FROM users ORDER BY rowid'
+        )
+        return [self._user_dict(row) for row in rows]
+    
+    def _replace_users(self, conn, users):
+        conn.execute('DELETE FROM users')
+        conn.executemany(
+            'INSERT OR REPLACE INTO users '
+            '(user_id, fullname, emailid, phonenumber, is_technical, password) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (self._user_row(user) for user in users)
+        )
+    
+    def replace_users(self, users):
+        conn = self._connect()
+        with conn:
+            self._replace_users(conn, users)
+            self._bump_version(conn)
+    
+    def upsert_users(self, chunks, progress=None):
+        conn = self._connect()
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        
+        # One transaction for every chunk, like the single save of the JSON backend
+        with conn:
+            for chunk in chunks:
+                rows = [self._user_row(user) for user in unique_users(chunk)]
+                ids = [row[0] for row in rows]
+                existing = 0
+                for start in range(0, len(ids), 500):
+                    batch = ids[start:start + 500]
+                    existing += conn.execute(
+                        'SELECT COUNT(*) FROM users WHERE user_id IN (%s)' % ','.join('?' * len(batch)),
+                        batch
+                    ).fetchone()[0]
+                
+                before = conn.total_changes
+                # Rows whose values did not change are skipped by the WHERE clause
+                conn.executemany(
+                    'INSERT INTO users '
+                    '(user_id, fullname, emailid, phonenumber, is_technical, password) '
+                    'VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (user_id) DO UPDATE SET '
+                    'fullname = excluded.fullname, emailid = excluded.emailid, '
+                    'phonenumber = excluded.phonenumber, is_technical = excluded.is_technical, '
+                    'password = excluded.password '
+                    'WHERE (users.fullname, users.emailid, users.phonenumber, users.is_technical, users.password) '
+                    'IS NOT (excluded.fullname, excluded.emailid, excluded.phonenumber, '
+                    'excluded.is_technical, excluded.password)',
+                    rows
+                )
+                changed = conn.total_changes - before
+                
+                inserted = len(rows) - existing
+                counts['inserted'] += inserted
+                counts['updated'] += changed - inserted
+                counts['unchanged'] += len(rows) - changed
+                if progress:
+                    progress(dict(counts))
+            
+            if counts['inserted'] or counts['updated']:
+                self._bump_version(conn)
+        return counts
+    
+    def get_questions(self):
+        rows = self._connect().execute('SELECT id, text, created_at FROM questions ORDER BY rowid')
+        return [{'id': qid, 'text': text, 'created_at': created_at} for qid, text, created_at in rows]
+    
+    def get_question(self, question_id):
+        row = self._connect().execute(
+            'SELECT id, text, created_at FROM questions WHERE id = ?', (question_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'text': row[1], 'created_at': row[2]}
+    
+    def add_question(self, question):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO questions (id, text, created_at) VALUES (?, ?, ?)',
+                (question['id'], question['text'], question['created_at'])
+            )
+            self._bump_version(conn)
+    
+    def append_result(self, result):
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO results (session_id, timestamp, payload) VALUES (?, ?, ?)',
+                (result.get('session_id'), result.get('timestamp'), json.dumps(result))
+            )
+        # Result ids are dense from 1, so the position is id - 1
+        return cursor.lastrowid - 1
+    
+    def get_result(self, position):
+        if position < 0:
+            position += self.count_results()
+        row = self._connect().execute(
+            'SELECT payload FROM results WHERE id = ?', (position + 1,)
+        ).fetchone()
+        if row is None:
+            raise IndexError('result position out of range')
+        return json.loads(row[0])
+    
+    def count_results(self):
+        row = self._connect().execute('SELECT MAX(id) FROM results').fetchone()
+        return row[0] or 0
+    
+    def results_generation(self):
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'results_generation'").fetchone()[0]
+    
+    def iter_results(self, start=0):
+        rows = self._connect().execute(
+            'SELECT payload FROM results WHERE id > ? ORDER BY id', (start,)
+        )
+        for payload, in rows:
+            yield json.loads(payload)
+    
+    def save_results(self, results):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM results')
+            self._insert_results(conn, results)
+            self._bump_results_generation(conn)
+    
+    def _insert_results(self, conn, results, first_id=1):
+        conn.executemany(
+            'INSERT INTO results (id, session_id, timestamp, payload) VALUES (?, ?, ?, ?)',
+            (
+                (i, result.get('session_id'), result.get('timestamp'), json.dumps(result))
+                for i, result in enumerate(results, first_id)
+            )
+        )
+    
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+def create_backend(kind, admin_data_file='admin_data.json', results_log_file='results.jsonl',
+                   results_index_file='results.idx', db_file='promptbattle.db',
+                   legacy_results_file=None):
+    """Create the storage backend selected by configuration"""
+    if kind == 'json':
+        backend = JsonBackend(admin_data_file, results_log_file, results_index_file)
+        if legacy_results_file:
+            backend.results.migrate_legacy(legacy_results_file)
+        return backend
+    if kind == 'sqlite':
+        return SQLiteBackend(db_file)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+def migrate_json_to_sqlite(admin_data_file, results_log_file, results_index_file, db_file,
+                           legacy_results_file=None, force=False):
+    """Copy admin_data.json and the results log into an SQLite database, once"""
+    source = JsonBackend(admin_data_file, results_log_file, results_index_file)
+    if legacy_results_file:
+        source.results.migrate_legacy(legacy_results_file)
+    
+    target = SQLiteBackend(db_file)
+    try:
+        if not force and (target.get_users() or target.get_questions() or target.count_results()):
+            raise RuntimeError(f"{db_file} already contains data, use force to overwrite")
+        
+        target.save_admin_data(source.load_admin_data())
+        
+        # Copy results in batches so the log never has to fit in memory
+        conn = target._connect()
+        with conn:
+            conn.execute('DELETE FROM results')
+            batch = []
+            next_id = 1
+            for result in source.iter_results():
+                batch.append(result)
+                if len(batch) >= 1000:
+                    target._insert_results(conn, batch, next_id)
+                    next_id += len(batch)
+                    batch = []
+            target._insert_results(conn, batch, next_id)
+            target._bump_results_generation(conn)
+            next_id += len(batch)
+        
+        return {
+            'users': len(target.get_users()),
+            'questions': len(target.get_questions()),
+            'results': next_id - 1
+        }
+    finally:
+        source.close()
+        target.close()
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Migrate Prompt Battle data from JSON files to SQLite')
+    parser.add_argument('--admin-data', default='admin_data.json')
+    parser.add_argument('--results-log', default='results.jsonl')
+    parser.add_argument('--results-index', default='results.idx')
+    parser.add_argument('--legacy-results', default='results.json')
+    parser.add_argument('--db', default='promptbattle.db')
+    parser.add_argument('--force', action='store_true', help='overwrite a non-empty database')
+    args = parser.parse_args()
+    
+    try:
+        counts = migrate_json_to_sqlite(args.admin_data, args.results_log, args.results_index, args.db,
+                                        legacy_results_file=args.legacy_results, force=args.force)
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
+    print(f"Migrated {counts['users']} users, {counts['questions']} questions "
+          f"and {counts['results']} results into {args.db}")
@@ -1,6 +1,6 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
-import json
 import csv
 import os
 from datetime import datetime, timedelta
@@ -8,6 +8,12 @@ import uuid
 import time
 import threading
 from typing import Dict, List, Optional
+from storage import create_backend
+from scoring import score_prompts_batch
+from leaderboard import Leaderboard
+from ratings import RatingBook
+from history import ResultHistory
+from search import QuestionSearch, UserSearch
 
 # Configure Streamlit page
 st.set_page_config(
@@ -19,43 +25,266 @@ st.set_page_config(
 
 # File paths
 ADMIN_DATA_FILE = 'admin_data.json'
-RESULTS_FILE = 'results.json'
+RESULTS_FILE = 'results.json'  # Legacy format, migrated to the log on startup
+RESULTS_LOG_FILE = 'results.jsonl'
+RESULTS_INDEX_FILE = 'results.idx'
+SQLITE_DB_FILE = 'promptbattle.db'
+LEADERBOARD_FILE = 'leaderboard.db'  # Player and question stats, kept in step with the results
+RATINGS_FILE = 'ratings.db'  # Elo ratings from every game's ranking
+HISTORY_FILE = 'history.db'  # Index of results by date, question and player
 USERS_CSV_FILE = 'users.csv'
 
+# Rows per chunk when importing users from CSV
+IMPORT_CHUNK_SIZE = 1000
+
+# Storage backend: 'json' (admin_data.json + results log) or 'sqlite'
+STORAGE_BACKEND = os.environ.get('PROMPTBATTLE_STORAGE', 'json')
+
+# Seconds between checks of the shared game state by open pages
+GAME_POLL_INTERVAL = 1
+
+# Games per page on the results page, and games counted at most for its total
+RESULTS_PAGE_SIZE = 20
+RESULTS_TOTAL_LIMIT = 1000
+
+# Search matches offered at a time by the player picker
+PLAYER_SEARCH_PAGE_SIZE = 20
+
+# Questions per page on the question management page
+QUESTION_PAGE_SIZE = 20
+
+# Partial reruns need st.fragment (Streamlit 1.37+) or st.experimental_fragment
+# (1.33+); on older versions pages only update on their own full reruns
+if hasattr(st, 'fragment'):
+    fragment = st.fragment
+elif hasattr(st, 'experimental_fragment'):
+    fragment = st.experimental_fragment
+else:
+    def fragment(func=None, *, run_every=None):
+        return func if func is not None else (lambda func: func)
+
+@st.cache_resource
+def get_storage():
+    """Get the process-wide storage backend, migrating legacy results once"""
+    return create_backend(STORAGE_BACKEND, ADMIN_DATA_FILE, RESULTS_LOG_FILE, RESULTS_INDEX_FILE,
+                          SQLITE_DB_FILE, legacy_results_file=RESULTS_FILE)
+
+@st.cache_resource
+def get_leaderboard():
+    """Get the process-wide leaderboard"""
+    return Leaderboard(LEADERBOARD_FILE)
+
+@st.cache_resource
+def get_ratings():
+    """Get the process-wide rating book"""
+    return RatingBook(RATINGS_FILE)
+
+@st.cache_resource
+def get_user_search():
+    """Get the process-wide user search index"""
+    return UserSearch()
+
+@st.cache_resource
+def get_question_search():
+    """Get the process-wide question search index"""
+    return QuestionSearch()
+
+@st.cache_resource
+def get_history():
+    """Get the process-wide results history index"""
+    return ResultHistory(HISTORY_FILE)
+
+# Reads below are cached per data version, so reruns that find the same
+# version reuse the last result instead of reading the files again. The
+# version is passed in only as the cache key. Writes clear the caches
+# they affect through invalidate_admin_data() and invalidate_results().
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def cached_users(version):
+    """All users as of an admin data version"""
+    return DataManager.get_users()
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def cached_player_names(version):
+    """Full names by user id, for showing players that games store by id"""
+    return {str(user['user_id']): user['fullname'] for user in cached_users(version)}
+
+def with_player_names(frame, names):
+    """A table with each player's full name next to their id; unknown players keep the id"""
+    if 'player' not in frame:
+        return frame
+    frame = frame.copy()
+    frame.insert(frame.columns.get_loc('player') + 1, 'fullname',
+                 frame['player'].map(lambda player: names.get(str(player), player)))
+    return frame
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def cached_users_frame(version):
+    """Users table for the user management page"""
+    df = pd.DataFrame(cached_users(version))
+    if not df.empty:
+        df['is_technical'] = df['is_technical'].map({True: 'Yes', False: 'No'})
+    return df
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def cached_questions(version):
+    """All questions as of an admin data version"""
+    return DataManager.get_questions()
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def cached_question_options(version):
+    """Questions keyed by their question picker label"""
+    return {f"Q{i+1}: {q['text'][:30]}...": q for i, q in enumerate(cached_questions(version))}
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_results_page(version, **filters):
+    """One page of results and their evaluation tables as of a results count"""
+    page = DataManager.query_results(**filters)
+    page['results'] = [
+        (result, pd.DataFrame(result['evaluation']) if isinstance(result['evaluation'], list) else None)
+        for result in page['results']
+    ]
+    return page
+
+def invalidate_admin_data():
+    """Drop cached users and questions after they were written"""
+    for cached in (cached_users, cached_player_names, cached_users_frame, cached_questions, cached_question_options):
+        cached.clear()
+
+def invalidate_results():
+    """Drop cached results after they were written"""
+    cached_results_page.clear()
+
 class DataManager:
-    """Handles all data operations for JSON files"""
+    """Handles all data operations through the configured storage backend"""
     
     @staticmethod
     def load_admin_data():
-        """Load admin data from JSON file"""
-        if os.path.exists(ADMIN_DATA_FILE):
-            with open(ADMIN_DATA_FILE, 'r') as f:
-                return json.load(f)
-        return {
-            'admins': [{'email': 'admin@example.com', 'password': 'admin123'}],
-            'users': [],
-            'questions': []
-        }
+        """Load admins, users and questions as one document"""
+        return get_storage().load_admin_data()
     
     @staticmethod
     def save_admin_data(data):
-        """Save admin data to JSON file"""
-        with open(ADMIN_DATA_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        """Save admins, users and questions from one document"""
+        get_storage().save_admin_data(data)
+        invalidate_admin_data()
+    
+    @staticmethod
+    def admin_data_version():
+        """Version counter that changes whenever admin data changes"""
+        return get_storage().version()
+    
+    @staticmethod
+    def get_admins():
+        """Get all admins"""
+        return get_storage().get_admins()
+    
+    @staticmethod
+    def get_users():
+        """Get all users"""
+        return get_storage().get_users()
+    
+    @staticmethod
+    def get_admin_by_email(email):
+        """Get an admin by case-insensitive email"""
+        return get_storage().get_admin_by_email(email)
+    
+    @staticmethod
+    def get_user_by_email(email):
+        """Get a user by case-insensitive email"""
+        return get_storage().get_user_by_email(email)
+    
+    @staticmethod
+    def replace_users(users):
+        """Replace all users"""
+        get_storage().replace_users(users)
+        invalidate_admin_data()
+    
+    @staticmethod
+    def upsert_users(chunks, progress=None):
+        """Insert or update users by user_id, chunk by chunk"""
+        try:
+            return get_storage().upsert_users(chunks, progress)
+        finally:
+            # Chunks written before a failure are visible too
+            invalidate_admin_data()
+    
+    @staticmethod
+    def search_users(query='', is_technical=None, page=1, page_size=PLAYER_SEARCH_PAGE_SIZE):
+        """One page of users whose name or email matches the query, without passwords"""
+        return get_user_search().search(get_storage(), query, is_technical, page, page_size)
+    
+    @staticmethod
+    def get_questions():
+        """Get all questions"""
+        return get_storage().get_questions()
+    
+    @staticmethod
+    def get_question(question_id):
+        """Get a question by ID"""
+        return get_storage().get_question(question_id)
+    
+    @staticmethod
+    def add_question(question):
+        """Store a new question and add it to the search index"""
+        version = get_storage().version()
+        get_storage().add_question(question)
+        get_question_search().add(get_storage(), question, version)
+        invalidate_admin_data()
+    
+    @staticmethod
+    def search_questions(query='', page=1, page_size=QUESTION_PAGE_SIZE):
+        """One page of questions ranked by how well they match the query"""
+        return get_question_search().search(get_storage(), query, page, page_size)
     
     @staticmethod
     def load_results():
-        """Load results from JSON file"""
-        if os.path.exists(RESULTS_FILE):
-            with open(RESULTS_FILE, 'r') as f:
-                return json.load(f)
-        return []
+        """Load all results"""
+        return get_storage().load_results()
+    
+    @staticmethod
+    def results_version():
+        """Number of saved results, which grows with every appended result"""
+        return get_storage().count_results()
     
     @staticmethod
     def save_results(results):
-        """Save results to JSON file"""
-        with open(RESULTS_FILE, 'w') as f:
-            json.dump(results, f, indent=2)
+        """Replace all results"""
+        get_storage().save_results(results)
+        invalidate_results()
+        get_leaderboard().rebuild(get_storage())
+        get_ratings().rebuild(get_storage())
+        get_history().rebuild(get_storage())
+    
+    @staticmethod
+    def append_result(result):
+        """Append a single result and count it on the leaderboard, ratings and history"""
+        position = get_storage().append_result(result)
+        invalidate_results()
+        get_leaderboard().refresh(get_storage())
+        get_ratings().refresh(get_storage())
+        get_history().refresh(get_storage())
+        return position
+    
+    @staticmethod
+    def query_results(**filters):
+        """One page of saved results matching the filters"""
+        return get_history().query(get_storage(), **filters)
+    
+    @staticmethod
+    def leaderboard_players(sort='wins', limit=None):
+        """Per-player stats from the leaderboard, best first"""
+        return get_leaderboard().players(get_storage(), sort, limit)
+    
+    @staticmethod
+    def leaderboard_questions():
+        """Per-question stats from the leaderboard"""
+        return get_leaderboard().questions(get_storage())
+    
+    @staticmethod
+    def suggest_players(pool, count, around=None):
+        """Players from pool with the closest ratings"""
+        return get_ratings().suggest(get_storage(), pool, count, around)
 
 class UserManager:
     """Handles user-related operations"""
@@ -78,53 +307,47 @@ class UserManager:
                 writer.writerows(sample_data)
     
     @staticmethod
-    def import_users_from_csv():
-        """Import users from CSV file"""
-        admin_data = DataManager.load_admin_data()
-        users = []
-        
-        if os.path.exists(USERS_CSV_FILE):
-            df = pd.read_csv(USERS_CSV_FILE)
-            for _, row in df.iterrows():
-                user = {
-                    'user_id': str(row['user_id']),
-                    'fullname': row['fullname'],
-                    'emailid': row['emailid'],
-                    'phonenumber': str(row['phonenumber']),
-                    'is_technical': str(row['IsTechnical']).lower() == 'yes',
-                    'password': str(row['phonenumber'])  # Default password is phone number
-                }
-                users.append(user)
-        
-        admin_data['users'] = users
-        DataManager.save_admin_data(admin_data)
-        return users
+    def iter_csv_user_chunks(chunk_size=IMPORT_CHUNK_SIZE):
+        """Stream users from the CSV file in fixed-size chunks"""
+        reader = pd.read_csv(USERS_CSV_FILE, chunksize=chunk_size, dtype=str, keep_default_na=False)
+        for df in reader:
+            users = pd.DataFrame({
+                'user_id': df['user_id'],
+                'fullname': df['fullname'],
+                'emailid': df['emailid'],
+                'phonenumber': df['phonenumber'],
+                'is_technical': df['IsTechnical'].str.lower() == 'yes',
+                'password': df['phonenumber']  # Default password is phone number
+            })
+            yield users.to_dict('records')
+    
+    @staticmethod
+    def import_users_from_csv(progress=None):
+        """Import users from CSV file, upserting them by user_id chunk by chunk"""
+        if not os.path.exists(USERS_CSV_FILE):
+            return {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        return DataManager.upsert_users(UserManager.iter_csv_user_chunks(), progress)
     
     @staticmethod
     def authenticate_user(email, password):
-        """Authenticate user login"""
-        admin_data = DataManager.load_admin_data()
-        
-        for user in admin_data['users']:
-            if user['emailid'] == email and user['password'] == password:
-                return user
+        """Authenticate user login with an indexed email lookup"""
+        user = DataManager.get_user_by_email(email)
+        if user and user['password'] == password:
+            return user
         return None
     
     @staticmethod
     def authenticate_admin(email, password):
-        """Authenticate admin login"""
-        admin_data = DataManager.load_admin_data()
-        
-        for admin in admin_data['admins']:
-            if admin['email'] == email and admin['password'] == password:
-                return admin
+        """Authenticate admin login with an indexed email lookup"""
+        admin = DataManager.get_admin_by_email(email)
+        if admin and admin['password'] == password:
+            return admin
         return None
     
     @staticmethod
     def get_all_users():
-        """Get all users"""
-        admin_data = DataManager.load_admin_data()
-        return admin_data['users']
+        """Get all users, cached until they change"""
+        return cached_users(DataManager.admin_data_version())
 
 class QuestionManager:
     """Handles question-related operations"""
@@ -132,80 +355,157 @@ class QuestionManager:
     @staticmethod
     def add_question(question_text):
         """Add a new question"""
-        admin_data = DataManager.load_admin_data()
-        
         question = {
             'id': str(uuid.uuid4()),
             'text': question_text,
             'created_at': datetime.now().isoformat()
         }
         
-        admin_data['questions'].append(question)
-        DataManager.save_admin_data(admin_data)
+        DataManager.add_question(question)
         return question
     
     @staticmethod
     def get_all_questions():
-        """Get all questions"""
-        admin_data = DataManager.load_admin_data()
-        return admin_data['questions']
+        """Get all questions, cached until they change"""
+        return cached_questions(DataManager.admin_data_version())
     
     @staticmethod
     def get_question_by_id(question_id):
         """Get question by ID"""
-        admin_data = DataManager.load_admin_data()
-        
-        for question in admin_data['questions']:
-            if question['id'] == question_id:
-                return question
-        return None
+        return DataManager.get_question(question_id)
+
+class SharedGameStore:
+    """Game sessions shared by every browser connected to this Streamlit process
+    
+    st.session_state is per browser tab, so sessions live here behind a
+    lock instead. version counts changes to the current session and to any
+    session's lifecycle; each session also counts its prompt changes in
+    prompts_version and per player in prompt_versions. Views compare these
+    counters to tell whether their slice changed without copying anything.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sessions = {}
+        self.current_session_id = None
+        self.version = 0
+    
+    def create_session(self, session_id, data):
+        """Add a session and make it the current one"""
+        with self._lock:
+            self.sessions[session_id] = dict(data, player_prompts={}, prompt_versions={}, prompts_version=0)
+            self.current_session_id = session_id
+            self.version += 1
+    
+    def update_session(self, session_id, fields):
+        """Change lifecycle fields of a session, return whether it exists"""
+        with self._lock:
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return False
+            session_data.update(fields)
+            self.version += 1
+            return True
+    
+    def expire_sessions(self, now):
+        """Stop every active session whose deadline has passed"""
+        with self._lock:
+            expired = False
+            for session_data in self.sessions.values():
+                if session_data['is_active'] and session_data['end_time'] and now >= session_data['end_time']:
+                    session_data['is_active'] = False
+                    expired = True
+            if expired:
+                self.version += 1
+    
+    def set_prompt(self, session_id, player_id, prompt):
+        """Store a player's prompt and return its new version, or None"""
+        with self._lock:
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return None
+            if session_data['player_prompts'].get(player_id) == prompt:
+                return session_data['prompt_versions'].get(player_id, 0)
+            session_data['player_prompts'][player_id] = prompt
+            session_data['prompt_versions'][player_id] = session_data['prompt_versions'].get(player_id, 0) + 1
+            session_data['prompts_version'] += 1
+            return session_data['prompt_versions'][player_id]
+    
+    def get_session(self, session_id):
+        """Copy of a session that is safe to read while others write, or None"""
+        with self._lock:
+            session_data = self.sessions.get(session_id)
+            if session_data is None:
+                return None
+            return dict(session_data, player_prompts=dict(session_data['player_prompts']),
+                        prompt_versions=dict(session_data['prompt_versions']))
+    
+    def current(self):
+        """The current session id and the store version it was read at"""
+        with self._lock:
+            return self.current_session_id, self.version
+    
+    def prompts_version(self, session_id):
+        """How many prompt changes a session has seen"""
+        with self._lock:
+            session_data = self.sessions.get(session_id)
+            return session_data['prompts_version'] if session_data else None
+
+@st.cache_resource
+def get_game_store():
+    """Get the process-wide game store"""
+    return SharedGameStore()
 
 class GameManager:
-    """Handles game session management"""
+    """Handles game session management on the shared game store"""
     
     def __init__(self):
-        if 'game_sessions' not in st.session_state:
-            st.session_state.game_sessions = {}
-        if 'current_session_id' not in st.session_state:
-            st.session_state.current_session_id = None
-        if 'player_prompts' not in st.session_state:
-            st.session_state.player_prompts = {}
+        self.store = get_game_store()
     
     def create_session(self, question, timer_duration, selected_players):
         """Create a new game session"""
         session_id = str(uuid.uuid4())
         
-        st.session_state.game_sessions[session_id] = {
+        self.store.create_session(session_id, {
             'question': question,
             'timer_duration': timer_duration,
             'selected_players': selected_players,
             'is_active': False,
             'start_time': None,
-            'end_time': None,
-            'player_prompts': {}
-        }
-        
-        st.session_state.current_session_id = session_id
+            'end_time': None
+        })
         return session_id
     
+    def current_session(self):
+        """The current session id, or None"""
+        return self.store.current()[0]
+    
+    def get_session(self, session_id):
+        """Get a session, or None"""
+        return self.store.get_session(session_id)
+    
     def start_session(self, session_id):
         """Start a game session"""
-        if session_id in st.session_state.game_sessions:
-            st.session_state.game_sessions[session_id]['is_active'] = True
-            st.session_state.game_sessions[session_id]['start_time'] = datetime.now()
-            st.session_state.game_sessions[session_id]['end_time'] = (
-                datetime.now() + timedelta(seconds=st.session_state.game_sessions[session_id]['timer_duration'])
-            )
+        session_data = self.store.get_session(session_id)
+        if session_data is not None:
+            start_time = datetime.now()
+            self.store.update_session(session_id, {
+                'is_active': True,
+                'start_time': start_time,
+                'end_time': start_time + timedelta(seconds=session_data['timer_duration'])
+            })
     
     def stop_session(self, session_id):
         """Stop a game session"""
-        if session_id in st.session_state.game_sessions:
-            st.session_state.game_sessions[session_id]['is_active'] = False
+        self.store.update_session(session_id, {'is_active': False})
+    
+    def expire_sessions(self):
+        """Stop every active session whose deadline has passed"""
+        self.store.expire_sessions(datetime.now())
     
     def update_player_prompt(self, session_id, player_id, prompt):
         """Update player's prompt"""
-        if session_id in st.session_state.game_sessions:
-            st.session_state.game_sessions[session_id]['player_prompts'][player_id] = prompt
+        return self.store.set_prompt(session_id, player_id, prompt)
 
 class LLMEvaluator:
     """Handles LLM evaluation (mock implementation)"""
@@ -214,29 +514,8 @@ class LLMEvaluator:
     def evaluate_prompts(question, prompts):
         """Evaluate prompts using mock LLM"""
         try:
-            evaluation_results = []
-            
-            for player, prompt in prompts.items():
-                # Mock evaluation criteria
-                relevance_score = min(10, len(prompt.split()) * 0.5)  # Simple word count scoring
-                creativity_score = min(10, len(set(prompt.lower().split())) * 0.3)  # Unique words
-                clarity_score = min(10, 10 - prompt.count(',') * 0.5) if ',' in prompt else 8
-                
-                total_score = (relevance_score + creativity_score + clarity_score) / 3
-                
-                evaluation_results.append({
-                    'player': player,
-                    'prompt': prompt,
-                    'relevance': round(relevance_score, 1),
-                    'creativity': round(creativity_score, 1),
-                    'clarity': round(clarity_score, 1),
-                    'total_score': round(total_score, 1)
-                })
-            
-            # Sort by total score
-            evaluation_results.sort(key=lambda x: x['total_score'], reverse=True)
-            
-            return evaluation_results
+            # Scores every prompt in one vectorized pass, sorted by total score
+            return score_prompts_batch(prompts)
             
         except Exception as e:
             return f"Error in evaluation: {str(e)}"
@@ -322,7 +601,7 @@ def admin_dashboard():
     # Sidebar navigation
     with st.sidebar:
         st.markdown(f"### Welcome, Admin!")
-        page = st.selectbox("Navigate to:", ["User Management", "Question Management", "Playground", "Results"])
+        page = st.selectbox("Navigate to:", ["User Management", "Question Management", "Playground", "Leaderboard", "Results"])
     
     if page == "User Management":
         user_management_page()
@@ -331,6 +610,8 @@ def admin_dashboard():
     elif page == "Playground":
         st.session_state.current_page = 'playground'
         st.rerun()
+    elif page == "Leaderboard":
+        leaderboard_page()
     elif page == "Results":
         results_page()
 
@@ -343,8 +624,12 @@ def user_management_page():
     with col1:
         if st.button("📥 Import Users from CSV", type="primary"):
             try:
-                users = UserManager.import_users_from_csv()
-                st.success(f"Successfully imported {len(users)} users!")
+                status = st.empty()
+                counts = UserManager.import_users_from_csv(
+                    progress=lambda c: status.info(f"Processed {sum(c.values())} rows...")
+                )
+                status.success(f"Imported {counts['inserted']} new and {counts['updated']} updated users "
+                               f"({counts['unchanged']} unchanged)")
                 st.rerun()
             except Exception as e:
                 st.error(f"Error importing users: {str(e)}")
@@ -358,15 +643,17 @@ def user_management_page():
     
     with col2:
         st.subheader("Current Users")
-        users = UserManager.get_all_users()
+        df = cached_users_frame(DataManager.admin_data_version())
         
-        if users:
-            df = pd.DataFrame(users)
-            df['is_technical'] = df['is_technical'].map({True: 'Yes', False: 'No'})
+        if not df.empty:
             st.dataframe(df, use_container_width=True)
         else:
             st.info("No users found. Please import users from CSV.")
 
+def reset_question_page():
+    """Show the first page of questions again"""
+    st.session_state.question_page = 1
+
 def question_management_page():
     """Question management interface"""
     st.header("❓ Question Management")
@@ -384,41 +671,132 @@ def question_management_page():
             else:
                 st.error("Please enter a question")
     
-    # Display existing questions
+    # Display existing questions, one page of the best matches at a time
     st.subheader("Existing Questions")
-    questions = QuestionManager.get_all_questions()
+    query = st.text_input("Search questions", key='question_search', on_change=reset_question_page)
+    page = DataManager.search_questions(query, st.session_state.get('question_page', 1))
     
-    if questions:
-        for i, question in enumerate(questions):
-            with st.expander(f"Question {i+1}: {question['text'][:50]}..."):
+    if page['total']:
+        first = (page['page'] - 1) * page['page_size']
+        st.caption(f"Questions {first + 1}-{first + len(page['questions'])} of {page['total']}")
+        for question in page['questions']:
+            with st.expander(f"Question {question['position']+1}: {question['text'][:50]}..."):
                 st.write(f"**Full Question:** {question['text']}")
                 st.write(f"**Created:** {question['created_at']}")
                 st.write(f"**ID:** {question['id']}")
+        
+        if page['pages'] > 1:
+            st.number_input("Page", min_value=1, max_value=page['pages'], key='question_page')
+    elif query.strip():
+        st.info("No questions match your search.")
     else:
         st.info("No questions found. Add some questions to get started!")
 
+def leaderboard_page():
+    """Player and question standings across all games"""
+    st.header("🏆 Leaderboard")
+    
+    sort_options = {"Wins": 'wins', "Average score": 'average', "Best score": 'best', "Games played": 'games'}
+    sort_label = st.selectbox("Rank players by", options=list(sort_options.keys()))
+    players = DataManager.leaderboard_players(sort_options[sort_label])
+    
+    if players:
+        names = cached_player_names(DataManager.admin_data_version())
+        st.dataframe(with_player_names(pd.DataFrame(players), names), use_container_width=True)
+        
+        st.subheader("❓ Questions")
+        questions = pd.DataFrame(DataManager.leaderboard_questions())
+        questions['best_player'] = questions['best_player'].map(lambda player: names.get(player, player))
+        st.dataframe(questions, use_container_width=True)
+    else:
+        st.info("No evaluated games yet.")
+
+def reset_results_page():
+    """Show the first page of results again"""
+    # Cursors of the pages seen so far, the first page has none
+    st.session_state.results_cursors = [None]
+
+def next_results_page(cursor):
+    """Show the page of results after cursor"""
+    st.session_state.results_cursors.append(cursor)
+
+def previous_results_page():
+    """Show the page of results before the current one"""
+    st.session_state.results_cursors.pop()
+
 def results_page():
     """Results viewing interface"""
     st.header("📊 Game Results")
     
-    results = DataManager.load_results()
+    question_options = {"All questions": None}
+    question_options.update(
+        (label, question['id']) for label, question in cached_question_options(DataManager.admin_data_version()).items()
+    )
+    sort_options = {"Newest first": 'newest', "Oldest first": 'oldest', "Top score": 'top_score'}
     
-    if results:
-        for i, result in enumerate(reversed(results)):  # Show latest first
-            with st.expander(f"Game {len(results)-i} - {result['timestamp'][:19]}"):
+    # Any change to the filters goes back to the first page
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        since = st.date_input("From", value=None, key='results_since', on_change=reset_results_page)
+    with col2:
+        until = st.date_input("To", value=None, key='results_until', on_change=reset_results_page)
+    with col3:
+        question_label = st.selectbox("Question", options=list(question_options.keys()),
+                                      key='results_question', on_change=reset_results_page)
+    with col4:
+        player = st.text_input("Player name or user id", key='results_player', on_change=reset_results_page).strip()
+    with col5:
+        sort_label = st.selectbox("Sort", options=list(sort_options.keys()), key='results_sort', on_change=reset_results_page)
+    
+    # Games store players by user id, older games by name: match the player
+    # under either
+    names = cached_player_names(DataManager.admin_data_version())
+    players = None
+    if player:
+        user_ids = [user_id for user_id, name in names.items()
+                    if user_id == player or name.lower() == player.lower()]
+        players = tuple(sorted({player, *user_ids, *(names[user_id] for user_id in user_ids)}))
+    
+    if 'results_cursors' not in st.session_state:
+        reset_results_page()
+    cursors = st.session_state.results_cursors
+    page = cached_results_page(
+        DataManager.results_version(),
+        since=since.isoformat() if since else None,
+        until=until.isoformat() if until else None,
+        question_id=question_options[question_label],
+        player=players,
+        sort=sort_options[sort_label],
+        cursor=cursors[-1],
+        page_size=RESULTS_PAGE_SIZE,
+        total_limit=RESULTS_TOTAL_LIMIT
+    )
+    
+    if page['results']:
+        first = (len(cursors) - 1) * page['page_size']
+        total = f"{page['total']}" if page['total_exact'] else f"more than {page['total']}"
+        st.caption(f"Games {first + 1}-{first + len(page['results'])} of {total}")
+        for result, eval_df in page['results']:
+            with st.expander(f"Game {result['position'] + 1} - {result['timestamp'][:19]}"):
                 st.write(f"**Question:** {result['question']}")
                 st.write(f"**Evaluation:**")
                 
-                if isinstance(result['evaluation'], list):
+                if eval_df is not None:
                     # Display as table
-                    eval_df = pd.DataFrame(result['evaluation'])
-                    st.dataframe(eval_df, use_container_width=True)
+                    st.dataframe(with_player_names(eval_df, names), use_container_width=True)
                 else:
                     st.write(result['evaluation'])
                 
                 st.write("**Player Prompts:**")
-                for player, prompt in result['prompts'].items():
-                    st.write(f"- **{player}:** {prompt}")
+                for player_id, prompt in result['prompts'].items():
+                    st.write(f"- **{names.get(player_id, player_id)}:** {prompt}")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.button("Previous", disabled=len(cursors) == 1, on_click=previous_results_page)
+        with col2:
+            st.button("Next", disabled=page['next_cursor'] is None, on_click=next_results_page,
+                      args=(page['next_cursor'],))
     else:
         st.info("No game results found yet.")
 
@@ -426,8 +804,9 @@ def playground_page():
     """Main playground interface"""
     st.title("⚔️ Prompt Battle Playground")
     
-    # Initialize game manager
+    # Initialize game manager and stop any session whose time is up
     game_manager = GameManager()
+    game_manager.expire_sessions()
     
     # Display timer
     timer_col1, timer_col2, timer_col3 = st.columns([1, 2, 1])
@@ -442,11 +821,11 @@ def playground_page():
     # Game area
     st.markdown("---")
     
-    # Current question display
-    current_session_id = st.session_state.current_session_id
-    if current_session_id and current_session_id in st.session_state.game_sessions:
-        session_data = st.session_state.game_sessions[current_session_id]
-        
+    # Current question display, as of the store version this run rendered
+    current_session_id, version = game_manager.store.current()
+    st.session_state.game_state_version = version
+    session_data = game_manager.get_session(current_session_id) if current_session_id else None
+    if session_data:
         st.subheader("📝 Current Question")
         st.info(session_data['question']['text'])
         
@@ -455,16 +834,26 @@ def playground_page():
         
         if st.session_state.user_type == 'admin':
             # Admin can see all player prompts
-            display_all_player_prompts(current_session_id, session_data)
+            display_all_player_prompts(current_session_id)
         else:
             # Player can only see their own prompt area
             display_player_prompt_area(current_session_id)
         
         # Timer logic
-        if session_data['is_active']:
+        if session_data['end_time']:
             display_timer(timer_placeholder, session_data)
     else:
         st.info("No active game session. Admin can start a new game using the controls above.")
+    
+    watch_game_state()
+
+@fragment(run_every=GAME_POLL_INTERVAL)
+def watch_game_state():
+    """Rerun the whole page only when the current session or its lifecycle changes"""
+    game_manager = GameManager()
+    game_manager.expire_sessions()
+    if game_manager.store.current()[1] != st.session_state.get('game_state_version'):
+        st.rerun()
 
 def admin_controls(game_manager, timer_placeholder):
     """Admin control panel"""
@@ -478,24 +867,12 @@ def admin_controls(game_manager, timer_placeholder):
     
     with col2:
         st.subheader("👥 Players")
-        users = UserManager.get_all_users()
-        if users:
-            user_options = {f"{user['fullname']} ({user['emailid']})": user for user in users}
-            selected_users = st.multiselect(
-                "Select Players",
-                options=list(user_options.keys()),
-                default=list(user_options.keys())[:2]
-            )
-            selected_player_data = [user_options[user] for user in selected_users]
-        else:
-            st.warning("No users available. Please import users first.")
-            selected_player_data = []
+        selected_player_data = player_picker()
     
     with col3:
         st.subheader("❓ Questions")
-        questions = QuestionManager.get_all_questions()
-        if questions:
-            question_options = {f"Q{i+1}: {q['text'][:30]}...": q for i, q in enumerate(questions)}
+        question_options = cached_question_options(DataManager.admin_data_version())
+        if question_options:
             selected_question_key = st.selectbox("Select Question", options=list(question_options.keys()))
             selected_question = question_options[selected_question_key] if selected_question_key else None
         else:
@@ -513,10 +890,9 @@ def admin_controls(game_manager, timer_placeholder):
             else:
                 st.error("Please select question, players, and set timer")
         
-        current_session_id = st.session_state.current_session_id
-        session_active = (current_session_id and 
-                         current_session_id in st.session_state.game_sessions and
-                         st.session_state.game_sessions[current_session_id]['is_active'])
+        current_session_id = game_manager.current_session()
+        current_session = game_manager.get_session(current_session_id) if current_session_id else None
+        session_active = bool(current_session and current_session['is_active'])
         
         col4a, col4b = st.columns(2)
         with col4a:
@@ -536,10 +912,82 @@ def admin_controls(game_manager, timer_placeholder):
         if st.button("📊 Evaluate", disabled=not current_session_id):
             evaluate_game_session(current_session_id)
 
-def display_all_player_prompts(session_id, session_data):
-    """Display all player prompt areas for admin monitoring"""
-    selected_players = session_data['selected_players']
+def player_label(user):
+    """How a user is shown in the player picker"""
+    return f"{user['fullname']} ({user['emailid']})"
+
+def player_picker():
+    """Search for players and select them, loading one page of matches at a time
+    
+    Selected players are kept in st.session_state.selected_players, so
+    they stay selected when a new search no longer matches them.
+    """
+    technical_options = {"Everyone": None, "Technical": True, "Non-technical": False}
+    query = st.text_input("Search players", key='player_search', placeholder="Name or email")
+    technical_label = st.radio("Show", options=list(technical_options.keys()), key='player_filter', horizontal=True)
+    matches = DataManager.search_users(query, technical_options[technical_label])
+    if not matches['total'] and not query and technical_options[technical_label] is None:
+        st.warning("No users available. Please import users first.")
+        return []
+    
+    options = {player_label(user): user for user in matches['users']}
+    selected = st.session_state.get('selected_players', {})
+    if 'selected_player_labels' not in st.session_state:
+        st.session_state.selected_player_labels = list(options.keys())[:2]
+    selected = {
+        label: selected.get(label) or options[label]
+        for label in st.session_state.selected_player_labels if label in selected or label in options
+    }
+    st.session_state.selected_players = selected
+    st.session_state.selected_player_labels = list(selected.keys())
+    
+    st.button("⚖️ Suggest Balanced Players", on_click=suggest_balanced_players,
+              args=(query, technical_options[technical_label]),
+              help="Pick players with the closest ratings among the matches, as many as are selected now")
+    selected_labels = st.multiselect(
+        "Select Players",
+        options=list(dict.fromkeys([*selected.keys(), *options.keys()])),
+        key='selected_player_labels'
+    )
+    if matches['total'] > len(matches['users']):
+        st.caption(f"Showing {len(matches['users'])} of {matches['total']} matches. Type to narrow them down.")
+    return [selected.get(label) or options[label] for label in selected_labels]
+
+def suggest_balanced_players(query, is_technical):
+    """Replace the player selection with evenly rated players among the search matches"""
+    count = max(2, len(st.session_state.get('selected_player_labels', [])))
+    
+    # Ratings are keyed by user id, like the games they come from
+    users = {str(user['user_id']): user for user in DataManager.search_users(query, is_technical, page_size=None)['users']}
+    
+    suggested = DataManager.suggest_players(users.keys(), count)
+    if suggested:
+        selected = {player_label(users[entry['player']]): users[entry['player']] for entry in suggested}
+        st.session_state.selected_players = selected
+        st.session_state.selected_player_labels = list(selected.keys())
+
+@fragment(run_every=GAME_POLL_INTERVAL)
+def display_all_player_prompts(session_id):
+    """Display all player prompt areas for admin monitoring
+    
+    Runs as a fragment that polls the store's prompt counter, so only this
+    grid refreshes, and the session is only copied when a prompt changed.
+    """
+    version = get_game_store().prompts_version(session_id)
+    snapshot = st.session_state.get('monitor_snapshot')
+    if snapshot is None or snapshot['key'] != (session_id, version):
+        session_data = get_game_store().get_session(session_id)
+        if session_data is None:
+            return
+        snapshot = {
+            'key': (session_id, version),
+            'selected_players': session_data['selected_players'],
+            'player_prompts': session_data['player_prompts'],
+            'prompt_versions': session_data['prompt_versions']
+        }
+        st.session_state.monitor_snapshot = snapshot
     
+    selected_players = snapshot['selected_players']
     cols = st.columns(min(len(selected_players), 3))  # Max 3 columns
     
     for i, player in enumerate(selected_players):
@@ -548,91 +996,114 @@ def display_all_player_prompts(session_id, session_data):
             st.write(f"**{player['fullname']}**")
             
             # Get current prompt
-            current_prompt = session_data['player_prompts'].get(player['user_id'], '')
+            current_prompt = snapshot['player_prompts'].get(player['user_id'], '')
+            prompt_version = snapshot['prompt_versions'].get(player['user_id'], 0)
             
-            # Display prompt (read-only for admin)
+            # Display prompt (read-only for admin), a new widget per prompt version
             st.text_area(
                 f"Prompt for {player['fullname']}",
                 value=current_prompt,
                 height=150,
                 disabled=True,
-                key=f"admin_view_{player['user_id']}"
+                key=f"admin_view_{session_id}_{player['user_id']}_{prompt_version}"
             )
 
+def save_player_prompt(session_id, user_id, key):
+    """Store the player's edited prompt while their game is active"""
+    game_manager = GameManager()
+    session_data = game_manager.get_session(session_id)
+    if session_data and session_data['is_active']:
+        game_manager.update_player_prompt(session_id, user_id, st.session_state[key])
+
+@fragment
 def display_player_prompt_area(session_id):
-    """Display prompt area for individual player"""
+    """Display prompt area for individual player
+    
+    Runs as a fragment, so saving a prompt reruns only the editor.
+    """
     user_id = st.session_state.user_data['user_id']
-    session_data = st.session_state.game_sessions[session_id]
+    session_data = GameManager().get_session(session_id)
+    if session_data is None:
+        return
     
     # Check if current user is in selected players
     is_selected = any(player['user_id'] == user_id for player in session_data['selected_players'])
     
     if is_selected:
-        current_prompt = session_data['player_prompts'].get(user_id, '')
+        key = f"prompt_{session_id}"
+        if key not in st.session_state:
+            st.session_state[key] = session_data['player_prompts'].get(user_id, '')
         
         # Disable editing if game is not active
         disabled = not session_data['is_active']
         
-        new_prompt = st.text_area(
+        st.text_area(
             f"Your Prompt ({st.session_state.user_data['fullname']})",
-            value=current_prompt,
+            key=key,
             height=200,
             disabled=disabled,
+            on_change=save_player_prompt,
+            args=(session_id, user_id, key),
             help="Enter your response to the question above" if not disabled else "Game is not active"
         )
-        
-        # Update prompt if changed and game is active
-        if new_prompt != current_prompt and session_data['is_active']:
-            st.session_state.game_sessions[session_id]['player_prompts'][user_id] = new_prompt
-            st.rerun()
     else:
         st.warning("You are not selected for this game session.")
 
 def display_timer(timer_placeholder, session_data):
-    """Display and update timer"""
-    if session_data['end_time']:
-        remaining_time = session_data['end_time'] - datetime.now()
+    """Display a countdown that the browser runs locally until the deadline"""
+    if session_data['is_active']:
+        deadline_ms = int(session_data['end_time'].timestamp() * 1000)
+        server_now_ms = int(time.time() * 1000)
         
-        if remaining_time.total_seconds() > 0:
-            minutes = int(remaining_time.total_seconds() // 60)
-            seconds = int(remaining_time.total_seconds() % 60)
-            
-            with timer_placeholder.container():
-                st.markdown(f"""
-                <div style="text-align: center; font-size: 2em; color: #ff6b6b; font-weight: bold;">
-                    ⏰ {minutes:02d}:{seconds:02d}
-                </div>
-                """, unsafe_allow_html=True)
-            
-            # Auto-refresh every second
-            time.sleep(1)
-            st.rerun()
-        else:
-            # Time's up
-            with timer_placeholder.container():
-                st.markdown("""
-                <div style="text-align: center; font-size: 2em; color: #ff0000; font-weight: bold;">
-                    ⏰ TIME'S UP!
-                </div>
-                """, unsafe_allow_html=True)
-            
-            # Auto-stop the game
-            st.session_state.game_sessions[st.session_state.current_session_id]['is_active'] = False
+        # The server only sends the deadline, the browser ticks without reruns
+        with timer_placeholder.container():
+            components.html(f"""
+            <div id="timer" style="text-align: center; font-size: 2em; color: #ff6b6b; font-weight: bold; font-family: sans-serif;"></div>
+            <script>
+                const deadline = {deadline_ms};
+                const clockOffset = {server_now_ms} - Date.now();
+                const el = document.getElementById('timer');
+                function tick() {{
+                    const remaining = Math.max(0, Math.ceil((deadline - Date.now() - clockOffset) / 1000));
+                    if (remaining > 0) {{
+                        const minutes = String(Math.floor(remaining / 60)).padStart(2, '0');
+                        const seconds = String(remaining % 60).padStart(2, '0');
+                        el.textContent = '⏰ ' + minutes + ':' + seconds;
+                    }} else {{
+                        el.style.color = '#ff0000';
+                        el.textContent = "⏰ TIME'S UP!";
+                        clearInterval(interval);
+                    }}
+                }}
+                const interval = setInterval(tick, 250);
+                tick();
+            </script>
+            """, height=60)
+    elif datetime.now() >= session_data['end_time']:
+        # Time's up
+        with timer_placeholder.container():
+            st.markdown("""
+            <div style="text-align: center; font-size: 2em; color: #ff0000; font-weight: bold;">
+                ⏰ TIME'S UP!
+            </div>
+            """, unsafe_allow_html=True)
 
 def evaluate_game_session(session_id):
     """Evaluate current game session"""
-    if session_id in st.session_state.game_sessions:
-        session_data = st.session_state.game_sessions[session_id]
+    session_data = GameManager().get_session(session_id)
+    if session_data is not None:
         question = session_data['question']['text']
         prompts = {}
+        names = {}
         
-        # Get player names for prompts
+        # Prompts are keyed by user id, like in the Flask app, so ratings and
+        # the leaderboard tell apart players who share a name
         for player in session_data['selected_players']:
             player_id = player['user_id']
-            player_name = player['fullname']
             prompt = session_data['player_prompts'].get(player_id, '')
             if prompt.strip():  # Only include non-empty prompts
-                prompts[player_name] = prompt
+                prompts[str(player_id)] = prompt
+                names[str(player_id)] = player['fullname']
         
         if prompts:
             # Evaluate prompts
@@ -641,15 +1112,14 @@ def evaluate_game_session(session_id):
             # Save results
             result = {
                 'session_id': session_id,
+                'question_id': session_data['question'].get('id'),
                 'question': question,
                 'prompts': prompts,
                 'evaluation': evaluation,
                 'timestamp': datetime.now().isoformat()
             }
             
-            results = DataManager.load_results()
-            results.append(result)
-            DataManager.save_results(results)
+            DataManager.append_result(result)
             
             # Display evaluation
             st.success("Evaluation completed!")
@@ -658,13 +1128,14 @@ def evaluate_game_session(session_id):
                 if isinstance(evaluation, list):
                     st.subheader("🏆 Leaderboard")
                     eval_df = pd.DataFrame(evaluation)
-                    st.dataframe(eval_df, use_container_width=True)
+                    st.dataframe(with_player_names(eval_df, names), use_container_width=True)
                     
                     # Highlight winner
                     if len(evaluation) > 0:
                         winner = evaluation[0]
                         st.balloons()
-                        st.success(f"🎉 Winner: **{winner['player']}** with score {winner['total_score']}/10!")
+                        st.success(f"🎉 Winner: **{names.get(winner['player'], winner['player'])}** "
+                                   f"with score {winner['total_score']}/10!")
                 else:
                     st.write(evaluation)
         else:
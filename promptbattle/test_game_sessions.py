@@ -0,0 +1,152 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+# flask_app keeps its data files in the working directory, so the tests run
+# in a temporary one; evaluation jobs are run by the tests themselves
+os.environ['EVAL_WORKERS'] = '0'
+_tmp = tempfile.TemporaryDirectory()
+_cwd = os.getcwd()
+os.chdir(_tmp.name)
+
+import flask_app
+from flask_app import GameManager
+
+def tearDownModule():
+    os.chdir(_cwd)
+    _tmp.cleanup()
+
+QUESTION = {'id': 'q1', 'text': 'Write a haiku about databases'}
+
+class SessionBudgetTest(unittest.TestCase):
+    def make_manager(self, max_sessions):
+        return GameManager(max_sessions=max_sessions, max_bytes=1 << 30)
+    
+    def test_created_sessions_are_not_evicted(self):
+        manager = self.make_manager(2)
+        self.assertTrue(manager.create_session('a', QUESTION, 60, []))
+        self.assertTrue(manager.create_session('b', QUESTION, 60, []))
+        
+        self.assertFalse(manager.create_session('c', QUESTION, 60, []))
+        self.assertIsNotNone(manager.state.get_session('a'))
+        self.assertIsNotNone(manager.state.get_session('b'))
+        self.assertIsNone(manager.state.get_session('c'))
+        self.assertEqual(manager.evicted_count, 0)
+    
+    def test_finished_session_makes_room(self):
+        manager = self.make_manager(2)
+        manager.create_session('a', QUESTION, 60, [])
+        manager.start_session('a')
+        manager.stop_session('a')
+        manager.archive_session('a', persisted=True)
+        manager.create_session('b', QUESTION, 60, [])
+        
+        self.assertTrue(manager.create_session('c', QUESTION, 60, []))
+        self.assertIsNone(manager.state.get_session('a'))
+        self.assertIsNotNone(manager.state.get_session('b'))
+        self.assertIsNotNone(manager.state.get_session('c'))
+    
+    def test_active_sessions_are_not_evicted(self):
+        manager = self.make_manager(1)
+        manager.create_session('a', QUESTION, 60, [])
+        manager.start_session('a')
+        
+        self.assertFalse(manager.create_session('b', QUESTION, 60, []))
+        self.assertEqual(manager.state.get_session('a')['status'], 'active')
+    
+    def test_idle_sessions_never_started_are_not_saved(self):
+        archived = []
+        manager = GameManager(max_sessions=10, max_bytes=1 << 30, idle_ttl=0,
+                              on_archive=lambda session_id, data: archived.append(session_id))
+        manager.create_session('a', QUESTION, 60, [])
+        manager.create_session('b', QUESTION, 60, [])
+        manager.start_session('b')
+        manager.stop_session('b')
+        
+        manager.sweep(now=time.time() + 1)
+        self.assertEqual(archived, ['b'])
+        self.assertEqual(manager.state.get_session('a')['status'], 'archived')
+
+class StartGameTest(unittest.TestCase):
+    def setUp(self):
+        flask_app.storage.add_question(dict(QUESTION))
+        self.client = flask_app.app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_type'] = 'admin'
+        self.max_sessions = flask_app.game_manager.max_sessions
+    
+    def tearDown(self):
+        flask_app.game_manager.max_sessions = self.max_sessions
+    
+    def test_start_game_rejected_when_full(self):
+        # Sessions that are not finished are never evicted to make room
+        flask_app.game_manager.max_sessions = sum(
+            1 for summary in flask_app.game_manager.state.list_sessions()
+            if summary['status'] in ('created', 'active')
+        )
+        response = self.client.post('/start-game', json={'question_id': 'q1', 'timer_duration': 60})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.get_json()['success'])
+    
+    def test_start_game(self):
+        response = self.client.post('/start-game', json={'question_id': 'q1', 'timer_duration': 60})
+        session_id = response.get_json()['session_id']
+        self.assertEqual(flask_app.game_manager.state.get_session(session_id)['status'], 'active')
+
+class EvaluationJobTest(unittest.TestCase):
+    def make_job(self, attempts):
+        payload = {'session_id': 's1', 'question_id': 'q1', 'question': QUESTION['text'],
+                   'prompts': {'1': 'A haiku about indexes', '2': 'Rows and columns'}}
+        job_id = flask_app.job_queue.submit('evaluate', payload)
+        return {'id': job_id, 'payload': payload, 'attempts': attempts, 'created_at': time.time()}
+    
+    def test_result_saved_once(self):
+        storage = flask_app.storage
+        job = self.make_job(1)
+        first = flask_app.run_evaluation_job(job, lambda progress: None)
+        count = storage.count_results()
+        self.assertEqual(storage.get_result(count - 1)['job_id'], job['id'])
+        
+        # The worker died after saving; the retry finds the saved result
+        job['attempts'] = 2
+        retried = flask_app.run_evaluation_job(job, lambda progress: None)
+        self.assertEqual(storage.count_results(), count)
+        self.assertEqual(retried['evaluation'], first['evaluation'])
+    
+    def test_evaluating_running_game_stops_it(self):
+        game_manager = flask_app.game_manager
+        game_manager.create_session('s1', QUESTION, 60, [])
+        game_manager.start_session('s1')
+        
+        with mock.patch.object(flask_app.socketio, 'emit') as emit:
+            flask_app.run_evaluation_job(self.make_job(1), lambda progress: None)
+        fields = game_manager.state.get_session_fields('s1')
+        self.assertEqual((fields['status'], fields['is_active']), ('archived', False))
+        stopped = [call for call in emit.call_args_list if call.args[0] == 'game_stopped']
+        self.assertEqual(len(stopped), 1)
+        self.assertEqual(stopped[0].args[1], {'session_id': 's1', 'reason': 'evaluated'})
+    
+    def test_retry_without_saved_result(self):
+        storage = flask_app.storage
+        count = storage.count_results()
+        job = self.make_job(2)
+        flask_app.run_evaluation_job(job, lambda progress: None)
+        self.assertEqual(storage.count_results(), count + 1)
+
+class JobWorkersTest(unittest.TestCase):
+    def test_import_starts_no_workers(self):
+        # The reloader's watcher process imports the app too, and must not claim jobs
+        env = dict(os.environ, EVAL_WORKERS='2', PYTHONPATH=os.path.dirname(os.path.abspath(flask_app.__file__)))
+        with tempfile.TemporaryDirectory() as tmp:
+            output = subprocess.run(
+                [sys.executable, '-c', 'import flask_app; print(flask_app.job_workers._started_pid)'],
+                cwd=tmp, env=env, capture_output=True, text=True, check=True
+            ).stdout
+        self.assertEqual(output.split()[-1], 'None')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+
+from history import ResultHistory
+from storage import create_backend
+
+def make_result(i):
+    # Every fifth game has no scores, so its top score is NULL
+    evaluation = 'Not scored' if i % 5 == 0 else [{'player': str(i % 3), 'total_score': float(i % 7)}]
+    return {
+        'session_id': f"s{i}",
+        'question_id': f"q{i % 2}",
+        'question': f"Question {i % 2}",
+        'prompts': {str(i % 3): 'prompt', str(i % 3 + 1): 'prompt'},
+        'evaluation': evaluation,
+        # Pairs of games share a timestamp, so ties are broken by position
+        'timestamp': f"2024-05-{1 + i // 8:02d}T10:00:{i // 2 % 60:02d}"
+    }
+
+class ResultHistoryQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = create_backend(
+            'json',
+            admin_data_file=os.path.join(self.tmp.name, 'admin_data.json'),
+            results_log_file=os.path.join(self.tmp.name, 'results.jsonl'),
+            results_index_file=os.path.join(self.tmp.name, 'results.idx')
+        )
+        self.storage.save_results([make_result(i) for i in range(60)])
+        self.history = ResultHistory(os.path.join(self.tmp.name, 'history.db'))
+    
+    def tearDown(self):
+        self.history.close()
+        self.storage.close()
+        self.tmp.cleanup()
+    
+    def walk(self, page_size, **filters):
+        """Positions of every page in turn, following next_cursor"""
+        positions, cursor = [], None
+        while True:
+            page = self.history.query(self.storage, cursor=cursor, page_size=page_size, **filters)
+            self.assertLessEqual(len(page['results']), page_size)
+            positions.extend(result['position'] for result in page['results'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return positions
+    
+    def test_pages_cover_every_match_once(self):
+        for sort in ResultHistory.SORTS:
+            for filters in ({}, {'player': '1'}, {'question_id': 'q0'}, {'since': '2024-05-03'}):
+                with self.subTest(sort=sort, **filters):
+                    everything = self.walk(1000, sort=sort, **filters)
+                    self.assertEqual(self.walk(7, sort=sort, **filters), everything)
+                    self.assertEqual(len(set(everything)), len(everything))
+    
+    def test_sort_order(self):
+        newest = self.walk(1000, sort='newest')
+        self.assertEqual(newest, list(range(59, -1, -1)))
+        self.assertEqual(self.walk(1000, sort='oldest'), list(range(60)))
+        
+        top = self.walk(9, sort='top_score')
+        scores = [max((entry['total_score'] for entry in evaluation), default=None)
+                  if isinstance(evaluation, list) else None
+                  for evaluation in (self.storage.get_result(position)['evaluation'] for position in top)]
+        scored = [score for score in scores if score is not None]
+        self.assertEqual(scored, sorted(scored, reverse=True))
+        # Unscored games come last
+        self.assertEqual(scores[len(scored):], [None] * (len(scores) - len(scored)))
+    
+    def test_total_is_capped(self):
+        page = self.history.query(self.storage, page_size=5, total_limit=100)
+        self.assertEqual((page['total'], page['total_exact']), (60, True))
+        page = self.history.query(self.storage, page_size=5, total_limit=10)
+        self.assertEqual((page['total'], page['total_exact']), (10, False))
+        page = self.history.query(self.storage, page_size=5, total_limit=None)
+        self.assertIsNone(page['total'])
+    
+    def test_concurrent_append_keeps_the_index(self):
+        self.history.refresh(self.storage)
+        stale_count = self.storage.count_results()
+        
+        # Another worker appends and refreshes while this one waits for the
+        # lock, having read the count before
+        self.storage.append_result(make_result(60))
+        other = ResultHistory(self.history.db_file)
+        other.refresh(self.storage)
+        other.close()
+        starts = []
+        iter_results = self.storage.iter_results
+        self.storage.iter_results = lambda start=0: starts.append(start) or iter_results(start)
+        self.storage.count_results = lambda: stale_count
+        
+        self.assertEqual(self.history.refresh(self.storage), 61)
+        self.assertNotIn(0, starts)
+    
+    def test_replaced_results_are_indexed_again(self):
+        self.history.refresh(self.storage)
+        self.storage.save_results([dict(make_result(i), question_id='q9') for i in range(60)])
+        page = self.history.query(self.storage, question_id='q9', page_size=5)
+        self.assertEqual(page['total'], 60)
+    
+    def test_player_under_several_keys(self):
+        by_id = self.walk(1000, player='1')
+        
+        # A game that has the player under both keys is listed once
+        self.storage.append_result(dict(make_result(60), prompts={'Bob': 'prompt', '1': 'prompt'}))
+        both = self.walk(3, player=['1', 'Bob'])
+        self.assertEqual(both, [60] + by_id)
+        self.assertEqual(self.history.query(self.storage, player=('1', 'Bob'))['total'], len(by_id) + 1)
+    
+    def test_invalid_cursor(self):
+        cursor = self.history.query(self.storage, page_size=5)['next_cursor']
+        with self.assertRaises(ValueError):
+            self.history.query(self.storage, sort='top_score', cursor=cursor)
+        with self.assertRaises(ValueError):
+            self.history.query(self.storage, cursor='not a cursor')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from job_queue import JobQueue, JobWorkerPool
+
+class JobWorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = JobQueue(os.path.join(self.tmp.name, 'jobs.db'))
+    
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+    
+    def test_worker_survives_errors(self):
+        done = threading.Event()
+        claim = self.queue.claim
+        failures = []
+        
+        def flaky_claim(owner):
+            # The first claim finds the database locked
+            if not failures:
+                failures.append(owner)
+                raise RuntimeError('database is locked')
+            return claim(owner)
+        
+        def on_done(job):
+            done.set()
+            raise RuntimeError('client gone')
+        
+        self.queue.claim = flaky_claim
+        pool = JobWorkerPool(self.queue, {'echo': lambda job, report: job['payload']}, workers=1,
+                             poll_interval=0.01, on_done=on_done)
+        pool.start()
+        
+        first = self.queue.submit('echo', {'n': 1})
+        self.assertTrue(done.wait(5))
+        done.clear()
+        # on_done raised for the first job, the same worker still runs the next
+        second = self.queue.submit('echo', {'n': 2})
+        self.assertTrue(done.wait(5))
+        self.assertEqual(self.queue.get(first)['result'], {'n': 1})
+        self.assertEqual(self.queue.get(second)['result'], {'n': 2})
+
+if __name__ == '__main__':
+    unittest.main()
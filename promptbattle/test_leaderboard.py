@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from leaderboard import Leaderboard
+from storage import create_backend
+
+def make_result(i, score=None):
+    return {
+        'session_id': f"s{i}",
+        'question': f"Question {i % 2}",
+        'prompts': {'1': 'prompt', '2': 'prompt'},
+        'evaluation': [{'player': str(i % 3), 'total_score': score if score is not None else float(i)},
+                       {'player': str(i % 3 + 1), 'total_score': 0.0}],
+        'timestamp': f"2024-05-01T10:00:{i:02d}"
+    }
+
+class LeaderboardRefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.leaderboard = Leaderboard(os.path.join(self.tmp.name, 'leaderboard.db'))
+    
+    def tearDown(self):
+        self.leaderboard.close()
+        self.tmp.cleanup()
+    
+    def backends(self):
+        for kind in ('json', 'sqlite'):
+            with self.subTest(kind=kind), tempfile.TemporaryDirectory() as tmp:
+                backend = create_backend(
+                    kind,
+                    admin_data_file=os.path.join(tmp, 'admin_data.json'),
+                    results_log_file=os.path.join(tmp, 'results.jsonl'),
+                    results_index_file=os.path.join(tmp, 'results.idx'),
+                    db_file=os.path.join(tmp, 'promptbattle.db')
+                )
+                try:
+                    yield backend
+                finally:
+                    backend.close()
+    
+    def test_concurrent_append_is_not_a_replaced_log(self):
+        for storage in self.backends():
+            storage.save_results([make_result(i) for i in range(5)])
+            self.leaderboard.rebuild(storage)
+            stale_count = storage.count_results()
+            
+            # Another worker appends and refreshes while this one waits for
+            # the lock, having read the count before
+            storage.append_result(make_result(5))
+            other = Leaderboard(self.leaderboard.db_file)
+            other.refresh(storage)
+            other.close()
+            starts = []
+            iter_results = storage.iter_results
+            storage.iter_results = lambda start=0: starts.append(start) or iter_results(start)
+            storage.count_results = lambda: stale_count
+            
+            self.assertEqual(self.leaderboard.refresh(storage), 6)
+            self.assertNotIn(0, starts)
+            self.assertEqual(sum(row['games'] for row in self.leaderboard.players(storage)), 12)
+    
+    def test_replaced_results_are_counted_again(self):
+        for storage in self.backends():
+            storage.save_results([make_result(i) for i in range(5)])
+            self.leaderboard.rebuild(storage)
+            
+            # Same number of results, different scores
+            storage.save_results([make_result(i, score=100.0) for i in range(5)])
+            best = max(row['best_score'] for row in self.leaderboard.players(storage))
+            self.assertEqual(best, 100.0)
+
+if __name__ == '__main__':
+    unittest.main()
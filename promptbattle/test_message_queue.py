@@ -0,0 +1,92 @@
+import json
+import logging
+import queue
+import threading
+import unittest
+
+import socketio
+from flask import Flask
+from flask_socketio import SocketIO, join_room
+from werkzeug.serving import make_server
+
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+class InProcessBroker:
+    """Stand-in for the shared message queue, e.g. Redis, between workers"""
+    
+    def __init__(self):
+        self.subscribers = []
+    
+    def subscribe(self):
+        subscriber = queue.Queue()
+        self.subscribers.append(subscriber)
+        return subscriber
+    
+    def publish(self, message):
+        for subscriber in self.subscribers:
+            subscriber.put(message)
+
+class InProcessManager(socketio.PubSubManager):
+    """Socket.IO client manager that talks to the other workers through an InProcessBroker"""
+    
+    name = 'inprocess'
+    
+    def __init__(self, broker):
+        super().__init__()
+        self.broker = broker
+        self.messages = broker.subscribe()
+    
+    def _publish(self, data):
+        # Messages cross the broker serialized, as they would between processes
+        self.broker.publish(json.dumps(data))
+    
+    def _listen(self):
+        while True:
+            yield self.messages.get()
+
+def start_worker(broker):
+    """Serve one app worker, set up like flask_app with a message queue, and return it and its server"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'test'
+    worker = SocketIO(app, async_mode='threading', client_manager=InProcessManager(broker))
+    
+    @worker.on('join_game')
+    def handle_join_game(data):
+        join_room(f"game:{data['session_id']}")
+        return True
+    
+    # Flask-SocketIO's test client refuses message queues, so the worker
+    # serves a real client on a local port
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return worker, server
+
+class MessageQueueTest(unittest.TestCase):
+    def setUp(self):
+        broker = InProcessBroker()
+        self.worker_a, self.server_a = start_worker(broker)
+        self.worker_b, self.server_b = start_worker(broker)
+    
+    def tearDown(self):
+        self.server_a.shutdown()
+        self.server_b.shutdown()
+    
+    def test_room_emit_reaches_client_on_other_worker(self):
+        received = queue.Queue()
+        client = socketio.Client()
+        client.on('game_stopped', received.put)
+        client.connect(f"http://127.0.0.1:{self.server_a.server_port}", transports=['polling'])
+        try:
+            self.assertTrue(client.call('join_game', {'session_id': 's1'}, timeout=5))
+            
+            self.worker_b.emit('game_stopped', {'session_id': 's2'}, to='game:s2')
+            self.worker_b.emit('game_stopped', {'session_id': 's1'}, to='game:s1')
+            
+            # Only the emit to the client's room arrives, through worker A
+            self.assertEqual(received.get(timeout=5), {'session_id': 's1'})
+            self.assertTrue(received.empty())
+        finally:
+            client.disconnect()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from results_store import ResultsStore
+
+class FsyncTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = ResultsStore(os.path.join(self.tmp.name, 'results.jsonl'),
+                                  os.path.join(self.tmp.name, 'results.idx'),
+                                  fsync_batch=100, fsync_interval=0.2)
+    
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+    
+    def test_tail_of_burst_is_synced(self):
+        with mock.patch('results_store.os.fsync') as fsync:
+            for i in range(3):
+                self.store.append({'n': i})
+            self.assertEqual(fsync.call_count, 0)
+            
+            # No further append arrives, the tail is synced within fsync_interval
+            deadline = time.monotonic() + 5
+            while fsync.call_count < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(fsync.call_count, 2)
+            self.assertEqual(self.store._unsynced, 0)
+    
+    def test_close_syncs(self):
+        self.store.fsync_interval = 60
+        with mock.patch('results_store.os.fsync') as fsync:
+            self.store.append({'n': 0})
+            self.store.close()
+            self.assertEqual(fsync.call_count, 2)
+
+if __name__ == '__main__':
+    unittest.main()
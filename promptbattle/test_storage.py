@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from storage import create_backend
+
+def make_user(user_id, name):
+    return {
+        'user_id': user_id,
+        'fullname': name,
+        'emailid': f"{name.lower()}@example.com",
+        'phonenumber': f"555{user_id}",
+        'is_technical': False,
+        'password': f"555{user_id}"
+    }
+
+class UpsertUsersTest(unittest.TestCase):
+    """Both backends store every chunk of an upsert or none of them"""
+    
+    def backends(self):
+        for kind in ('json', 'sqlite'):
+            with self.subTest(kind=kind), tempfile.TemporaryDirectory() as tmp:
+                backend = create_backend(
+                    kind,
+                    admin_data_file=os.path.join(tmp, 'admin_data.json'),
+                    results_log_file=os.path.join(tmp, 'results.jsonl'),
+                    results_index_file=os.path.join(tmp, 'results.idx'),
+                    db_file=os.path.join(tmp, 'promptbattle.db')
+                )
+                try:
+                    yield backend
+                finally:
+                    backend.close()
+    
+    def test_upsert(self):
+        for backend in self.backends():
+            backend.replace_users([make_user('1', 'Ann')])
+            counts = backend.upsert_users([[make_user('1', 'Ann'), make_user('2', 'Bob')],
+                                           [make_user('1', 'Anna')]])
+            self.assertEqual(counts, {'inserted': 1, 'updated': 1, 'unchanged': 1})
+            self.assertEqual(sorted(user['fullname'] for user in backend.get_users()), ['Anna', 'Bob'])
+            self.assertEqual(backend.get_user_by_email('bob@example.com')['user_id'], '2')
+            self.assertIsNone(backend.get_user_by_email('ann@example.com'))
+    
+    def test_repeated_user_in_chunk_counts_once(self):
+        for backend in self.backends():
+            backend.replace_users([make_user('1', 'Ann')])
+            counts = backend.upsert_users([[make_user('2', 'Bob'), make_user('1', 'Anna'), make_user('2', 'Bobby')],
+                                           [make_user('1', 'Ann'), make_user('1', 'Anne')]])
+            self.assertEqual(counts, {'inserted': 1, 'updated': 2, 'unchanged': 0})
+            self.assertEqual(sorted(user['fullname'] for user in backend.get_users()), ['Anne', 'Bobby'])
+    
+    def test_failed_chunk_changes_nothing(self):
+        def chunks():
+            yield [make_user('1', 'Anna'), make_user('2', 'Bob')]
+            raise ValueError('bad row')
+        
+        for backend in self.backends():
+            backend.replace_users([make_user('1', 'Ann')])
+            version = backend.version()
+            with self.assertRaises(ValueError):
+                backend.upsert_users(chunks())
+            
+            self.assertEqual(backend.get_users(), [make_user('1', 'Ann')])
+            self.assertEqual(backend.get_user_by_email('ann@example.com')['fullname'], 'Ann')
+            self.assertIsNone(backend.get_user_by_email('bob@example.com'))
+            self.assertEqual(backend.version(), version)
+
+if __name__ == '__main__':
+    unittest.main()